@@ -1,62 +1,52 @@
 import json
 import boto3
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
 from botocore.exceptions import ClientError
 
+import admission
+import run_table
+import timing
+
 bedrock_client = boto3.client('bedrock', region_name='us-east-1')
 dynamodb = boto3.client('dynamodb', region_name='us-east-1')
 s3_client = boto3.client('s3')
+stepfunctions = boto3.client('stepfunctions', region_name='us-east-1')
 
 MODEL_RESULT_TABLE = os.environ['MODEL_RESULT_TABLE']
-RUN_STATUS_TABLE = os.environ['RUN_STATUS_TABLE']
+JOB_CALLBACK_TABLE = os.environ.get('JOB_CALLBACK_TABLE')
+EVALUATION_SHARD_CONCURRENCY = int(os.environ.get('EVALUATION_SHARD_CONCURRENCY', '4'))
+# BatchWriteItem accepts at most 25 puts per call
+RECORD_BATCH_SIZE = 25
+MAX_BATCH_ATTEMPTS = 5
+TERMINAL_JOB_STATUSES = ('Completed', 'Failed', 'Stopped')
+FAILED_RUN_STATUSES = ('Failed', 'Stopped')
 
 def lambda_handler(event, context):
+    if event.get('source') == 'aws.bedrock':
+        return handle_job_state_change(event)
+
     run_id = event['RunID']
     model_key = event['Model']  
     
     try:
-        job_arn, full_model_name = get_job_arn_and_model_from_dynamodb(run_id, model_key)
+        job_arn, full_model_name, record_keys = get_job_arn_and_model_from_dynamodb(run_id, model_key)
         
         if not job_arn:
+            part_jobs, pending_parts = get_unrecorded_part_jobs(run_id, model_key)
+            if part_jobs:
+                return check_part_jobs(run_id, model_key, part_jobs)
+            if pending_parts:
+                # Every submitted part is recorded; the rest are still queued for an admission slot
+                return in_progress(f'{pending_parts} evaluation parts are waiting for admission', pendingParts=pending_parts)
             return {
                 'statusCode': 400,
                 'body': json.dumps({'error': 'Job ARN not found in DynamoDB'})
             }
         
-        job_status, s3_uri = get_evaluation_job_status(job_arn)
-        
-        if job_status == 'Completed':
-            results = process_evaluation_results(job_arn, s3_uri)
-            
-            update_dynamodb_with_results(run_id, model_key, full_model_name, results)
-            
-            update_run_status(run_id)
-            
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'status': 'Completed',
-                    'results': results
-                })
-            }
-        elif job_status in ['Failed', 'Stopped']:
-            update_run_status(run_id, job_status)
-            
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'status': job_status,
-                    'error': 'Evaluation job failed or was stopped'
-                })
-            }
-        else:
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'status': 'In Progress',
-                    'message': f'Evaluation job is still {job_status}'
-                })
-            }
+        return check_evaluation_job(run_id, model_key, job_arn, full_model_name, record_keys)
     
     except Exception as e:
         print(f"ERROR: {str(e)}")
@@ -66,56 +56,342 @@ def lambda_handler(event, context):
         }
 
 
+def check_evaluation_job(run_id, model_key, job_arn, full_model_name, record_keys=None):
+    job_status, s3_uri = get_evaluation_job_status(job_arn)
+    if job_status in TERMINAL_JOB_STATUSES:
+        # Frees the admission slot the job held; repeat calls for the same job are no-ops
+        admission.release(job_arn)
+    
+    if job_status == 'Completed':
+        results = process_evaluation_results(run_id, model_key, job_arn, s3_uri, record_keys)
+        return record_results(run_id, model_key, full_model_name, results)
+    elif job_status in ['Failed', 'Stopped']:
+        return record_failure(run_id, job_status)
+    else:
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'status': 'In Progress',
+                'message': f'Evaluation job is still {job_status}'
+            })
+        }
+
+
+def record_results(run_id, model_key, full_model_name, results):
+    # The same write sets the run Running or, for the last model, Completed; None means an earlier event or poll recorded this model
+    update_dynamodb_with_results(run_id, model_key, full_model_name, results)
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'status': 'Completed',
+            'results': results
+        })
+    }
+
+
+def record_failure(run_id, job_status, error='Evaluation job failed or was stopped'):
+    update_run_status(run_id, job_status)
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'status': job_status,
+            'error': error
+        })
+    }
+
+
+def handle_job_state_change(event):
+    detail = event.get('detail', {})
+    job_arn = detail.get('jobArn') or next(iter(event.get('resources', [])), None)
+    
+    callback = get_job_callback(job_arn) if job_arn else None
+    if not callback:
+        print(f"No pending callback for evaluation job: {job_arn}")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'status': 'Ignored'})
+        }
+    
+    if 'Manifest' in callback:
+        return handle_coalesced_job(job_arn, callback['Manifest']['M'])
+    if 'Part' in callback:
+        return handle_part_job(job_arn, callback)
+    
+    run_id = callback['RunID']['S']
+    model_key = callback['Model']['S']
+    _, full_model_name, record_keys = get_job_arn_and_model_from_dynamodb(run_id, model_key)
+    
+    result = check_evaluation_job(run_id, model_key, job_arn, full_model_name, record_keys)
+    if json.loads(result['body'])['status'] == 'In Progress':
+        return result
+    
+    resume_branch(callback['TaskToken']['S'], run_id, model_key, result)
+    delete_job_callback(job_arn)
+    return result
+
+
+def handle_coalesced_job(job_arn, manifest_location):
+    # One job scored records from several runs; the manifest maps each record back to its runs
+    manifest = load_manifest(manifest_location['Bucket']['S'], manifest_location['Key']['S'])
+    job_status, s3_uri = get_evaluation_job_status(job_arn)
+    if job_status in TERMINAL_JOB_STATUSES:
+        admission.release(job_arn)
+    
+    if job_status == 'Completed':
+        routes = manifest['Records']
+        aggregates = process_job_output(
+            job_arn, s3_uri,
+            lambda data: [(route['RunID'], route['Model']) for route in routes.get(run_table.record_key(data.get('inputRecord', {})), [])]
+        )
+    elif job_status not in ['Failed', 'Stopped']:
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'status': 'In Progress',
+                'message': f'Evaluation job is still {job_status}'
+            })
+        }
+    
+    statuses = {}
+    for member in manifest['Members']:
+        run_id, model_key = member['RunID'], member['Model']
+        if job_status != 'Completed':
+            result = record_failure(run_id, job_status)
+        elif (run_id, model_key) in aggregates:
+            _, full_model_name, _ = get_job_arn_and_model_from_dynamodb(run_id, model_key)
+            result = record_results(run_id, model_key, full_model_name, to_results(aggregates[(run_id, model_key)]))
+        else:
+            result = record_failure(run_id, 'Failed', 'Evaluation job returned no records for this run')
+        resume_branch(member['TaskToken'], run_id, model_key, result)
+        statuses[f"{run_id}/{model_key}"] = json.loads(result['body'])['status']
+    
+    delete_job_callback(job_arn)
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'status': job_status, 'members': statuses})
+    }
+
+
+def handle_part_job(job_arn, callback):
+    # One part of a split bulk dataset; the branch resumes once the last part is scored or any part fails
+    run_id = callback['RunID']['S']
+    model_key = callback['Model']['S']
+    finished, result = record_part_job(run_id, model_key, callback['Part']['N'], job_arn)
+    if not finished:
+        return result
+    
+    if json.loads(result['body'])['status'] != 'In Progress':
+        resume_branch(callback['TaskToken']['S'], run_id, model_key, result)
+    delete_job_callback(job_arn)
+    return result
+
+
+def check_part_jobs(run_id, model_key, part_jobs):
+    # Polling fallback: record whichever parts have finished since the last check
+    result = None
+    for part, job_arn in sorted(part_jobs.items()):
+        _, result = record_part_job(run_id, model_key, part, job_arn)
+        if json.loads(result['body'])['status'] != 'In Progress':
+            break
+    return result
+
+
+def record_part_job(run_id, model_key, part, job_arn):
+    job_status, s3_uri = get_evaluation_job_status(job_arn)
+    if job_status in TERMINAL_JOB_STATUSES:
+        admission.release(job_arn)
+    
+    if job_status in ['Failed', 'Stopped']:
+        return True, record_failure(run_id, job_status)
+    if job_status != 'Completed':
+        return False, in_progress(f'Evaluation job is still {job_status}')
+    
+    member = (run_id, model_key)
+    aggregates = process_job_output(job_arn, s3_uri, lambda data: [member], part)
+    if member not in aggregates:
+        raise Exception("No valid data found in the JSONL content")
+    
+    model_data = update_part_results(run_id, model_key, part, aggregates[member])
+    if model_data is None:
+        return True, in_progress(f'Evaluation part {part} was already recorded')
+    recorded = model_data['PartResults']['M']
+    if len(recorded) < int(model_data['Parts']['N']):
+        return True, in_progress(f"{len(recorded)} of {model_data['Parts']['N']} evaluation parts completed")
+    
+    # Every part is in: the same per-metric sums merge exactly as the output shards of one job do
+    aggregate = reduce(merge_aggregates, (json.loads(value['S']) for value in recorded.values()), new_aggregate())
+    return True, record_results(run_id, model_key, model_data['ModelName']['S'], to_results(aggregate))
+
+
+def in_progress(message, **details):
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'status': 'In Progress',
+            'message': message,
+            **details
+        })
+    }
+
+
+def resume_branch(task_token, run_id, model_key, result):
+    try:
+        stepfunctions.send_task_success(
+            taskToken=task_token,
+            output=json.dumps(result)
+        )
+    except (stepfunctions.exceptions.TaskTimedOut, stepfunctions.exceptions.InvalidToken):
+        print(f"Task token for {run_id}/{model_key} is no longer active, the workflow has fallen back to polling")
+
+
+def load_manifest(bucket_name, key):
+    try:
+        with timing.span('read_manifest'):
+            response = s3_client.get_object(Bucket=bucket_name, Key=key)
+            return json.loads(response['Body'].read())
+    except ClientError as e:
+        print(f"Error reading coalesced job manifest {key}: {e.response['Error']['Message']}")
+        raise
+
+
+def get_job_callback(job_arn):
+    try:
+        response = dynamodb.get_item(
+            TableName=JOB_CALLBACK_TABLE,
+            Key={'JobArn': {'S': job_arn}}
+        )
+        return response.get('Item')
+    except ClientError as e:
+        print(f"Error retrieving job callback from DynamoDB: {e.response['Error']['Message']}")
+        raise
+
+def delete_job_callback(job_arn):
+    try:
+        dynamodb.delete_item(
+            TableName=JOB_CALLBACK_TABLE,
+            Key={'JobArn': {'S': job_arn}}
+        )
+    except ClientError as e:
+        print(f"Error deleting job callback from DynamoDB: {e.response['Error']['Message']}")
+        raise
+
 def get_job_arn_and_model_from_dynamodb(run_id, model_key):
     try:
         response = dynamodb.get_item(
             TableName=MODEL_RESULT_TABLE,
-            Key={'RunID': {'S': run_id}}
+            Key={'RunID': {'S': run_id}, 'SK': {'S': run_table.model_sk(model_key)}}
         )
-        item = response.get('Item', {})
+        model_data = response.get('Item', {})
         
-        model_data = item.get(model_key, {}).get('M', {})
         job_arn = model_data.get('ARN', {}).get('S')
         full_model_name = model_data.get('ModelName', {}).get('S')
+        # Runs evaluated in a coalesced job only own the output records listed here
+        record_keys = [value['S'] for value in model_data.get('RecordKeys', {}).get('L', [])] or None
         
-        return job_arn, full_model_name
+        return job_arn, full_model_name, record_keys
     except ClientError as e:
         print(f"Error retrieving job ARN from DynamoDB: {e.response['Error']['Message']}")
         raise
 
+def get_unrecorded_part_jobs(run_id, model_key):
+    try:
+        response = dynamodb.get_item(
+            TableName=MODEL_RESULT_TABLE,
+            Key={'RunID': {'S': run_id}, 'SK': {'S': run_table.model_sk(model_key)}},
+            ProjectionExpression='Parts, PartJobs, PartResults'
+        )
+    except ClientError as e:
+        print(f"Error retrieving evaluation parts from DynamoDB: {e.response['Error']['Message']}")
+        raise
+    model_data = response.get('Item', {})
+    submitted = model_data.get('PartJobs', {}).get('M', {})
+    recorded = model_data.get('PartResults', {}).get('M', {})
+    # Parts not yet in PartJobs were deferred and have no job until the admission drain submits them
+    pending_parts = int(model_data.get('Parts', {}).get('N', '0')) - len(submitted)
+    return {part: value['S'] for part, value in submitted.items() if part not in recorded}, max(pending_parts, 0)
+
+def update_part_results(run_id, model_key, part, aggregate):
+    # Conditional, so a repeated event or poll for the same part is never counted twice
+    try:
+        with timing.span('update_part_results'):
+            response = dynamodb.update_item(
+                TableName=MODEL_RESULT_TABLE,
+                Key={'RunID': {'S': run_id}, 'SK': {'S': run_table.model_sk(model_key)}},
+                UpdateExpression="SET PartResults.#part = :aggregate",
+                ConditionExpression="attribute_not_exists(PartResults.#part)",
+                ExpressionAttributeNames={'#part': str(part)},
+                ExpressionAttributeValues={':aggregate': {'S': json.dumps(aggregate)}},
+                ReturnValues='ALL_NEW'
+            )
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        return None
+    except ClientError as e:
+        print(f"Error recording evaluation part: {e.response['Error']['Message']}")
+        raise
+    return response['Attributes']
+
 def get_evaluation_job_status(job_arn):
     try:
-        response = bedrock_client.get_evaluation_job(jobIdentifier=job_arn)
+        with timing.span('get_evaluation_job'):
+            response = bedrock_client.get_evaluation_job(jobIdentifier=job_arn)
         return response['status'], response['outputDataConfig']['s3Uri']
     except ClientError as e:
         print(f"Error getting evaluation job status: {e.response['Error']['Message']}")
         raise
 
-def process_evaluation_results(job_arn, base_s3_uri):
+def process_evaluation_results(run_id, model_key, job_arn, base_s3_uri, record_keys=None):
+    member = (run_id, model_key)
+    owned = set(record_keys) if record_keys else None
+    aggregates = process_job_output(
+        job_arn, base_s3_uri,
+        lambda data: [member] if owned is None or run_table.record_key(data.get('inputRecord', {})) in owned else []
+    )
+    
+    if member not in aggregates:
+        raise Exception("No valid data found in the JSONL content")
+    return to_results(aggregates[member])
+
+def process_job_output(job_arn, base_s3_uri, route, part=None):
     try:
-        response = bedrock_client.get_evaluation_job(jobIdentifier=job_arn)
+        with timing.span('get_evaluation_job'):
+            response = bedrock_client.get_evaluation_job(jobIdentifier=job_arn)
         job_name = response['jobName']
-        model_identifier = response['inferenceConfig']['models'][0]['bedrockModel']['modelIdentifier']
+        model_config = response['inferenceConfig']['models'][0]
+        if 'precomputedInferenceSource' in model_config:
+            model_identifier = model_config['precomputedInferenceSource']['inferenceSourceIdentifier']
+        else:
+            model_identifier = model_config['bedrockModel']['modelIdentifier']
         
         s3_uri = f"{base_s3_uri}{job_name}/{job_arn.split('/')[-1]}/models/{model_identifier}/taskTypes/Summarization/datasets/CustomDataset/"
         
         bucket_name, key_prefix = parse_s3_uri(s3_uri)
         
-        objects = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=key_prefix)
-        
-        for obj in objects.get('Contents', []):
-            if obj['Key'].endswith('.jsonl'):
-                response = s3_client.get_object(Bucket=bucket_name, Key=obj['Key'])
-                content = response['Body'].read().decode('utf-8')
-                
-                results = process_jsonl_content(content)
-                return results
-        
-        raise Exception("No JSONL file found in the S3 bucket")
+        keys = []
+        with timing.span('list_output_shards', model_identifier):
+            for page in s3_client.get_paginator('list_objects_v2').paginate(Bucket=bucket_name, Prefix=key_prefix):
+                keys.extend(obj['Key'] for obj in page.get('Contents', []) if obj['Key'].endswith('.jsonl'))
     
     except ClientError as e:
         print(f"Error processing evaluation results: {e.response['Error']['Message']}")
         raise
+    
+    if not keys:
+        raise Exception("No JSONL file found in the S3 bucket")
+    
+    # Output shards stream in parallel; each holds one line and one write batch in memory at a time
+    with ThreadPoolExecutor(max_workers=min(len(keys), EVALUATION_SHARD_CONCURRENCY)) as executor:
+        shards = list(executor.map(
+            lambda shard: process_output_shard(bucket_name, *shard, route, part),
+            enumerate(sorted(keys))
+        ))
+    
+    members = {member for shard in shards for member in shard}
+    return {
+        member: reduce(merge_aggregates, [shard[member] for shard in shards if member in shard], new_aggregate())
+        for member in members
+    }
 
 def parse_s3_uri(s3_uri):
     parts = s3_uri.replace("s3://", "").split("/")
@@ -123,70 +399,247 @@ def parse_s3_uri(s3_uri):
     key_prefix = "/".join(parts[1:])
     return bucket_name, key_prefix
 
-def process_jsonl_content(content):
-    lines = content.strip().split('\n')
-    for line in lines:
-        data = json.loads(line)
-        automated_result = data.get('automatedEvaluationResult', {})
-        scores = automated_result.get('scores', [])
-        
-        results = {
-            'Accuracy': {'S': str(next((score['result'] for score in scores if score['metricName'] == 'Accuracy'), ''))},
-            'Robustness': {'S': str(next((score['result'] for score in scores if score['metricName'] == 'Robustness'), ''))},
-            'Toxicity': {'S': str(next((score['result'] for score in scores if score['metricName'] == 'Toxicity'), ''))},
-            'Summary': {'S': data.get('inputRecord', {}).get('referenceResponse', '')}
+def process_output_shard(bucket_name, shard_index, key, route, part=None):
+    # route maps an output record to the (run, model) pairs it belongs to
+    aggregates = {}
+    batch = []
+    line_number = 0
+    try:
+        # Spans the whole streamed read, so it includes the write_records spans nested inside it
+        with timing.span('read_output_shard'):
+            response = s3_client.get_object(Bucket=bucket_name, Key=key)
+            for line in response['Body'].iter_lines():
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                line_number += 1
+                scores, summary = parse_record(data)
+                for run_id, model_key in route(data):
+                    add_record(aggregates.setdefault((run_id, model_key), new_aggregate()), scores, summary)
+                    batch.append(record_item(run_id, model_key, shard_index, line_number, scores, summary, part))
+                    if len(batch) == RECORD_BATCH_SIZE:
+                        write_records(batch)
+                        batch = []
+    except ClientError as e:
+        print(f"Error reading evaluation output {key}: {e.response['Error']['Message']}")
+        raise
+    
+    if batch:
+        write_records(batch)
+    return aggregates
+
+def parse_record(data):
+    scores = data.get('automatedEvaluationResult', {}).get('scores', [])
+    input_record = data.get('inputRecord', {})
+    
+    # Precomputed (bring-your-own-inference) records carry our generated summary in modelResponses
+    model_responses = input_record.get('modelResponses', [])
+    summary = model_responses[0].get('response', '') if model_responses else input_record.get('referenceResponse', '')
+    
+    return {
+        field: next((score.get('result') for score in scores if score['metricName'] == field), None)
+        for field in run_table.SCORE_FIELDS
+    }, summary
+
+def new_aggregate():
+    return {'Records': 0, 'Summary': None, 'Metrics': {}}
+
+def add_record(aggregate, scores, summary):
+    aggregate['Records'] += 1
+    if aggregate['Summary'] is None:
+        aggregate['Summary'] = summary
+    for field, value in scores.items():
+        if 'N' not in run_table.to_score_attribute(value):
+            continue
+        value = float(value)
+        stats = aggregate['Metrics'].setdefault(field, {'Count': 0, 'Sum': 0.0, 'Min': value, 'Max': value})
+        stats['Count'] += 1
+        stats['Sum'] += value
+        stats['Min'] = min(stats['Min'], value)
+        stats['Max'] = max(stats['Max'], value)
+
+def merge_aggregates(left, right):
+    metrics = {field: dict(stats) for field, stats in left['Metrics'].items()}
+    for field, stats in right['Metrics'].items():
+        if field not in metrics:
+            metrics[field] = dict(stats)
+            continue
+        merged = metrics[field]
+        merged['Count'] += stats['Count']
+        merged['Sum'] += stats['Sum']
+        merged['Min'] = min(merged['Min'], stats['Min'])
+        merged['Max'] = max(merged['Max'], stats['Max'])
+    return {
+        'Records': left['Records'] + right['Records'],
+        'Summary': left['Summary'] if left['Summary'] is not None else right['Summary'],
+        'Metrics': metrics
+    }
+
+def to_results(aggregate):
+    # The model item keeps the mean of each metric; per-record scores live on RECORD# items
+    metrics = aggregate['Metrics']
+    results = {
+        field: run_table.to_score_attribute(metrics[field]['Sum'] / metrics[field]['Count'] if field in metrics else None)
+        for field in run_table.SCORE_FIELDS
+    }
+    results['Summary'] = {'S': aggregate['Summary'] or ''}
+    results['Records'] = {'N': str(aggregate['Records'])}
+    results['ScoreStats'] = {
+        'M': {
+            field: {
+                'M': {
+                    'Count': {'N': str(stats['Count'])},
+                    'Min': run_table.to_score_attribute(stats['Min']),
+                    'Max': run_table.to_score_attribute(stats['Max'])
+                }
+            }
+            for field, stats in metrics.items()
         }
-        
-        return results
+    }
+    return results
+
+def process_jsonl_content(content):
+    aggregate = new_aggregate()
+    for line in content.splitlines():
+        if line.strip():
+            add_record(aggregate, *parse_record(json.loads(line)))
     
-    raise Exception("No valid data found in the JSONL content")
+    if not aggregate['Records']:
+        raise Exception("No valid data found in the JSONL content")
+    return to_results(aggregate)
+
+def record_item(run_id, model_key, shard_index, line_number, scores, summary, part=None):
+    return {
+        'RunID': {'S': run_id},
+        'SK': {'S': run_table.record_sk(model_key, shard_index, line_number, part)},
+        'ModelKey': {'S': model_key},
+        'Summary': {'S': summary},
+        **{field: run_table.to_score_attribute(value) for field, value in scores.items()}
+    }
+
+def write_records(items):
+    request = {MODEL_RESULT_TABLE: [{'PutRequest': {'Item': item}} for item in items]}
+    for attempt in range(MAX_BATCH_ATTEMPTS):
+        try:
+            with timing.span('write_records'):
+                response = dynamodb.batch_write_item(RequestItems=request)
+        except ClientError as e:
+            print(f"Error writing evaluation records: {e.response['Error']['Message']}")
+            raise
+        request = response.get('UnprocessedItems') or {}
+        if not request:
+            return
+        # Throttled puts come back unprocessed; back off before resubmitting them
+        time.sleep(min(0.05 * 2 ** attempt, 1))
+    raise Exception(f"Evaluation records still unprocessed after {MAX_BATCH_ATTEMPTS} attempts")
 
 def update_dynamodb_with_results(run_id, model_key, full_model_name, results):
+    # Scores go on this model's own item; the META item only counts completions
+    attributes = {
+        **results,
+        **run_table.score_index_attributes(results.get('Toxicity', {'NULL': True})),
+        'ModelName': {'S': full_model_name},
+        'Completed': {'BOOL': True},
+        'SchemaVersion': {'N': str(run_table.SCHEMA_VERSION)}
+    }
+    model_update = {
+        'TableName': MODEL_RESULT_TABLE,
+        'Key': {'RunID': {'S': run_id}, 'SK': {'S': run_table.model_sk(model_key)}},
+        'UpdateExpression': f"SET {', '.join(f'#{name.lower()} = :{name.lower()}' for name in attributes)}",
+        'ConditionExpression': "attribute_not_exists(Completed)",
+        'ExpressionAttributeNames': {f"#{name.lower()}": name for name in attributes},
+        'ExpressionAttributeValues': {f":{name.lower()}": value for name, value in attributes.items()}
+    }
+    
+    # Scores, the completion count and the run status land in one transaction; a concurrent completion
+    # moves the count under us, so the META condition fails and the next attempt re-reads it
+    for _ in range(MAX_BATCH_ATTEMPTS):
+        meta_update, run_completed = completion_update(run_id, get_run_progress(run_id))
+        try:
+            with timing.span('update_model_results'):
+                dynamodb.transact_write_items(TransactItems=[{'Update': model_update}, {'Update': meta_update}])
+            return run_completed
+        except dynamodb.exceptions.TransactionCanceledException as e:
+            model_reason, meta_reason = e.response.get('CancellationReasons', [{}, {}])
+            if model_reason.get('Code') == 'ConditionalCheckFailed':
+                return None
+            if meta_reason.get('Code') != 'ConditionalCheckFailed':
+                print(f"Error updating DynamoDB with results: {e.response['Error']['Message']}")
+                raise
+        except ClientError as e:
+            print(f"Error updating DynamoDB with results: {e.response['Error']['Message']}")
+            raise
+    
+    raise Exception(f"Completion of {run_id}/{model_key} still contended after {MAX_BATCH_ATTEMPTS} attempts")
+
+def get_run_progress(run_id):
     try:
         response = dynamodb.get_item(
             TableName=MODEL_RESULT_TABLE,
-            Key={'RunID': {'S': run_id}}
-        )
-        item = response.get('Item', {})
-        
-        model_data = item.get(model_key, {'M': {}})['M']
-        model_data.update(results)
-        model_data['ModelName'] = {'S': full_model_name}
-        item[model_key] = {'M': model_data}
-        
-        item[full_model_name] = {'M': model_data}
-        
-        dynamodb.put_item(
-            TableName=MODEL_RESULT_TABLE,
-            Item=item
+            Key={'RunID': {'S': run_id}, 'SK': {'S': run_table.META}},
+            ProjectionExpression='ModelCount, CompletedCount, #status',
+            ExpressionAttributeNames={'#status': 'Status'},
+            ConsistentRead=True
         )
     except ClientError as e:
-        print(f"Error updating DynamoDB with results: {e.response['Error']['Message']}")
+        print(f"Error retrieving run progress from DynamoDB: {e.response['Error']['Message']}")
         raise
+    return response.get('Item', {})
 
-def update_run_status(run_id, status=None):
+def completion_update(run_id, run):
+    completed_count = int(run.get('CompletedCount', {}).get('N', '0'))
+    values = {':one': {'N': '1'}, ':now': {'S': run_table.utc_now()}}
+    names = {}
+    # Only the count this attempt read may be incremented, so exactly one completion sees the last model land
+    if 'CompletedCount' in run:
+        conditions = ["CompletedCount = :completed"]
+        values[':completed'] = run['CompletedCount']
+    else:
+        conditions = ["attribute_not_exists(CompletedCount)"]
+    
+    # save_run records ModelCount before any branch starts; without it the run cannot be judged complete
+    run_completed = 'ModelCount' in run and completed_count + 1 >= int(run['ModelCount']['N'])
+    assignments = "UpdatedAt = :now"
+    status = run.get('Status', {}).get('S')
+    if status in FAILED_RUN_STATUSES:
+        # A failed run stays failed; the scores are still recorded and counted
+        conditions.append("#status = :status")
+        names['#status'] = 'Status'
+        values[':status'] = {'S': status}
+        run_completed = False
+    else:
+        assignments = "#status = :status, UpdatedAt = :now"
+        conditions.append("(attribute_not_exists(#status) OR NOT #status IN (:failed, :stopped))")
+        names['#status'] = 'Status'
+        values.update({
+            ':status': {'S': 'Completed' if run_completed else 'Running'},
+            ':failed': {'S': 'Failed'},
+            ':stopped': {'S': 'Stopped'}
+        })
+    
+    return {
+        'TableName': MODEL_RESULT_TABLE,
+        'Key': {'RunID': {'S': run_id}, 'SK': {'S': run_table.META}},
+        'UpdateExpression': f"SET {assignments} ADD CompletedCount :one",
+        'ConditionExpression': ' AND '.join(conditions),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }, run_completed
+
+def update_run_status(run_id, status):
     try:
-        if status is None:
-            response = dynamodb.get_item(
+        with timing.span('update_run_status'):
+            dynamodb.update_item(
                 TableName=MODEL_RESULT_TABLE,
-                Key={'RunID': {'S': run_id}}
-            )
-            item = response.get('Item', {})
-            
-            all_completed = all(
-                'Accuracy' in item.get(model, {}).get('M', {})
-                for model in ['model1', 'model2', 'model3']
+                Key={'RunID': {'S': run_id}, 'SK': {'S': run_table.META}},
+                UpdateExpression="SET #status = :status, ListPartition = :partition, CreatedAt = if_not_exists(CreatedAt, :now), UpdatedAt = :now",
+                ExpressionAttributeNames={'#status': 'Status'},
+                ExpressionAttributeValues={
+                    ':status': {'S': status},
+                    ':partition': {'S': run_table.LIST_PARTITION},
+                    ':now': {'S': run_table.utc_now()}
+                }
             )
-            
-            status = 'Completed' if all_completed else 'Running'
-        
-        dynamodb.put_item(
-            TableName=RUN_STATUS_TABLE,
-            Item={
-                'RunID': {'S': run_id},
-                'Status': {'S': status}
-            }
-        )
     except ClientError as e:
-        print(f"Error updating Run-Status table: {e.response['Error']['Message']}")
-        raise
\ No newline at end of file
+        print(f"Error updating run status: {e.response['Error']['Message']}")
+        raise
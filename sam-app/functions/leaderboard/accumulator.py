@@ -0,0 +1,47 @@
+import math
+
+# Running moments per metric: count, mean and the sum of squared deviations (M2), plus the range.
+# Two accumulators merge exactly (Chan et al.), so a stream batch can be folded locally and merged once per row.
+EMPTY = {'Count': 0, 'Mean': 0.0, 'M2': 0.0, 'Min': None, 'Max': None}
+
+
+def single(value):
+    value = float(value)
+    return {'Count': 1, 'Mean': value, 'M2': 0.0, 'Min': value, 'Max': value}
+
+
+def merge(left, right):
+    if not right['Count']:
+        return dict(left)
+    if not left['Count']:
+        return dict(right)
+    count = left['Count'] + right['Count']
+    delta = right['Mean'] - left['Mean']
+    return {
+        'Count': count,
+        'Mean': left['Mean'] + delta * right['Count'] / count,
+        'M2': left['M2'] + right['M2'] + delta * delta * left['Count'] * right['Count'] / count,
+        'Min': min(left['Min'], right['Min']),
+        'Max': max(left['Max'], right['Max'])
+    }
+
+
+def add(accumulator, value):
+    return merge(accumulator, single(value))
+
+
+def merge_metrics(left, right):
+    return {name: merge(left.get(name, EMPTY), right.get(name, EMPTY)) for name in set(left) | set(right)}
+
+
+def summarize(accumulator):
+    count = accumulator['Count']
+    variance = accumulator['M2'] / (count - 1) if count > 1 else 0.0
+    return {
+        'Count': count,
+        'Mean': accumulator['Mean'],
+        'Variance': variance,
+        'StdDev': math.sqrt(variance),
+        'Min': accumulator['Min'],
+        'Max': accumulator['Max']
+    }
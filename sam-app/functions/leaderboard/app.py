@@ -0,0 +1,245 @@
+import json
+import boto3
+import os
+import time
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+import accumulator
+import run_table
+
+dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+
+LEADERBOARD_TABLE = os.environ['LEADERBOARD_TABLE']
+MODEL_RESULT_TABLE = os.environ['MODEL_RESULT_TABLE']
+# Every model also rolls up into this category
+ALL_CATEGORIES = '*'
+DEFAULT_CATEGORY = 'default_category'
+MAX_WRITE_ATTEMPTS = 5
+# DynamoDB's cap on items in one TransactWriteItems call
+MAX_TRANSACTION_ITEMS = 100
+CACHE_TTL_SECONDS = int(os.environ.get('LEADERBOARD_CACHE_SECONDS', '30'))
+MOMENT_FIELDS = ('Count', 'Mean', 'M2', 'Min', 'Max')
+
+deserializer = TypeDeserializer()
+# Warm containers answer from memory until the entry expires
+cached_rows = {'ExpiresAt': 0, 'Rows': []}
+
+def lambda_handler(event, context):
+    if 'Records' in event:
+        return handle_stream(event['Records'])
+    return handle_request(event)
+
+
+def handle_stream(records):
+    contributions = []
+    for record in records:
+        if record.get('eventName') == 'REMOVE':
+            continue
+        images = record['dynamodb']
+        new_image = deserialize(images.get('NewImage', {}))
+        old_image = deserialize(images.get('OldImage', {}))
+        if not new_image.get('SK', '').startswith(run_table.MODEL_PREFIX) or not new_image.get('ModelName'):
+            continue
+        
+        kind, values = contributed_metrics(new_image, old_image)
+        if values:
+            contributions.append({
+                'SequenceNumber': images.get('SequenceNumber'),
+                'Key': {name: images['NewImage'][name] for name in ('RunID', 'SK')},
+                'Kind': kind,
+                'Rows': [(new_image['ModelName'], category) for category in (new_image.get('Category', DEFAULT_CATEGORY), ALL_CATEGORIES)],
+                'Values': values
+            })
+    
+    # A failed batch is retried from its first unapplied record; the markers make the replayed ones no-ops
+    batches = transaction_batches(contributions)
+    failures = []
+    for index, batch in enumerate(batches):
+        try:
+            apply_batch(batch)
+        except Exception as e:
+            print(f"Error applying leaderboard batch: {e}")
+            failures = [contribution['SequenceNumber'] for unapplied in batches[index:] for contribution in unapplied]
+            break
+    
+    return {'batchItemFailures': [{'itemIdentifier': sequence_number} for sequence_number in failures]}
+
+
+def transaction_batches(contributions):
+    # Each transaction holds every row it touches plus one marker per source item, and names an item only once
+    batches = []
+    rows = set()
+    keys = set()
+    for contribution in contributions:
+        key = tuple(value['S'] for value in contribution['Key'].values())
+        added = rows | set(contribution['Rows'])
+        if not batches or key in keys or len(added) + len(keys) + 1 > MAX_TRANSACTION_ITEMS:
+            batches.append([])
+            rows, keys = set(), set()
+            added = set(contribution['Rows'])
+        batches[-1].append(contribution)
+        rows = added
+        keys.add(key)
+    return batches
+
+
+def deserialize(image):
+    return {name: deserializer.deserialize(value) for name, value in image.items()}
+
+def is_number(value):
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+def contributed_metrics(new_image, old_image):
+    # A result counts once, when it becomes final: Bedrock scores arrive with Completed,
+    # local-only results are final as soon as their metrics land
+    completed = new_image.get('Completed') and not old_image.get('Completed')
+    local_final = (
+        new_image.get('EvaluationMode') == 'local'
+        and new_image.get('LocalMetrics')
+        and not old_image.get('LocalMetrics')
+    )
+    if not (completed or local_final):
+        return None, {}
+    
+    values = dict(new_image.get('LocalMetrics', {}))
+    values.update({field: new_image.get(field) for field in run_table.SCORE_FIELDS})
+    return 'Completed' if completed else 'Local', {name: value for name, value in values.items() if is_number(value)}
+
+
+def encode_metrics(metrics):
+    return {
+        'M': {
+            name: {'M': {field: {'N': str(moments[field])} for field in MOMENT_FIELDS}}
+            for name, moments in metrics.items()
+        }
+    }
+
+def decode_metrics(item):
+    metrics = deserializer.deserialize(item['Metrics']) if item and 'Metrics' in item else {}
+    return {
+        name: {field: int(value) if field == 'Count' else float(value) for field, value in moments.items()}
+        for name, moments in metrics.items()
+    }
+
+def read_row(key):
+    try:
+        return dynamodb.get_item(TableName=LEADERBOARD_TABLE, Key=key, ConsistentRead=True).get('Item')
+    except ClientError as e:
+        print(f"Error reading leaderboard row: {e.response['Error']['Message']}")
+        raise
+
+def row_write(key, item, metrics):
+    version = int(item['Version']['N']) if item else 0
+    condition = {'ConditionExpression': 'attribute_not_exists(Version)'}
+    if version:
+        condition = {'ConditionExpression': 'Version = :version', 'ExpressionAttributeValues': {':version': {'N': str(version)}}}
+    return {
+        'Put': {
+            'TableName': LEADERBOARD_TABLE,
+            'Item': {
+                **key,
+                'Metrics': encode_metrics(accumulator.merge_metrics(decode_metrics(item), metrics)),
+                'Version': {'N': str(version + 1)},
+                'UpdatedAt': {'S': run_table.utc_now()}
+            },
+            **condition
+        }
+    }
+
+def marker_write(contribution):
+    # Lands in the same transaction as the rows, so a redelivered record finds it and adds nothing
+    return {
+        'Update': {
+            'TableName': MODEL_RESULT_TABLE,
+            'Key': contribution['Key'],
+            'UpdateExpression': 'ADD LeaderboardApplied :kinds',
+            'ConditionExpression': 'attribute_exists(SK) AND NOT contains(LeaderboardApplied, :kind)',
+            'ExpressionAttributeValues': {':kinds': {'SS': [contribution['Kind']]}, ':kind': {'S': contribution['Kind']}}
+        }
+    }
+
+def apply_batch(batch):
+    for _ in range(MAX_WRITE_ATTEMPTS):
+        # Fold the batch locally so each leaderboard row takes one conditional write
+        pending = {}
+        for contribution in batch:
+            for row in contribution['Rows']:
+                metrics = pending.setdefault(row, {})
+                for name, value in contribution['Values'].items():
+                    metrics[name] = accumulator.add(metrics.get(name, accumulator.EMPTY), value)
+        
+        rows = []
+        for model_id, category in pending:
+            key = {'ModelId': {'S': model_id}, 'Category': {'S': category}}
+            rows.append(row_write(key, read_row(key), pending[(model_id, category)]))
+        try:
+            dynamodb.transact_write_items(TransactItems=rows + [marker_write(contribution) for contribution in batch])
+            return
+        except dynamodb.exceptions.TransactionCanceledException as e:
+            reasons = e.response.get('CancellationReasons', [])
+            applied = {
+                index for index, reason in enumerate(reasons[len(rows):])
+                if reason.get('Code') == 'ConditionalCheckFailed'
+            }
+            # Records already applied by an earlier delivery drop out; a moved row is re-read and merged on top
+            batch = [contribution for index, contribution in enumerate(batch) if index not in applied]
+            if not batch:
+                return
+        except ClientError as e:
+            print(f"Error writing leaderboard rows: {e.response['Error']['Message']}")
+            raise
+    
+    raise Exception(f"Leaderboard rows kept changing after {MAX_WRITE_ATTEMPTS} attempts")
+
+
+def handle_request(event):
+    params = event.get('queryStringParameters') or {}
+    metric = params.get('metric', 'Accuracy')
+    rows = [
+        row for row in load_rows()
+        if params.get('category', row['Category']) == row['Category'] and params.get('model', row['ModelId']) == row['ModelId']
+    ]
+    ranked = sorted(
+        (row for row in rows if metric in row['Metrics']),
+        key=lambda row: row['Metrics'][metric]['Mean'],
+        reverse=params.get('order', 'desc') != 'asc'
+    )
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'Metric': metric, 'Items': ranked + [row for row in rows if metric not in row['Metrics']]}),
+        'headers': {
+            'Content-Type': 'application/json',
+            'Cache-Control': f"max-age={CACHE_TTL_SECONDS}"
+        }
+    }
+
+def load_rows():
+    # One row per model and category however many runs fed it, so a full read stays small
+    now = time.monotonic()
+    if cached_rows['ExpiresAt'] > now:
+        return cached_rows['Rows']
+    
+    rows = []
+    try:
+        for page in dynamodb.get_paginator('scan').paginate(TableName=LEADERBOARD_TABLE):
+            rows.extend(
+                {
+                    'ModelId': item['ModelId']['S'],
+                    'Category': item['Category']['S'],
+                    'Metrics': {name: accumulator.summarize(moments) for name, moments in decode_metrics(item).items()},
+                    'UpdatedAt': item.get('UpdatedAt', {}).get('S')
+                }
+                for item in page.get('Items', [])
+            )
+    except ClientError as e:
+        print(f"Error reading leaderboard: {e.response['Error']['Message']}")
+        raise
+    
+    cached_rows.update(ExpiresAt=now + CACHE_TTL_SECONDS, Rows=rows)
+    return rows
@@ -0,0 +1,275 @@
+import json
+import boto3
+import os
+import re
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+
+import run_table
+
+dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+lambda_client = boto3.client('lambda', region_name='us-east-1')
+
+MODEL_RESULT_TABLE = os.environ['MODEL_RESULT_TABLE']
+LEGACY_MODEL_RESULT_TABLE = os.environ.get('LEGACY_MODEL_RESULT_TABLE')
+LEGACY_RUN_STATUS_TABLE = os.environ.get('LEGACY_RUN_STATUS_TABLE')
+MIGRATION_SEGMENTS = int(os.environ.get('MIGRATION_SEGMENTS', '8'))
+PAGE_SIZE = 200
+# Stop scanning this long before the Lambda deadline so every segment can report where it stopped
+DEADLINE_MARGIN_MS = 30000
+# Legacy rows kept each model in a map attribute named after its key, plus a copy under the full model name
+MODEL_KEY_PATTERN = re.compile(r'model\d+')
+# Runs from before ListIndex existed have no creation time; sorting them oldest keeps them reachable by paging
+LEGACY_CREATED_AT = '1970-01-01T00:00:00.000Z'
+
+def lambda_handler(event, context):
+    if 'RequestType' in event:
+        return handle_custom_resource(event, context)
+    return backfill(event, context)
+
+
+def handle_custom_resource(event, context):
+    # The legacy tables are retained and nothing here is destructive, so a delete has nothing to undo
+    if event['RequestType'] == 'Delete':
+        return respond(event, 'SUCCESS')
+
+    try:
+        summary = backfill(event.get('Backfill', {}), context)
+    except Exception as e:
+        print(f"Error backfilling the run table: {e}")
+        return respond(event, 'FAILED', str(e))
+
+    if not summary['Done']:
+        # CloudFormation waits up to an hour for the response; each pass hands what is left to a fresh invocation
+        lambda_client.invoke(
+            FunctionName=context.invoked_function_arn,
+            InvocationType='Event',
+            Payload=json.dumps({**event, 'Backfill': summary})
+        )
+        return summary
+    return respond(event, 'SUCCESS')
+
+
+def respond(event, status, reason=''):
+    body = json.dumps({
+        'Status': status,
+        'Reason': reason or status,
+        'PhysicalResourceId': event.get('PhysicalResourceId', event['LogicalResourceId']),
+        'StackId': event['StackId'],
+        'RequestId': event['RequestId'],
+        'LogicalResourceId': event['LogicalResourceId']
+    }).encode('utf-8')
+    request = urllib.request.Request(event['ResponseURL'], data=body, method='PUT', headers={'Content-Type': ''})
+    with urllib.request.urlopen(request, timeout=30):
+        pass
+    return {'Status': status}
+
+
+def phases():
+    # Legacy run rows first, then their status rows, then anything in the run table on an older schema
+    return [
+        (LEGACY_MODEL_RESULT_TABLE, {}, copy_legacy_run),
+        (LEGACY_RUN_STATUS_TABLE, {}, copy_legacy_status),
+        (MODEL_RESULT_TABLE, {
+            'FilterExpression': 'begins_with(SK, :model_prefix) AND (attribute_not_exists(SchemaVersion) OR SchemaVersion < :version)',
+            'ExpressionAttributeValues': {
+                ':model_prefix': {'S': run_table.MODEL_PREFIX},
+                ':version': {'N': str(run_table.SCHEMA_VERSION)}
+            }
+        }, migrate_item)
+    ]
+
+
+def backfill(event, context):
+    total_segments = int(event.get('TotalSegments', MIGRATION_SEGMENTS))
+    phase = int(event.get('Phase', 0))
+    # A resumed run only revisits the segments that reported a start key last time
+    start_keys = {int(segment): key for segment, key in event.get('StartKeys', {}).items()}
+    deadline = None
+    if context is not None:
+        deadline = time.monotonic() + (context.get_remaining_time_in_millis() - DEADLINE_MARGIN_MS) / 1000
+
+    scanned = 0
+    migrated = 0
+    remaining = {}
+    steps = phases()
+    while phase < len(steps):
+        table_name, scan_filter, convert = steps[phase]
+        if table_name:
+            segments = sorted(start_keys) if start_keys else list(range(total_segments))
+            with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+                results = list(executor.map(
+                    lambda segment: migrate_segment(table_name, scan_filter, convert, segment, total_segments, start_keys.get(segment), deadline),
+                    segments
+                ))
+            scanned += sum(result['Scanned'] for result in results)
+            migrated += sum(result['Migrated'] for result in results)
+            remaining = {str(result['Segment']): result['LastEvaluatedKey'] for result in results if result['LastEvaluatedKey']}
+            if remaining:
+                break
+        phase += 1
+        start_keys = {}
+        if deadline is not None and time.monotonic() > deadline:
+            break
+
+    # Feeding the summary back in as the next event resumes where this pass stopped
+    summary = {
+        'TotalSegments': total_segments,
+        'Phase': phase,
+        'Scanned': scanned,
+        'Migrated': migrated,
+        'StartKeys': remaining,
+        'Done': phase >= len(steps)
+    }
+    print(f"Schema migration: {json.dumps(summary)}")
+    return summary
+
+
+def migrate_segment(table_name, scan_filter, convert, segment, total_segments, start_key, deadline):
+    scanned = 0
+    migrated = 0
+    scan = {
+        'TableName': table_name,
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'Limit': PAGE_SIZE,
+        **scan_filter
+    }
+    # One page at a time, so memory stays flat however large the table is
+    while True:
+        if start_key:
+            scan['ExclusiveStartKey'] = start_key
+        try:
+            response = dynamodb.scan(**scan)
+        except ClientError as e:
+            print(f"Error scanning segment {segment} of {table_name}: {e.response['Error']['Message']}")
+            raise
+
+        scanned += response.get('ScannedCount', 0)
+        migrated += sum(convert(item) for item in response.get('Items', []))
+        start_key = response.get('LastEvaluatedKey')
+        if not start_key or (deadline is not None and time.monotonic() > deadline):
+            break
+
+    return {'Segment': segment, 'Scanned': scanned, 'Migrated': migrated, 'LastEvaluatedKey': start_key}
+
+
+def score_value(attribute):
+    if not attribute or 'NULL' in attribute:
+        return None
+    return attribute.get('N', attribute.get('S'))
+
+def current_attributes(item):
+    scores = {field: run_table.to_score_attribute(score_value(item.get(field))) for field in run_table.SCORE_FIELDS}
+    return {
+        **scores,
+        **run_table.score_index_attributes(scores['Toxicity']),
+        'SchemaVersion': {'N': str(run_table.SCHEMA_VERSION)}
+    }
+
+def migrate_item(item):
+    attributes = current_attributes(item)
+    try:
+        dynamodb.update_item(
+            TableName=MODEL_RESULT_TABLE,
+            Key={'RunID': item['RunID'], 'SK': item['SK']},
+            UpdateExpression=f"SET {', '.join(f'#{name.lower()} = :{name.lower()}' for name in attributes)}",
+            # A writer on the current schema may have rewritten the item since the scan read it
+            ConditionExpression="attribute_exists(SK) AND (attribute_not_exists(SchemaVersion) OR SchemaVersion < :version)",
+            ExpressionAttributeNames={f"#{name.lower()}": name for name in attributes},
+            ExpressionAttributeValues={
+                **{f":{name.lower()}": value for name, value in attributes.items()},
+                ':version': {'N': str(run_table.SCHEMA_VERSION)}
+            }
+        )
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        return False
+    except ClientError as e:
+        print(f"Error migrating {item['RunID']['S']}/{item['SK']['S']}: {e.response['Error']['Message']}")
+        raise
+    return True
+
+
+def copy_legacy_run(item):
+    run_id = item['RunID']
+    models = {name: value['M'] for name, value in item.items() if MODEL_KEY_PATTERN.fullmatch(name) and 'M' in value}
+    copied = sum(copy_legacy_model(run_id, model_key, model_data) for model_key, model_data in models.items())
+
+    # if_not_exists throughout, so anything written through the run table since the switch wins
+    attributes = {
+        'Context': item.get('Context'),
+        'ContextRef': item.get('ContextRef'),
+        'ModelCount': item.get('ModelCount', {'N': str(len(models))}),
+        'CompletedCount': {'N': str(sum(1 for model_data in models.values() if model_data.get('Completed', {}).get('BOOL')))},
+        'CreatedAt': item.get('CreatedAt', {'S': LEGACY_CREATED_AT})
+    }
+    attributes = {name: value for name, value in attributes.items() if value is not None}
+    assignments = [f"#{name.lower()} = if_not_exists(#{name.lower()}, :{name.lower()})" for name in attributes]
+    try:
+        dynamodb.update_item(
+            TableName=MODEL_RESULT_TABLE,
+            Key={'RunID': run_id, 'SK': {'S': run_table.META}},
+            UpdateExpression=f"SET {', '.join(assignments)}, ListPartition = :partition",
+            ExpressionAttributeNames={f"#{name.lower()}": name for name in attributes},
+            ExpressionAttributeValues={
+                **{f":{name.lower()}": value for name, value in attributes.items()},
+                ':partition': {'S': run_table.LIST_PARTITION}
+            }
+        )
+    except ClientError as e:
+        print(f"Error copying run {run_id['S']}: {e.response['Error']['Message']}")
+        raise
+    return copied > 0
+
+def copy_legacy_model(run_id, model_key, model_data):
+    item = {
+        **model_data,
+        'RunID': run_id,
+        'SK': {'S': run_table.model_sk(model_key)},
+        'ModelKey': {'S': model_key}
+    }
+    if model_data.get('Completed', {}).get('BOOL'):
+        item.update(current_attributes(model_data))
+    try:
+        dynamodb.put_item(
+            TableName=MODEL_RESULT_TABLE,
+            Item=item,
+            ConditionExpression="attribute_not_exists(SK)"
+        )
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        return False
+    except ClientError as e:
+        print(f"Error copying {run_id['S']}/{model_key}: {e.response['Error']['Message']}")
+        raise
+    return True
+
+
+def copy_legacy_status(item):
+    created_at = item.get('CreatedAt', {'S': LEGACY_CREATED_AT})
+    updated_at = item.get('UpdatedAt', created_at)
+    try:
+        dynamodb.update_item(
+            TableName=MODEL_RESULT_TABLE,
+            Key={'RunID': item['RunID'], 'SK': {'S': run_table.META}},
+            UpdateExpression=(
+                "SET #status = :status, UpdatedAt = :updated_at, ListPartition = :partition, "
+                "CreatedAt = if_not_exists(CreatedAt, :created_at)"
+            ),
+            # A status written through the run table since the switch is newer than anything here
+            ConditionExpression="attribute_not_exists(UpdatedAt) OR UpdatedAt < :updated_at",
+            ExpressionAttributeNames={'#status': 'Status'},
+            ExpressionAttributeValues={
+                ':status': item['Status'],
+                ':updated_at': updated_at,
+                ':partition': {'S': run_table.LIST_PARTITION},
+                ':created_at': created_at
+            }
+        )
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        return False
+    except ClientError as e:
+        print(f"Error copying status of {item['RunID']['S']}: {e.response['Error']['Message']}")
+        raise
+    return True
@@ -0,0 +1,1345 @@
+import json
+import boto3
+import hashlib
+import uuid
+import os
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from decimal import Decimal
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+import admission
+import cache
+import chunking
+import concurrency
+import context_store
+import hedging
+import metrics
+import rate_limit
+import run_table
+import throttling
+import timing
+import uploads
+import usage
+
+SHARD_CONCURRENCY = int(os.environ.get('SHARD_CONCURRENCY', '8'))
+FANOUT_CONCURRENCY = int(os.environ.get('FANOUT_CONCURRENCY', '16'))
+MODEL_TIMEOUT_SECONDS = int(os.environ.get('MODEL_TIMEOUT_SECONDS', '120'))
+
+# botocore defaults to 10 pooled connections, fewer than the threads we run against Bedrock.
+# Its own retries are off: a retried throttle would skip the rate limiter and never reach the
+# adaptive limiter, so invoke_limited retries instead.
+bedrock_config = Config(
+    max_pool_connections=max(SHARD_CONCURRENCY, FANOUT_CONCURRENCY),
+    read_timeout=MODEL_TIMEOUT_SECONDS,
+    retries={'max_attempts': 1, 'mode': 'standard'}
+)
+
+s3_client = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+model_result_table = dynamodb.Table(os.environ['MODEL_RESULT_TABLE'])
+bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-east-1', config=bedrock_config)
+bedrock_client = boto3.client('bedrock', region_name='us-east-1')
+stepfunctions = boto3.client('stepfunctions', region_name='us-east-1')
+
+JOB_CALLBACK_TABLE = os.environ.get('JOB_CALLBACK_TABLE')
+CALLBACK_TTL_SECONDS = 7 * 24 * 60 * 60
+INPUT_BUCKET = 'input-datas-directory'
+LATENCY_FIELDS = ('TotalLatencyMs', 'OutputTokens', 'TimeToFirstTokenMs', 'InterTokenLatencyMs', 'OutputTokensPerSecond')
+GENERATION_CACHE_TABLE = os.environ.get('GENERATION_CACHE_TABLE')
+CACHE_TTL_SECONDS = int(os.environ.get('CACHE_TTL_SECONDS', str(30 * 24 * 60 * 60)))
+PENDING_EVALUATION_TABLE = os.environ.get('PENDING_EVALUATION_TABLE')
+COALESCE_WINDOW_SECONDS = int(os.environ.get('COALESCE_WINDOW_SECONDS', '60'))
+# Bedrock caps a custom evaluation dataset at 1000 prompts
+COALESCE_MAX_RECORDS = int(os.environ.get('COALESCE_MAX_RECORDS', '1000'))
+RATE_LIMIT_TABLE = os.environ.get('RATE_LIMIT_TABLE')
+THROTTLE_ATTEMPTS = 3
+THROTTLE_BACKOFF_SECONDS = float(os.environ.get('THROTTLE_BACKOFF_SECONDS', '0.5'))
+
+generation_cache = cache.GenerationCache(
+    dynamodb.Table(GENERATION_CACHE_TABLE) if GENERATION_CACHE_TABLE else None,
+    ttl_seconds=CACHE_TTL_SECONDS
+)
+# In-flight calls per model adapt to what Bedrock absorbs; the thread pools only set the ceiling
+concurrency_limiter = concurrency.AdaptiveLimiter()
+hedger = hedging.Hedger(max_workers=FANOUT_CONCURRENCY * 2)
+rate_limiter = rate_limit.RateLimiter(
+    rate_limit.DynamoDBBucketStore(dynamodb.Table(RATE_LIMIT_TABLE)) if RATE_LIMIT_TABLE else rate_limit.LocalBucketStore()
+)
+
+SUMMARY_INSTRUCTION = "summarise the content as follows: "
+REDUCE_INSTRUCTION = "combine the following partial summaries into a single summary of the whole document: "
+
+MODEL_PARAMS = {
+    'max_tokens': 512,
+    'temperature': 0,
+    'top_p': 1,
+    'top_k': 250,
+    'stop_sequences': []
+}
+
+
+def get_model_config(model_id, template, model_params=MODEL_PARAMS):
+    base_config = {
+        "max_tokens": model_params['max_tokens'],
+        "temperature": model_params['temperature'],
+        "top_p": model_params['top_p'],
+        "top_k": model_params['top_k'],
+        "stop_sequences": model_params['stop_sequences']
+    }
+    
+    if model_id.startswith("anthropic.claude-v2") or model_id.startswith("anthropic.claude-instant-v1"):
+        return json.dumps({
+            "prompt": f"\n\nHuman: {template}\n\nAssistant:",
+            "max_tokens_to_sample": base_config['max_tokens'],
+            "temperature": base_config['temperature'],
+            "top_p": base_config['top_p'],
+            "top_k": base_config['top_k'],
+            "stop_sequences": base_config['stop_sequences'] + ["\n\nHuman:"]
+        })
+    elif model_id.startswith("anthropic.claude-3"):
+        return json.dumps({
+            "messages": [{"role": "user", "content": template}],
+            "max_tokens": base_config['max_tokens'],
+            "temperature": base_config['temperature'],
+            "top_p": base_config['top_p'],
+            "top_k": base_config['top_k'],
+            "anthropic_version": "bedrock-2023-05-31"
+        })
+    elif model_id.startswith("cohere.command-text"):
+        return json.dumps({
+            "prompt": template,
+            "max_tokens": base_config['max_tokens'],
+            "temperature": base_config['temperature'],
+            "p": base_config['top_p'],
+            "k": base_config['top_k'],
+            "stop_sequences": base_config['stop_sequences'],
+            "return_likelihoods": "NONE"
+        })
+    elif model_id.startswith("cohere.command-r"):
+        return json.dumps({
+            "message": template,
+            "max_tokens": base_config['max_tokens'],
+            "temperature": base_config['temperature'],
+            "p": base_config['top_p'],
+            "k": base_config['top_k'],
+            "stop_sequences": base_config['stop_sequences']
+        })
+    elif model_id.startswith("ai21.j2"):
+        return json.dumps({
+            "prompt": template,
+            "maxTokens": base_config['max_tokens'],
+            "temperature": base_config['temperature'],
+            "topP": base_config['top_p'],
+            "stopSequences": base_config['stop_sequences'],
+            "countPenalty": {"scale": 0},
+            "presencePenalty": {"scale": 0},
+            "frequencyPenalty": {"scale": 0}
+        })
+    elif model_id.startswith("meta.llama3"):
+        return json.dumps({
+            "prompt": f"Human: {template}\nAssistant:",
+            "max_gen_len": base_config['max_tokens'],
+            "temperature": base_config['temperature'],
+            "top_p": base_config['top_p']
+        })
+    elif model_id.startswith("mistral"):
+        return json.dumps({
+            "prompt": f"<s>[INST] {template} [/INST]",
+            "max_tokens": base_config['max_tokens'],
+            "temperature": base_config['temperature'],
+            "top_p": base_config['top_p']
+        })
+    elif model_id.startswith("amazon.titan"):
+        return json.dumps({
+            "inputText": template,
+            "textGenerationConfig": {
+                "maxTokenCount": base_config['max_tokens'],
+                "temperature": base_config['temperature'],
+                "topP": base_config['top_p'],
+                "stopSequences": base_config['stop_sequences']
+            }
+        })
+    else:
+        raise ValueError(f"Unsupported model: {model_id}")
+
+def extract_response(model_id, response_body):
+    if model_id.startswith("anthropic.claude-v2") or model_id.startswith("anthropic.claude-instant-v1"):
+        return response_body.get('completion', '')
+    elif model_id.startswith("anthropic.claude-3"):
+        return response_body.get('content', [{}])[0].get('text', '')
+    elif model_id.startswith("cohere."):
+        return response_body.get('text', '') if model_id.startswith("cohere.command-text") else response_body.get('generations', [{}])[0].get('text', '')
+    elif model_id.startswith("ai21."):
+        return response_body.get('completions', [{}])[0].get('data', {}).get('text', '')
+    elif model_id.startswith("meta."):
+        return response_body.get('generation', '')
+    elif model_id.startswith("mistral."):
+        return response_body.get('outputs', [{}])[0].get('text', '')
+    elif model_id.startswith("amazon.titan"):
+        return response_body.get('results', [{}])[0].get('outputText', '')
+    else:
+        raise ValueError(f"Unsupported model for response extraction: {model_id}")
+
+def extract_stop_reason(model_id, response_body):
+    if model_id.startswith("anthropic.claude") or model_id.startswith("meta."):
+        return response_body.get('stop_reason')
+    elif model_id.startswith("cohere."):
+        return response_body.get('finish_reason') or response_body.get('generations', [{}])[0].get('finish_reason')
+    elif model_id.startswith("ai21."):
+        return response_body.get('completions', [{}])[0].get('finishReason', {}).get('reason')
+    elif model_id.startswith("mistral."):
+        return response_body.get('outputs', [{}])[0].get('stop_reason')
+    elif model_id.startswith("amazon.titan"):
+        return response_body.get('results', [{}])[0].get('completionReason')
+    return None
+
+def extract_stream_stop_reason(model_id, chunk):
+    if model_id.startswith("anthropic.claude-3"):
+        return chunk.get('delta', {}).get('stop_reason') if chunk.get('type') == 'message_delta' else None
+    elif model_id.startswith("amazon.titan"):
+        return chunk.get('completionReason')
+    return extract_stop_reason(model_id, chunk)
+
+def supports_streaming(model_id):
+    # Jurassic-2 has no response-stream API on Bedrock
+    return not model_id.startswith("ai21.")
+
+def extract_stream_delta(model_id, chunk):
+    if model_id.startswith("anthropic.claude-v2") or model_id.startswith("anthropic.claude-instant-v1"):
+        return chunk.get('completion', '')
+    elif model_id.startswith("anthropic.claude-3"):
+        return chunk.get('delta', {}).get('text', '') if chunk.get('type') == 'content_block_delta' else ''
+    elif model_id.startswith("cohere."):
+        return chunk.get('text') or chunk.get('generations', [{}])[0].get('text', '')
+    elif model_id.startswith("meta."):
+        return chunk.get('generation', '')
+    elif model_id.startswith("mistral."):
+        return chunk.get('outputs', [{}])[0].get('text', '')
+    elif model_id.startswith("amazon.titan"):
+        return chunk.get('outputText', '')
+    else:
+        raise ValueError(f"Unsupported model for streaming: {model_id}")
+
+def measure_latency(started, arrivals, finished, invocation_metrics):
+    total = finished - started
+    # Chunks can carry several tokens, so prefer Bedrock's own token count over the chunk count
+    output_tokens = invocation_metrics.get('outputTokenCount') or len(arrivals)
+    latency = {
+        'TotalLatencyMs': round(total * 1000, 1),
+        'OutputTokens': output_tokens
+    }
+    if not arrivals:
+        return latency
+
+    generating = arrivals[-1] - arrivals[0]
+    latency['TimeToFirstTokenMs'] = round((arrivals[0] - started) * 1000, 1)
+    if output_tokens > 1:
+        latency['InterTokenLatencyMs'] = round(generating * 1000 / (output_tokens - 1), 2)
+    latency['OutputTokensPerSecond'] = round(output_tokens / (generating if generating > 0 else total), 2)
+    return latency
+
+def estimate_tokens(body, max_tokens):
+    # Input is estimated from the request size; output reserves the whole max_tokens budget until settled
+    return len(body) // chunking.CHARS_PER_TOKEN + max_tokens
+
+def invoke_limited(invoke, model_id, body, reserved, read):
+    # read consumes the response inside the concurrency slot, so a stream counts as in flight until it ends.
+    # Returns the read result and the tokens actually taken, which is what settle has to hand back against.
+    for attempt in range(THROTTLE_ATTEMPTS):
+        taken = rate_limiter.acquire(model_id, reserved)
+        try:
+            with concurrency_limiter.slot(model_id), timing.span(invoke.__name__, model_id):
+                started = time.perf_counter()
+                return read(invoke(
+                    body=body,
+                    modelId=model_id,
+                    accept='application/json',
+                    contentType='application/json'
+                ), started), taken
+        except ClientError as e:
+            if not throttling.is_throttle(e):
+                rate_limiter.settle(model_id, taken, 0)
+                raise
+            rate_limiter.drain(model_id)
+            if attempt == THROTTLE_ATTEMPTS - 1:
+                raise
+            # Full jitter, so callers drained together do not all come back on the same refill
+            time.sleep(random.uniform(0, THROTTLE_BACKOFF_SECONDS * 2 ** attempt))
+        except Exception:
+            # Nothing can settle a failed call later, so its reservation goes straight back to the bucket
+            rate_limiter.settle(model_id, taken, 0)
+            raise
+
+def invocation_usage(response):
+    # Bedrock reports the token counts and its own processing time in headers rather than the body
+    headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+    fields = ('x-amzn-bedrock-input-token-count', 'x-amzn-bedrock-output-token-count', 'x-amzn-bedrock-invocation-latency')
+    return [int(headers[field]) if headers.get(field) is not None else None for field in fields]
+
+def used_tokens(input_tokens, output_tokens):
+    return input_tokens + output_tokens if None not in (input_tokens, output_tokens) else None
+
+def log_invocation_stats():
+    print(f"Generation cache: {json.dumps(generation_cache.stats())}")
+    print(f"Rate limiter: {json.dumps(rate_limiter.stats())}")
+    print(f"Adaptive concurrency: {json.dumps(concurrency_limiter.stats())}")
+    print(f"Hedging: {json.dumps(hedger.stats())}")
+    for model_id, state in concurrency_limiter.snapshot().items():
+        timing.gauge(state, {'Stage': 'adaptive_concurrency', 'ModelId': model_id})
+
+def stream_model(model_id, body, max_tokens=MODEL_PARAMS['max_tokens'], meter=None):
+    reserved = estimate_tokens(body, max_tokens)
+    (response_text, latency, invocation_metrics, stop_reason), taken = invoke_limited(
+        bedrock_runtime.invoke_model_with_response_stream, model_id, body, reserved,
+        lambda response, started: read_stream(model_id, response, started)
+    )
+    input_tokens = invocation_metrics.get('inputTokenCount')
+    output_tokens = invocation_metrics.get('outputTokenCount')
+    rate_limiter.settle(model_id, taken, used_tokens(input_tokens, output_tokens))
+    if meter:
+        meter.record(input_tokens, output_tokens, invocation_metrics.get('invocationLatency', latency['TotalLatencyMs']), stop_reason)
+    return response_text, latency
+
+def read_stream(model_id, response, started):
+    parts = []
+    arrivals = []
+    invocation_metrics = {}
+    stop_reason = None
+    for event in response['body']:
+        if 'chunk' not in event:
+            # Mid-stream errors arrive as events rather than exceptions
+            raise Exception(f"Streaming error from {model_id}: {json.dumps(event, default=str)}")
+        chunk = json.loads(event['chunk']['bytes'])
+        invocation_metrics = chunk.get('amazon-bedrock-invocationMetrics', invocation_metrics)
+        stop_reason = extract_stream_stop_reason(model_id, chunk) or stop_reason
+        delta = extract_stream_delta(model_id, chunk)
+        if delta:
+            parts.append(delta)
+            arrivals.append(time.perf_counter())
+
+    latency = measure_latency(started, arrivals, time.perf_counter(), invocation_metrics)
+    return "".join(parts), latency, invocation_metrics, stop_reason
+
+def update_run_status(run_id, status):
+    try:
+        with timing.span('update_run_status'):
+            model_result_table.update_item(
+                Key={'RunID': run_id, 'SK': run_table.META},
+                UpdateExpression="SET #status = :status, ListPartition = :partition, CreatedAt = if_not_exists(CreatedAt, :now), UpdatedAt = :now",
+                ExpressionAttributeNames={'#status': 'Status'},
+                ExpressionAttributeValues={
+                    ':status': status,
+                    ':partition': run_table.LIST_PARTITION,
+                    ':now': run_table.utc_now()
+                }
+            )
+    except ClientError as e:
+        print(f"Error updating run status: {e.response['Error']['Message']}")
+        raise
+
+def register_job_callback(job_arn, run_id, model_key, task_token, part=None):
+    try:
+        with timing.span('register_job_callback'):
+            dynamodb.Table(JOB_CALLBACK_TABLE).put_item(
+                Item={
+                    'JobArn': job_arn,
+                    'RunID': run_id,
+                    'Model': model_key,
+                    'TaskToken': task_token,
+                    'ExpiresAt': int(time.time()) + CALLBACK_TTL_SECONDS,
+                    # Set for one part of a split bulk dataset, which check_status tallies before resuming
+                    **({'Part': part} if part is not None else {})
+                }
+            )
+    except ClientError as e:
+        print(f"Error registering job callback: {e.response['Error']['Message']}")
+        raise
+
+def get_inference_source_identifier(model_id):
+    return re.sub(r'[^A-Za-z0-9_-]', '-', model_id)
+
+def get_inference_config(model_id, s3_uri, model_params=MODEL_PARAMS, precomputed=False):
+    if precomputed:
+        # Bring-your-own-inference: Bedrock scores the responses in the dataset instead of regenerating them
+        return {
+            "precomputedInferenceSource": {
+                "inferenceSourceIdentifier": get_inference_source_identifier(model_id)
+            }
+        }
+    return {
+        "bedrockModel": {
+            "modelIdentifier": model_id,
+            "inferenceParams": json.dumps({
+                "maxTokens": model_params['max_tokens'],
+                "temperature": model_params['temperature'],
+                "topP": model_params['top_p'],
+                "stopSequences": model_params['stop_sequences']
+            })
+        }
+    }
+
+def get_supported_metrics(model_id):
+    # Define supported metrics for each model family
+    metrics = {
+        "anthropic": ["Builtin.Accuracy", "Builtin.Robustness", "Builtin.Toxicity"],
+        "amazon": ["Builtin.Accuracy", "Builtin.Robustness", "Builtin.Toxicity"],
+        "cohere": ["Builtin.Accuracy", "Builtin.Robustness"],
+        "ai21": ["Builtin.Accuracy", "Builtin.Robustness"],
+        "meta": ["Builtin.Accuracy", "Builtin.Robustness"],
+        "mistral": ["Builtin.Accuracy", "Builtin.Robustness"]
+    }
+    
+    for family, supported_metrics in metrics.items():
+        if model_id.startswith(family):
+            return supported_metrics
+    
+    return ["Builtin.Accuracy", "Builtin.Robustness"]
+
+def generate_summary(model_id, user_context, model_params=MODEL_PARAMS, use_cache=True, instruction=SUMMARY_INSTRUCTION, hedge=False, meter=None):
+    template = f"{instruction}{user_context}"
+    
+    with timing.span('get_model_config', model_id):
+        body = get_model_config(model_id, template, model_params)
+
+    # The rendered body already carries the prompt and every inference parameter
+    cache_key = cache.make_key('generation', model_id, body)
+    if use_cache:
+        cached = generation_cache.get(cache_key)
+        if cached is not None:
+            if meter:
+                meter.record_cached()
+            return cached
+
+    reserved = estimate_tokens(body, model_params['max_tokens'])
+
+    def read(response, started):
+        return json.loads(response.get('body').read()), invocation_usage(response), (time.perf_counter() - started) * 1000
+
+    def invoke(target_id):
+        # A hedge loser that still finishes is billed, so every completed call is recorded
+        (response_body, (input_tokens, output_tokens, latency_ms), elapsed_ms), taken = invoke_limited(
+            bedrock_runtime.invoke_model, target_id, body, reserved, read
+        )
+        rate_limiter.settle(target_id, taken, used_tokens(input_tokens, output_tokens))
+        if meter:
+            meter.record(input_tokens, output_tokens, latency_ms if latency_ms is not None else elapsed_ms, extract_stop_reason(model_id, response_body))
+        return response_body, elapsed_ms / 1000
+
+    response_body = hedger.call(model_id, invoke) if hedge else invoke(model_id)[0]
+
+    response_text = extract_response(model_id, response_body)
+    if use_cache:
+        generation_cache.put(cache_key, response_text)
+    return response_text
+
+def generate_summary_streaming(model_id, user_context, model_params=MODEL_PARAMS, use_cache=True, instruction=SUMMARY_INSTRUCTION, meter=None):
+    if not supports_streaming(model_id):
+        started = time.perf_counter()
+        response_text = generate_summary(model_id, user_context, model_params, False, instruction, meter=meter)
+        return response_text, measure_latency(started, [], time.perf_counter(), {})
+
+    with timing.span('get_model_config', model_id):
+        body = get_model_config(model_id, f"{instruction}{user_context}", model_params)
+
+    # Latency is only meaningful for a real call, so streaming never reads the cache, it only fills it
+    response_text, latency = stream_model(model_id, body, model_params['max_tokens'], meter)
+    if use_cache:
+        generation_cache.put(cache.make_key('generation', model_id, body), response_text)
+    return response_text, latency
+
+def summarize_long_document(model_id, user_context, model_params=MODEL_PARAMS, use_cache=True, chunking_config=None, hedge=False, meter=None):
+    chunking_config = chunking_config or {}
+    reduce_model_id = chunking_config.get("ReduceModel") or model_id
+    chunk_tokens = chunking_config.get("ChunkTokens")
+
+    chunks = chunking.split_text(user_context, chunking.get_chunk_budget(model_id, model_params['max_tokens'], chunk_tokens))
+    if len(chunks) == 1:
+        return generate_summary(model_id, user_context, model_params, use_cache, hedge=hedge, meter=meter)
+
+    # Chunk summaries are cached under the map model alone, so swapping the reduce model reuses them
+    with ThreadPoolExecutor(max_workers=SHARD_CONCURRENCY) as executor:
+        summaries = list(executor.map(
+            lambda chunk: generate_summary(model_id, chunk, model_params, use_cache, hedge=hedge, meter=meter),
+            chunks
+        ))
+
+        reduce_budget = chunking.get_chunk_budget(reduce_model_id, model_params['max_tokens'], chunk_tokens)
+        while True:
+            groups = chunking.pack(summaries, reduce_budget)
+            # Stop when everything fits in one request, or when packing no longer shrinks the level
+            if len(groups) == 1 or len(groups) == len(summaries):
+                break
+            summaries = list(executor.map(
+                lambda group: generate_summary(reduce_model_id, group, model_params, use_cache, REDUCE_INSTRUCTION, hedge, meter),
+                groups
+            ))
+
+    return generate_summary(reduce_model_id, "\n\n".join(summaries), model_params, use_cache, REDUCE_INSTRUCTION, hedge, meter)
+
+def summarize_document(model_id, user_context, model_params=MODEL_PARAMS, use_cache=True, chunking_config=None, streaming=False, hedge=False, meter=None):
+    if chunking_config and chunking_config.get("Enabled"):
+        return summarize_long_document(model_id, user_context, model_params, use_cache, chunking_config, hedge, meter), {}
+    if streaming:
+        # Streams report their own latency, which a duplicate call would muddle, so they are never hedged
+        return generate_summary_streaming(model_id, user_context, model_params, use_cache, meter=meter)
+    return generate_summary(model_id, user_context, model_params, use_cache, hedge=hedge, meter=meter), {}
+
+def build_dataset_record(user_context, response_text, category, model_id=None, reference=None, precomputed=False):
+    if not precomputed:
+        return {
+            "prompt": user_context,
+            "referenceResponse": response_text,
+            "category": category
+        }
+    
+    record = {
+        "prompt": user_context,
+        "category": category,
+        "modelResponses": [
+            {
+                "response": response_text,
+                "modelIdentifier": get_inference_source_identifier(model_id)
+            }
+        ]
+    }
+    if reference:
+        record["referenceResponse"] = reference
+    return record
+
+def serialize_dataset(records):
+    return "".join(json.dumps(record) + "\n" for record in records)
+
+def write_dataset(key, records):
+    jsonl_content = serialize_dataset(records)
+    
+    with timing.span('put_dataset'):
+        s3_client.put_object(
+            Bucket=INPUT_BUCKET,
+            Key=key,
+            Body=jsonl_content
+        )
+
+    return f"s3://{INPUT_BUCKET}/{key}"
+
+def get_evaluation_cache_key(model_id, dataset_digest, model_params=MODEL_PARAMS, precomputed=False, has_reference=True):
+    return cache.make_key(
+        'evaluation', model_id, dataset_digest,
+        get_inference_config(model_id, None, model_params, precomputed),
+        get_evaluation_metrics(model_id, precomputed, has_reference)
+    )
+
+def find_cached_evaluation(cache_key):
+    job_arn = generation_cache.get(cache_key)
+    if job_arn is None:
+        return None
+    try:
+        with timing.span('get_evaluation_job'):
+            status = bedrock_client.get_evaluation_job(jobIdentifier=job_arn)['status']
+    except ClientError as e:
+        print(f"Error checking cached evaluation job: {e.response['Error']['Message']}")
+        return None
+    # Only finished jobs can be reused; anything else falls back to a fresh job
+    return job_arn if status == 'Completed' else None
+
+def get_evaluation_metrics(model_id, precomputed=False, has_reference=True):
+    supported_metrics = get_supported_metrics(model_id)
+    if precomputed and not has_reference:
+        # Without a ground-truth summary there is nothing to measure accuracy against
+        supported_metrics = [metric for metric in supported_metrics if metric != "Builtin.Accuracy"]
+    return supported_metrics
+
+def start_evaluation_job(run_id, model_key, model_id, s3_uri, model_params=MODEL_PARAMS, precomputed=False, has_reference=True):
+    job_name = f"summ-eval-{str(uuid.uuid4())[:8]}"
+    role_arn = os.environ['ROLE_ARN']
+    
+    supported_metrics = get_evaluation_metrics(model_id, precomputed, has_reference)
+    
+    evaluation_config = {
+        "automated": {
+            "datasetMetricConfigs": [
+                {
+                    "taskType": "Summarization",
+                    "dataset": {
+                        "name": "CustomDataset",
+                        "datasetLocation": {
+                            "s3Uri": s3_uri
+                        }
+                    },
+                    "metricNames": supported_metrics
+                }
+            ]
+        }
+    }
+
+    inference_config = {
+        "models": [get_inference_config(model_id, s3_uri, model_params, precomputed)]
+    }
+
+    output_data_config = {
+        "s3Uri": f"s3://outputs-data-directory/{run_id}_{model_key}/"
+    }
+
+    with timing.span('create_evaluation_job', model_id):
+        response = bedrock_client.create_evaluation_job(
+            jobName=job_name,
+            roleArn=role_arn,
+            evaluationConfig=evaluation_config,
+            inferenceConfig=inference_config,
+            outputDataConfig=output_data_config
+        )
+    return response['jobArn']
+
+def submit_evaluation_job(run_id, model_key, model_id, s3_uri, model_params=MODEL_PARAMS, precomputed=False, has_reference=True):
+    # None means no slot was free or Bedrock pushed back on quota, and the submission should wait.
+    # The slot is taken here, right before the call, so nothing the caller does first can strand it.
+    if not admission.acquire():
+        return None
+    try:
+        job_arn = start_evaluation_job(
+            run_id, model_key, model_id, s3_uri, model_params,
+            precomputed=precomputed, has_reference=has_reference
+        )
+    except Exception as e:
+        admission.release()
+        if isinstance(e, ClientError) and admission.is_quota_error(e):
+            print(f"Evaluation job quota reached: {e.response['Error']['Message']}")
+            return None
+        raise
+    try:
+        admission.hold(job_arn)
+    except ClientError:
+        # Without a holder item reclaim_slots could never free this slot
+        admission.release()
+        raise
+    return job_arn
+
+def reclaim_slots():
+    # A job whose completion was never observed would hold its slot forever
+    reclaimed = 0
+    for job_arn in admission.holders():
+        with timing.span('get_evaluation_job'):
+            status = bedrock_client.get_evaluation_job(jobIdentifier=job_arn)['status']
+        if status in ('Completed', 'Failed', 'Stopped') and admission.release(job_arn):
+            reclaimed += 1
+    return reclaimed
+
+def admit_submission(entry):
+    submission = entry['Submission']
+    run_id, model_key = submission['RunID'], submission['Model']
+    try:
+        job_arn = submit_evaluation_job(
+            run_id, model_key, submission['ModelId'], submission['S3Uri'], submission['ModelParams'],
+            precomputed=submission['Precomputed'], has_reference=submission['HasReference']
+        )
+    except Exception as e:
+        print(f"ERROR: {str(e)}")
+        update_run_status(run_id, "Failed")
+        stepfunctions.send_task_failure(
+            taskToken=submission['TaskToken'],
+            error='EvaluationJobCreationFailed',
+            cause=str(e)[:256]
+        )
+        admission.remove(entry)
+        return {'RunID': run_id, 'Model': model_key, 'Error': str(e)}
+    if job_arn is None:
+        return None
+    
+    if submission.get('EvaluationKey'):
+        generation_cache.put(submission['EvaluationKey'], job_arn)
+    part = submission.get('Part')
+    register_job_callback(job_arn, run_id, model_key, submission['TaskToken'], part)
+    waited = round(time.time() - entry['QueuedAt'], 3)
+    target = {'UpdateExpression': "SET ARN = :arn, AdmissionWaitSeconds = :waited"}
+    if part is not None:
+        target = {'UpdateExpression': "SET PartJobs.#part = :arn, AdmissionWaitSeconds = :waited", 'ExpressionAttributeNames': {'#part': str(part)}}
+    try:
+        model_result_table.update_item(
+            Key={'RunID': run_id, 'SK': run_table.model_sk(model_key)},
+            ExpressionAttributeValues={
+                ':arn': job_arn,
+                ':waited': to_dynamodb(waited)
+            },
+            **target
+        )
+    except ClientError as e:
+        print(f"Error recording admitted job {job_arn}: {e.response['Error']['Message']}")
+        raise
+    admission.remove(entry)
+    return {'RunID': run_id, 'Model': model_key, 'JobArn': job_arn, 'WaitSeconds': waited}
+
+def admit_pending():
+    admitted = []
+    reclaimed = False
+    # Classes drain in priority order, each first-in, first-out, until the slots or the quota run out
+    for priority in admission.PRIORITIES:
+        for entry in admission.pending(priority):
+            if not admission.claim(entry):
+                # An overlapping drain is already submitting it
+                continue
+            try:
+                job = admit_submission(entry)
+                if job is None and not reclaimed:
+                    reclaimed = True
+                    job = admit_submission(entry) if reclaim_slots() else None
+            except Exception:
+                admission.unclaim(entry)
+                raise
+            if job is None:
+                admission.unclaim(entry)
+                return admitted
+            admitted.append(job)
+    return admitted
+
+def drain_pending(event):
+    admitted = admit_pending() if admission.enabled() else []
+    jobs = coalesce_pending(event)['Jobs'] if PENDING_EVALUATION_TABLE else []
+    queue = admission.stats()
+    print(f"Admission queue: {json.dumps(queue)}")
+    return {'Admitted': admitted, 'Jobs': jobs, 'Queue': queue}
+
+def get_coalesce_group(model_id, model_params=MODEL_PARAMS, precomputed=False, has_reference=True):
+    # Records can share a job when the model, inference settings and metric set all match
+    return cache.make_key(
+        'coalesce', model_id,
+        get_inference_config(model_id, None, model_params, precomputed),
+        get_evaluation_metrics(model_id, precomputed, has_reference)
+    )
+
+def enqueue_evaluation(group_key, run_id, model_key, model_id, model_params, precomputed, has_reference, dataset_key, task_token):
+    try:
+        dynamodb.Table(PENDING_EVALUATION_TABLE).put_item(
+            Item={
+                'GroupKey': group_key,
+                'Member': f"{run_id}#{model_key}",
+                'RunID': run_id,
+                'ModelKey': model_key,
+                'ModelId': model_id,
+                'ModelParams': json.dumps(model_params),
+                'Precomputed': precomputed,
+                'HasReference': has_reference,
+                'DatasetKey': dataset_key,
+                'TaskToken': task_token,
+                'QueuedAt': int(time.time()),
+                'ExpiresAt': int(time.time()) + CALLBACK_TTL_SECONDS
+            }
+        )
+    except ClientError as e:
+        print(f"Error queueing evaluation: {e.response['Error']['Message']}")
+        raise
+
+def read_pending_groups():
+    groups = {}
+    scan = {}
+    while True:
+        response = dynamodb.Table(PENDING_EVALUATION_TABLE).scan(**scan)
+        for item in response.get('Items', []):
+            groups.setdefault(item['GroupKey'], []).append(item)
+        if 'LastEvaluatedKey' not in response:
+            return groups
+        scan['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def claim_pending(member):
+    # Overlapping scheduled runs would otherwise both put the same record into a job
+    now = int(time.time())
+    try:
+        dynamodb.Table(PENDING_EVALUATION_TABLE).update_item(
+            Key={'GroupKey': member['GroupKey'], 'Member': member['Member']},
+            UpdateExpression="SET LeasedUntil = :until",
+            ConditionExpression="attribute_exists(GroupKey) AND (attribute_not_exists(LeasedUntil) OR LeasedUntil < :now)",
+            ExpressionAttributeValues={':until': now + admission.LEASE_SECONDS, ':now': now}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        print(f"Error claiming queued evaluation: {e.response['Error']['Message']}")
+        raise
+
+def release_pending(members):
+    try:
+        for member in members:
+            dynamodb.Table(PENDING_EVALUATION_TABLE).update_item(
+                Key={'GroupKey': member['GroupKey'], 'Member': member['Member']},
+                UpdateExpression="REMOVE LeasedUntil",
+                ConditionExpression="attribute_exists(GroupKey)"
+            )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            print(f"Error releasing queued evaluation: {e.response['Error']['Message']}")
+            raise
+
+def start_coalesced_job(members):
+    batch_id = str(uuid.uuid4())
+    # Identical records from different runs are scored once and routed to every run that asked
+    lines = {}
+    routes = {}
+    member_keys = []
+    for member in members:
+        body = s3_client.get_object(Bucket=INPUT_BUCKET, Key=member['DatasetKey'])['Body'].read().decode('utf-8')
+        record_keys = []
+        for line in body.splitlines():
+            record_key = run_table.record_key(json.loads(line))
+            lines.setdefault(record_key, line)
+            routes.setdefault(record_key, []).append({'RunID': member['RunID'], 'Model': member['ModelKey']})
+            record_keys.append(record_key)
+        member_keys.append(record_keys)
+    
+    first = members[0]
+    dataset_key = f"coalesced/{batch_id}.jsonl"
+    manifest_key = f"coalesced/{batch_id}.manifest.json"
+    s3_client.put_object(Bucket=INPUT_BUCKET, Key=dataset_key, Body="".join(line + "\n" for line in lines.values()))
+    s3_client.put_object(
+        Bucket=INPUT_BUCKET,
+        Key=manifest_key,
+        Body=json.dumps({
+            'Records': routes,
+            'Members': [{'RunID': m['RunID'], 'Model': m['ModelKey'], 'TaskToken': m['TaskToken']} for m in members]
+        })
+    )
+    
+    job_arn = submit_evaluation_job(
+        'coalesced', batch_id, first['ModelId'], f"s3://{INPUT_BUCKET}/{dataset_key}", json.loads(first['ModelParams']),
+        precomputed=first['Precomputed'], has_reference=first['HasReference']
+    )
+    if job_arn is None:
+        return None
+    
+    try:
+        dynamodb.Table(JOB_CALLBACK_TABLE).put_item(
+            Item={
+                'JobArn': job_arn,
+                'Manifest': {'Bucket': INPUT_BUCKET, 'Key': manifest_key},
+                'ExpiresAt': int(time.time()) + CALLBACK_TTL_SECONDS
+            }
+        )
+        # Each member points at the shared job so the polling fallback can still find its own records
+        for member, record_keys in zip(members, member_keys):
+            model_result_table.update_item(
+                Key={'RunID': member['RunID'], 'SK': run_table.model_sk(member['ModelKey'])},
+                UpdateExpression="SET ARN = :arn, RecordKeys = :record_keys",
+                ExpressionAttributeValues={
+                    ':arn': job_arn,
+                    ':record_keys': record_keys
+                }
+            )
+        with dynamodb.Table(PENDING_EVALUATION_TABLE).batch_writer() as batch:
+            for member in members:
+                batch.delete_item(Key={'GroupKey': member['GroupKey'], 'Member': member['Member']})
+    except ClientError as e:
+        print(f"Error recording coalesced job {job_arn}: {e.response['Error']['Message']}")
+        raise
+    
+    return {'JobArn': job_arn, 'Members': len(members), 'Records': len(lines)}
+
+def coalesce_pending(event):
+    now = time.time()
+    batches = []
+    for group_key, members in read_pending_groups().items():
+        members.sort(key=lambda member: member['QueuedAt'])
+        # A group waits out its window unless it already fills a job
+        if len(members) < COALESCE_MAX_RECORDS and now - int(members[0]['QueuedAt']) < COALESCE_WINDOW_SECONDS:
+            continue
+        batches.extend(members[start:start + COALESCE_MAX_RECORDS] for start in range(0, len(members), COALESCE_MAX_RECORDS))
+    
+    jobs = []
+    for batch in batches:
+        claimed = [member for member in batch if claim_pending(member)]
+        if not claimed:
+            continue
+        try:
+            job = start_coalesced_job(claimed)
+        except Exception:
+            release_pending(claimed)
+            raise
+        # Batches that find no free slot stay queued for the next run
+        if job is None:
+            release_pending(claimed)
+            break
+        jobs.append(job)
+    
+    print(f"Coalesced evaluation jobs: {json.dumps(jobs)}")
+    return {'Jobs': jobs}
+
+def get_shard_prefix(run_id, model_key):
+    return f"{run_id}/{model_key}/shards/"
+
+def get_metrics_prefix(run_id, model_key):
+    return f"{run_id}/{model_key}/metrics/"
+
+def read_parts(prefix):
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=INPUT_BUCKET, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            yield s3_client.get_object(Bucket=INPUT_BUCKET, Key=obj['Key'])['Body'].read()
+
+def aggregate_bulk_metrics(run_id, model_key):
+    scores = [
+        json.loads(line)
+        for body in read_parts(get_metrics_prefix(run_id, model_key))
+        for line in body.decode('utf-8').splitlines() if line
+    ]
+    # Usage is summed across documents while every other field is averaged
+    document_usage = [score.pop('Usage') for score in scores if 'Usage' in score]
+    return len(scores), metrics.mean_scores(scores), usage.merge(document_usage)
+
+def to_dynamodb(value):
+    # Values read back from the table are already Decimals
+    return json.loads(json.dumps(value, default=float), parse_float=Decimal)
+
+def summarize_shard(event):
+    batch_input = event.get("BatchInput", {})
+    run_id = batch_input["RunID"]
+    models = batch_input["Models"]
+    text_field = batch_input.get("TextField", "Context")
+    reference_field = batch_input.get("ReferenceField", "Reference")
+    default_category = batch_input.get("Category", "default_category")
+    model_params = {**MODEL_PARAMS, **batch_input.get("ModelParams", {})}
+    precomputed = batch_input.get("EvaluationMode") == "precomputed"
+    local_only = batch_input.get("EvaluationMode") == "local"
+    use_cache = batch_input.get("UseCache", True)
+    chunking_config = batch_input.get("Chunking", {})
+    streaming = batch_input.get("Streaming", False)
+
+    documents = []
+    for item in event["Items"]:
+        if isinstance(item, dict):
+            documents.append((item.get(text_field, ""), item.get("category", default_category), item.get(reference_field)))
+        else:
+            documents.append((str(item), default_category, None))
+
+    # Shard IDs are derived from the content so a retried shard overwrites its own part
+    shard_id = hashlib.sha256("\n".join(text for text, _, _ in documents).encode('utf-8')).hexdigest()[:16]
+
+    work = [
+        (model_index, doc_index)
+        for model_index in range(len(models))
+        for doc_index in range(len(documents))
+    ]
+
+    def summarize(task):
+        model_index, doc_index = task
+        meter = usage.UsageMeter()
+        response_text, latency = summarize_document(models[model_index], documents[doc_index][0], model_params, use_cache, chunking_config, streaming, meter=meter)
+        return response_text, latency, meter.summary()
+
+    with ThreadPoolExecutor(max_workers=SHARD_CONCURRENCY) as executor:
+        summaries, latencies, usages = zip(*executor.map(summarize, work))
+
+    texts = [text for text, _, _ in documents]
+    references = [reference or "" for _, _, reference in documents]
+    for model_index, model_id in enumerate(models):
+        model_key = f"model{model_index + 1}"
+        model_summaries = summaries[model_index * len(documents):(model_index + 1) * len(documents)]
+        
+        if not local_only:
+            model_records = [
+                build_dataset_record(text, summary, category, model_id, reference, precomputed)
+                for (text, category, reference), summary in zip(documents, model_summaries)
+            ]
+            write_dataset(f"{get_shard_prefix(run_id, model_key)}{shard_id}.jsonl", model_records)
+        
+        scores = metrics.score_summaries(model_summaries, texts, references if any(references) else None)
+        # Latency rides along in the metrics parts so the bulk branch averages it with the scores
+        model_latencies = latencies[model_index * len(documents):(model_index + 1) * len(documents)]
+        model_usages = usages[model_index * len(documents):(model_index + 1) * len(documents)]
+        scores = [
+            {**score, **latency, 'Usage': document_usage}
+            for score, latency, document_usage in zip(scores, model_latencies, model_usages)
+        ]
+        write_dataset(f"{get_metrics_prefix(run_id, model_key)}{shard_id}.jsonl", scores)
+
+    log_invocation_stats()
+    return {'ShardID': shard_id, 'Documents': len(documents), 'ConcurrencyLimits': concurrency_limiter.stats()['limits']}
+
+def bulk_dataset_key(run_id, model_key, part):
+    # The first part keeps the unsplit name, so a dataset that fits one job looks as it always has
+    suffix = f".part{part:04d}" if part else ""
+    return f"{run_id}_{model_key}{suffix}.jsonl"
+
+def assemble_bulk_dataset(run_id, model_key):
+    # An evaluation job takes at most COALESCE_MAX_RECORDS records, so a larger dataset becomes one part per job
+    s3_uris = []
+    documents = 0
+    references = 0
+    digest = hashlib.sha256()
+    upload = None
+    try:
+        with timing.span('put_dataset'):
+            for body in read_parts(get_shard_prefix(run_id, model_key)):
+                for line in body.splitlines(keepends=True):
+                    if not line.strip():
+                        continue
+                    if not line.endswith(b"\n"):
+                        line += b"\n"
+                    if documents % COALESCE_MAX_RECORDS == 0:
+                        if upload:
+                            upload.close()
+                            upload = None
+                        key = bulk_dataset_key(run_id, model_key, len(s3_uris))
+                        upload = uploads.MultipartUpload(s3_client, INPUT_BUCKET, key)
+                        s3_uris.append(f"s3://{INPUT_BUCKET}/{key}")
+                    upload.write(line)
+                    digest.update(line)
+                    documents += 1
+                    references += b'"referenceResponse"' in line
+            if upload:
+                upload.close()
+    except Exception:
+        if upload:
+            upload.abort()
+        raise
+
+    if not s3_uris:
+        raise Exception(f"No summarized shards found for {run_id}/{model_key}")
+
+    return s3_uris, documents, references > 0, digest.hexdigest()
+
+def submit_bulk_parts(run_id, model_key, model_id, s3_uris, model_params, precomputed, has_reference, priority):
+    part_jobs = {}
+    deferred = []
+    for part, s3_uri in enumerate(s3_uris):
+        job_arn = None
+        # Once one part has to wait, the rest queue behind it rather than jump ahead of other work
+        if not deferred and not admission.waiting(priority):
+            job_arn = submit_evaluation_job(
+                run_id, model_key, model_id, s3_uri, model_params,
+                precomputed=precomputed, has_reference=has_reference
+            )
+        if job_arn:
+            part_jobs[str(part)] = job_arn
+        else:
+            deferred.append(part)
+    return part_jobs, deferred
+
+def store_context(user_context, context_ref=None):
+    # Tables keep a preview; once the text passes the offload threshold the full copy lives in S3
+    if context_ref:
+        return context_store.preview(user_context), context_ref
+    return context_store.offload(user_context)
+
+def offload_context(event):
+    context_ref = event.get("ContextRef") or None
+    preview, context_ref = store_context(context_store.resolve(event.get("Context", ""), context_ref), context_ref)
+    return {'Context': preview, 'ContextRef': context_ref or {}}
+
+def save_run(run_id, model_items, user_context, context_ref, model_count):
+    # Each model lands in its own small item, so parallel branches never contend on one row
+    stored_context, context_ref = store_context(user_context, context_ref)
+    try:
+        with timing.span('save_run'):
+            for model_key, model_data in model_items.items():
+                save_model_item(run_id, model_key, model_data)
+            model_result_table.update_item(
+                Key={'RunID': run_id, 'SK': run_table.META},
+                UpdateExpression=(
+                    "SET Context = :context, ContextRef = :context_ref, ModelCount = :count, "
+                    "ListPartition = :partition, CreatedAt = if_not_exists(CreatedAt, :now)"
+                ),
+                ExpressionAttributeValues={
+                    ':context': stored_context,
+                    ':context_ref': context_ref,
+                    ':count': model_count,
+                    ':partition': run_table.LIST_PARTITION,
+                    ':now': run_table.utc_now()
+                }
+            )
+    except ClientError as e:
+        print(f"Error saving run results: {e.response['Error']['Message']}")
+        raise
+
+def save_model_item(run_id, model_key, model_data):
+    # An update rather than a put: the branch rewriting a fan-out item keeps what the stream consumers marked on it
+    attributes = {'ModelKey': model_key, 'SchemaVersion': run_table.SCHEMA_VERSION, **model_data}
+    model_result_table.update_item(
+        Key={'RunID': run_id, 'SK': run_table.model_sk(model_key)},
+        UpdateExpression=f"SET {', '.join(f'#a{index} = :a{index}' for index in range(len(attributes)))}",
+        ExpressionAttributeNames={f"#a{index}": name for index, name in enumerate(attributes)},
+        ExpressionAttributeValues={f":a{index}": value for index, value in enumerate(attributes.values())}
+    )
+
+def get_model_timeout(model_id, model_timeouts):
+    return float(model_timeouts.get(model_id, MODEL_TIMEOUT_SECONDS))
+
+def generate_all(event):
+    run_id = event["RunID"]
+    models = event["Models"]
+    context_ref = event.get("ContextRef") or None
+    user_context = context_store.resolve(event.get("Context", "Default context"), context_ref)
+    reference = event.get("Reference")
+    model_params = {**MODEL_PARAMS, **event.get("ModelParams", {})}
+    evaluation_mode = event.get("EvaluationMode", "model")
+    use_cache = event.get("UseCache", True)
+    chunking_config = event.get("Chunking", {})
+    streaming = event.get("Streaming", False)
+    hedge = event.get("Hedge", False)
+    model_timeouts = event.get("ModelTimeouts", {})
+    category = event.get("Category", "default_category")
+
+    if not models:
+        return {'RunID': run_id, 'Generated': [], 'Failed': {}}
+
+    # Not a context manager: leaving the with-block would wait on models that already timed out
+    executor = ThreadPoolExecutor(max_workers=min(len(models), FANOUT_CONCURRENCY))
+    started = time.monotonic()
+    meters = [usage.UsageMeter() for _ in models]
+    futures = [
+        executor.submit(summarize_document, model_id, user_context, model_params, use_cache, chunking_config, streaming, hedge, meter)
+        for model_id, meter in zip(models, meters)
+    ]
+
+    summaries = {}
+    failed = {}
+    for model_index, (model_id, future, meter) in enumerate(zip(models, futures, meters)):
+        model_key = f"model{model_index + 1}"
+        timeout = get_model_timeout(model_id, model_timeouts)
+        try:
+            response_text, latency = future.result(timeout=max(timeout - (time.monotonic() - started), 0))
+        except FutureTimeoutError:
+            failed[model_key] = f"Timed out after {timeout}s"
+            continue
+        except Exception as e:
+            failed[model_key] = str(e)[:256]
+            continue
+        summaries[model_key] = {'ModelId': model_id, 'Summary': response_text, 'Latency': latency, 'Usage': meter.summary()}
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    if summaries:
+        # One batch for every model instead of one write per branch
+        model_items = {
+            model_key: to_dynamodb({
+                'ModelName': generated['ModelId'],
+                'EvaluationMode': evaluation_mode,
+                'Category': category,
+                'Summary': generated['Summary'],
+                'LocalMetrics': metrics.score_summary(generated['Summary'], user_context, reference),
+                'Usage': generated['Usage'],
+                **({'Latency': generated['Latency']} if generated['Latency'] else {})
+            })
+            for model_key, generated in summaries.items()
+        }
+        save_run(run_id, model_items, user_context, context_ref, len(models))
+
+    for model_key, error in failed.items():
+        print(f"Fan-out generation failed for {model_key}: {error}")
+
+    # Models that failed here are left out, so their branch generates on its own; the rest read their MODEL# item
+    return {'RunID': run_id, 'Generated': sorted(summaries), 'Failed': failed}
+
+def load_pregenerated(run_id, model_key, model_id):
+    try:
+        item = model_result_table.get_item(
+            Key={'RunID': run_id, 'SK': run_table.model_sk(model_key)},
+            ConsistentRead=True
+        ).get('Item')
+    except ClientError as e:
+        print(f"Error reading pregenerated summary: {e.response['Error']['Message']}")
+        raise
+    if not item or item.get('ModelName') != model_id or 'Summary' not in item:
+        return None
+    return item
+
+def lambda_handler(event, context):
+    if event.get("source") == "aws.events":
+        return drain_pending(event)
+    if "Items" in event:
+        return summarize_shard(event)
+    if event.get("FanOut"):
+        return generate_all(event)
+    if event.get("Offload"):
+        return offload_context(event)
+
+    context_ref = event.get("ContextRef") or None
+    user_context = context_store.resolve(event.get("Context", "Default context"), context_ref)
+    run_id = event.get("RunID", str(uuid.uuid4()))
+    eval_model = event.get("eval_model", "anthropic.claude-3-sonnet-20240229-v1:0")
+    model_key = event.get("ModelKey", "model1")
+    model_id = event.get("ModelId")
+    model_count = int(event.get("ModelCount", 1))
+    
+    if model_id is None:
+        raise ValueError(f"Model ID not provided in the event for key: {model_key}")
+        
+    category = event.get("Category", "default_category")
+    reference = event.get("Reference")
+    task_token = event.get("TaskToken")
+    model_params = {**MODEL_PARAMS, **event.get("ModelParams", {})}
+    evaluation_mode = event.get("EvaluationMode", "model")
+    precomputed = evaluation_mode == "precomputed"
+    local_only = evaluation_mode == "local"
+    use_cache = event.get("UseCache", True)
+    chunking_config = event.get("Chunking", {})
+    streaming = event.get("Streaming", False)
+    hedge = event.get("Hedge", False)
+    pregenerated = event.get("Pregenerated")
+    coalesce = event.get("Coalesce", False) and bool(PENDING_EVALUATION_TABLE)
+    priority = 'bulk' if event.get("Bulk") else 'interactive'
+
+    try:
+        update_run_status(run_id, "Running")
+        
+        model_data = {'ModelName': model_id, 'EvaluationMode': evaluation_mode, 'Category': category}
+        
+        if event.get("Bulk"):
+            dataset = event.get("Dataset", {})
+            user_context = f"s3://{dataset.get('Bucket')}/{dataset.get('Key')}"
+            documents, local_metrics, run_usage = aggregate_bulk_metrics(run_id, model_key)
+            model_data['Documents'] = documents
+            model_data['Usage'] = to_dynamodb(run_usage)
+            latency = {field: local_metrics.pop(field) for field in LATENCY_FIELDS if field in local_metrics}
+            if latency:
+                model_data['Latency'] = to_dynamodb(latency)
+            if not local_only:
+                s3_uris, _, has_reference, dataset_digest = assemble_bulk_dataset(run_id, model_key)
+                s3_uri = s3_uris[0]
+        else:
+            generated = load_pregenerated(run_id, model_key, model_id) if pregenerated else None
+            if generated:
+                response_text, latency = generated['Summary'], generated.get('Latency')
+                run_usage = generated.get('Usage') or usage.empty()
+            else:
+                meter = usage.UsageMeter()
+                response_text, latency = summarize_document(model_id, user_context, model_params, use_cache, chunking_config, streaming, hedge, meter)
+                run_usage = meter.summary()
+            model_data['Usage'] = to_dynamodb(run_usage)
+            if latency:
+                model_data['Latency'] = to_dynamodb(latency)
+            local_metrics = metrics.score_summary(response_text, user_context, reference)
+            model_data['Summary'] = response_text
+            has_reference = bool(reference)
+            if not local_only:
+                records = [build_dataset_record(user_context, response_text, category, model_id, reference, precomputed)]
+                s3_uri = write_dataset(f"{run_id}_{model_key}.jsonl", records)
+                dataset_digest = hashlib.sha256(serialize_dataset(records).encode('utf-8')).hexdigest()
+        
+        model_data['LocalMetrics'] = to_dynamodb(local_metrics)
+
+        cached_job = False
+        queued = False
+        deferred = False
+        split = bool(event.get("Bulk")) and not local_only and len(s3_uris) > 1
+        if not local_only:
+            evaluation_key = get_evaluation_cache_key(model_id, dataset_digest, model_params, precomputed, has_reference)
+            # The cache maps a dataset to one job, so a split dataset is always evaluated afresh
+            job_arn = find_cached_evaluation(evaluation_key) if use_cache and not split else None
+            if job_arn:
+                cached_job = True
+            elif split:
+                # One job per part; check_status resumes the branch once every part has been scored
+                part_jobs, deferred_parts = submit_bulk_parts(
+                    run_id, model_key, model_id, s3_uris, model_params, precomputed, has_reference, priority
+                )
+                deferred = bool(deferred_parts)
+                if deferred and not task_token:
+                    raise Exception("No evaluation job slot is free and there is no task token to wait on")
+                model_data.update(Parts=len(s3_uris), PartJobs=part_jobs, PartResults={})
+            elif coalesce and task_token and not event.get("Bulk"):
+                # The scheduled coalescer starts one job for every record queued in the window
+                queued = True
+            else:
+                # Freed slots go to queued work first; a fresh submission only skips the queue when it is empty
+                if not admission.waiting(priority):
+                    job_arn = submit_evaluation_job(
+                        run_id, model_key, model_id, s3_uri, model_params,
+                        precomputed=precomputed, has_reference=has_reference
+                    )
+                # Queued work ahead, no free slot or Bedrock pushed back: the scheduled drain submits it in turn
+                deferred = job_arn is None
+                if deferred and not task_token:
+                    raise Exception("No evaluation job slot is free and there is no task token to wait on")
+                if use_cache and job_arn:
+                    generation_cache.put(evaluation_key, job_arn)
+            if job_arn:
+                model_data['ARN'] = job_arn
+            model_data['CachedEvaluation'] = cached_job
+
+        save_run(run_id, {model_key: model_data}, user_context, context_ref, model_count)
+
+        if local_only:
+            # Cheap metrics only: no Bedrock evaluation job, so the branch completes immediately
+            result = {
+                'statusCode': 200,
+                'body': json.dumps({'status': 'Completed', 'RunID': run_id, 'Model': model_key, 'results': local_metrics})
+            }
+            if task_token:
+                stepfunctions.send_task_success(taskToken=task_token, output=json.dumps(result))
+            return result
+
+        log_invocation_stats()
+
+        if split and task_token:
+            for part, part_job in part_jobs.items():
+                register_job_callback(part_job, run_id, model_key, task_token, int(part))
+
+        if queued:
+            enqueue_evaluation(
+                get_coalesce_group(model_id, model_params, precomputed, has_reference),
+                run_id, model_key, model_id, model_params, precomputed, has_reference, f"{run_id}_{model_key}.jsonl", task_token
+            )
+        elif deferred and split:
+            for part in deferred_parts:
+                admission.enqueue(priority, f"{run_id}#{model_key}#{part}", {
+                    'RunID': run_id,
+                    'Model': model_key,
+                    'ModelId': model_id,
+                    'ModelParams': model_params,
+                    'Precomputed': precomputed,
+                    'HasReference': has_reference,
+                    'S3Uri': s3_uris[part],
+                    'TaskToken': task_token,
+                    'Part': part
+                })
+        elif deferred:
+            admission.enqueue(priority, f"{run_id}#{model_key}", {
+                'RunID': run_id,
+                'Model': model_key,
+                'ModelId': model_id,
+                'ModelParams': model_params,
+                'Precomputed': precomputed,
+                'HasReference': has_reference,
+                'S3Uri': s3_uri,
+                'TaskToken': task_token,
+                'EvaluationKey': evaluation_key if use_cache else None
+            })
+        if queued or deferred:
+            return {
+                'statusCode': 200,
+                'body': json.dumps({'status': 'Queued', 'RunID': run_id, 'Model': model_key, 's3Uri': s3_uri, 'localMetrics': local_metrics})
+            }
+
+        if cached_job:
+            # A finished job already covers this exact dataset, so check_status can collect its results right away
+            result = {
+                'statusCode': 200,
+                'body': json.dumps({'status': 'Cached', 'RunID': run_id, 'Model': model_key, 'jobArn': job_arn})
+            }
+            if task_token:
+                stepfunctions.send_task_success(taskToken=task_token, output=json.dumps(result))
+            return result
+
+        if task_token and not split:
+            register_job_callback(job_arn, run_id, model_key, task_token)
+
+        update_run_status(run_id, "Running")
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps({ 'RunID': run_id, 'Model': model_key, 'jobArn': job_arn, 's3Uri': s3_uri, 'localMetrics': local_metrics, 'cache': generation_cache.stats(), **({'partJobs': part_jobs} if split else {})})
+        }
+
+    except Exception as e:
+        print(f"ERROR: {str(e)}")
+        update_run_status(run_id, "Failed")
+        if task_token:
+            stepfunctions.send_task_failure(
+                taskToken=task_token,
+                error='EvaluationJobCreationFailed',
+                cause=str(e)[:256]
+            )
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
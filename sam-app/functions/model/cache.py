@@ -0,0 +1,84 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+
+def make_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class GenerationCache:
+    # Two tiers: an LRU dict that lives as long as the warm container, backed by a shared DynamoDB table
+    def __init__(self, table=None, max_entries=512, ttl_seconds=7 * 24 * 60 * 60):
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'persistent_hits': 0, 'misses': 0}
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self.entries.move_to_end(key)
+                    self.counters['memory_hits'] += 1
+                    return value
+                del self.entries[key]
+
+        value, expires_at = self._get_persistent(key, now)
+        with self.lock:
+            if value is None:
+                self.counters['misses'] += 1
+                return None
+            self.counters['persistent_hits'] += 1
+            self._remember(key, value, expires_at)
+        return value
+
+    def put(self, key, value):
+        expires_at = int(time.time()) + self.ttl_seconds
+        with self.lock:
+            self._remember(key, value, expires_at)
+        if self.table is None:
+            return
+        try:
+            self.table.put_item(
+                Item={
+                    'CacheKey': key,
+                    'Value': json.dumps(value),
+                    'ExpiresAt': expires_at
+                }
+            )
+        except ClientError as e:
+            # The cache is an optimization, a failed write must not fail the generation
+            print(f"Error writing generation cache: {e.response['Error']['Message']}")
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, 'entries': len(self.entries)}
+
+    def _remember(self, key, value, expires_at):
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _get_persistent(self, key, now):
+        if self.table is None:
+            return None, None
+        try:
+            item = self.table.get_item(Key={'CacheKey': key}).get('Item')
+        except ClientError as e:
+            print(f"Error reading generation cache: {e.response['Error']['Message']}")
+            return None, None
+        # DynamoDB TTL deletes lazily, so expired items can still be returned
+        if not item or int(item['ExpiresAt']) <= now:
+            return None, None
+        return json.loads(item['Value']), int(item['ExpiresAt'])
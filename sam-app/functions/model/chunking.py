@@ -0,0 +1,86 @@
+import re
+
+# Rough English average; only used to keep requests comfortably inside the window
+CHARS_PER_TOKEN = 4
+PROMPT_OVERHEAD_TOKENS = 200
+
+CONTEXT_WINDOWS = [
+    ("anthropic.claude-3", 200000),
+    ("anthropic.claude-v2", 100000),
+    ("anthropic.claude-instant-v1", 100000),
+    ("cohere.command-r", 128000),
+    ("cohere.command-text", 4000),
+    ("ai21.j2", 8191),
+    ("meta.llama3", 8000),
+    ("mistral", 32000),
+    ("amazon.titan-text-premier", 32000),
+    ("amazon.titan-text-lite", 4000),
+    ("amazon.titan", 8000),
+]
+DEFAULT_CONTEXT_WINDOW = 4000
+
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+
+
+def get_context_window(model_id):
+    for prefix, window in CONTEXT_WINDOWS:
+        if model_id.startswith(prefix):
+            return window
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def get_chunk_budget(model_id, max_tokens, chunk_tokens=None):
+    # Input budget in characters: the window minus room for the generated summary and the prompt wrapper
+    tokens = get_context_window(model_id) - max_tokens - PROMPT_OVERHEAD_TOKENS
+    if chunk_tokens:
+        tokens = min(tokens, chunk_tokens)
+    return max(tokens, PROMPT_OVERHEAD_TOKENS) * CHARS_PER_TOKEN
+
+
+def split_units(text, max_chars):
+    # Paragraphs first, then sentences, then words for anything still too long
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            yield paragraph
+            continue
+        for sentence in SENTENCE_BREAK.split(paragraph):
+            if len(sentence) <= max_chars:
+                yield sentence
+                continue
+            words = []
+            size = 0
+            for word in sentence.split():
+                if words and size + len(word) + 1 > max_chars:
+                    yield " ".join(words)
+                    words = []
+                    size = 0
+                words.append(word[:max_chars])
+                size += len(words[-1]) + 1
+            if words:
+                yield " ".join(words)
+
+
+def pack(units, max_chars, separator="\n\n"):
+    chunks = []
+    current = []
+    size = 0
+    for unit in units:
+        if current and size + len(separator) + len(unit) > max_chars:
+            chunks.append(separator.join(current))
+            current = []
+            size = 0
+        size += (len(separator) if current else 0) + len(unit)
+        current.append(unit)
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+def split_text(text, max_chars):
+    if len(text) <= max_chars:
+        return [text]
+    return pack(split_units(text, max_chars), max_chars)
@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from botocore.exceptions import ClientError
+
+import throttling
+
+INITIAL_LIMIT = float(os.environ.get('ADAPTIVE_INITIAL_IN_FLIGHT', '4'))
+MAX_LIMIT = float(os.environ.get('ADAPTIVE_MAX_IN_FLIGHT', '32'))
+MIN_LIMIT = 1.0
+DECREASE_FACTOR = 0.5
+# Recent latency this many times the uncongested baseline counts as congestion, the same as a throttle
+LATENCY_TOLERANCE = float(os.environ.get('ADAPTIVE_LATENCY_TOLERANCE', '2.0'))
+RECENT_WEIGHT = 0.3
+# The baseline follows latency down at once but creeps up slowly, so it tracks the uncongested floor
+BASELINE_DRIFT = 0.01
+
+
+class AdaptiveLimiter:
+    # Additive-increase, multiplicative-decrease limit on in-flight calls per key. Containers do not
+    # coordinate; like TCP flows, each one backing off on congestion converges on a fair share.
+    def __init__(self, initial=INITIAL_LIMIT, minimum=MIN_LIMIT, maximum=MAX_LIMIT,
+                 tolerance=LATENCY_TOLERANCE, clock=time.monotonic):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.clock = clock
+        self.condition = threading.Condition()
+        self.keys = {}
+        self.counters = {'increases': 0, 'decreases': 0, 'throttles': 0, 'waits': 0}
+
+    def state(self, key):
+        if key not in self.keys:
+            self.keys[key] = {'Limit': self.initial, 'InFlight': 0, 'Recent': None, 'Baseline': None, 'DecreasedAt': None}
+        return self.keys[key]
+
+    @contextmanager
+    def slot(self, key):
+        with self.condition:
+            state = self.state(key)
+            if state['InFlight'] >= int(state['Limit']):
+                self.counters['waits'] += 1
+            while state['InFlight'] >= int(state['Limit']):
+                self.condition.wait()
+            state['InFlight'] += 1
+        started = self.clock()
+        throttled = False
+        try:
+            yield
+        except ClientError as e:
+            throttled = throttling.is_throttle(e)
+            raise
+        finally:
+            self.complete(key, started, self.clock() - started, throttled)
+
+    def complete(self, key, started, latency, throttled):
+        with self.condition:
+            state = self.state(key)
+            state['InFlight'] -= 1
+            if throttled:
+                self.counters['throttles'] += 1
+                congested = True
+            else:
+                state['Recent'] = latency if state['Recent'] is None else state['Recent'] + RECENT_WEIGHT * (latency - state['Recent'])
+                baseline = state['Baseline']
+                state['Baseline'] = state['Recent'] if baseline is None else min(state['Recent'], baseline + BASELINE_DRIFT * (state['Recent'] - baseline))
+                congested = baseline is not None and state['Recent'] > baseline * self.tolerance
+
+            if congested:
+                # Calls already in flight when the limit dropped report the same congestion; count it once
+                if state['DecreasedAt'] is None or started >= state['DecreasedAt']:
+                    state['Limit'] = max(self.minimum, state['Limit'] * DECREASE_FACTOR)
+                    state['DecreasedAt'] = self.clock()
+                    self.counters['decreases'] += 1
+            elif state['Limit'] < self.maximum:
+                # Grows by about one per round of `Limit` completions
+                state['Limit'] = min(self.maximum, state['Limit'] + 1 / state['Limit'])
+                self.counters['increases'] += 1
+            self.condition.notify_all()
+
+    def snapshot(self):
+        with self.condition:
+            return {key: {'Limit': round(state['Limit'], 2), 'InFlight': state['InFlight']} for key, state in self.keys.items()}
+
+    def stats(self):
+        with self.condition:
+            return {**self.counters, 'limits': {key: round(state['Limit'], 2) for key, state in self.keys.items()}}
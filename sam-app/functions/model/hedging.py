@@ -0,0 +1,115 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Fraction of calls that may be duplicated; each call earns that much of a hedge
+HEDGE_BUDGET = float(os.environ.get('HEDGE_BUDGET', '0.05'))
+HEDGE_BURST = 5
+HEDGE_PERCENTILE = 0.95
+# Below this many samples the percentile is noise, so calls are not hedged yet
+MIN_SAMPLES = 20
+WINDOW = 256
+# Cross-region inference profiles route the duplicate to whichever region has capacity
+HEDGE_PROFILE_PREFIX = os.environ.get('HEDGE_PROFILE_PREFIX', 'us')
+PROFILE_FAMILIES = ("anthropic.claude-3", "meta.llama3", "amazon.nova")
+
+
+def profile_for(model_id):
+    if HEDGE_PROFILE_PREFIX and model_id.startswith(PROFILE_FAMILIES):
+        return f"{HEDGE_PROFILE_PREFIX}.{model_id}"
+    return model_id
+
+
+class LatencyTracker:
+    def __init__(self, window=WINDOW, min_samples=MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self.lock:
+            self.samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key, q=HEDGE_PERCENTILE):
+        with self.lock:
+            samples = sorted(self.samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+class HedgeBudget:
+    def __init__(self, ratio=HEDGE_BUDGET, burst=HEDGE_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.credit = 0.0
+        self.lock = threading.Lock()
+        self.counters = {'calls': 0, 'hedges': 0, 'hedge_wins': 0, 'denied': 0}
+
+    def earn(self):
+        with self.lock:
+            self.counters['calls'] += 1
+            self.credit = min(self.burst, self.credit + self.ratio)
+
+    def spend(self):
+        with self.lock:
+            if self.credit < 1:
+                self.counters['denied'] += 1
+                return False
+            self.credit -= 1
+            self.counters['hedges'] += 1
+            return True
+
+    def won(self):
+        with self.lock:
+            self.counters['hedge_wins'] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+class Hedger:
+    # Issues a duplicate once the primary outlives the model's p95, returns whichever finishes first
+    # and ignores the other; Bedrock offers no way to cancel a call already in flight
+    def __init__(self, max_workers=32, tracker=None, budget=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.tracker = tracker or LatencyTracker()
+        self.budget = budget or HedgeBudget()
+
+    def call(self, model_id, invoke):
+        # invoke(target_model_id) performs one call and returns (result, seconds). The seconds cover only
+        # the Bedrock round trip, so time spent queued on the local limiters never triggers a hedge.
+        self.budget.earn()
+        delay = self.tracker.percentile(model_id)
+
+        def timed(target):
+            result, seconds = invoke(target)
+            self.tracker.record(model_id, seconds)
+            return result
+
+        if delay is None:
+            return timed(model_id)
+
+        primary = self.executor.submit(timed, model_id)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self.budget.spend():
+            return primary.result()
+
+        backup = self.executor.submit(lambda: invoke(profile_for(model_id))[0])
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        self.budget.won()
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def stats(self):
+        return self.budget.stats()
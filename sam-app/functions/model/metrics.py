@@ -0,0 +1,177 @@
+import string
+from collections import defaultdict
+
+import numpy as np
+
+PUNCTUATION = str.maketrans({character: ' ' for character in string.punctuation})
+
+
+def tokenize(text):
+    return (text or "").lower().translate(PUNCTUATION).split()
+
+
+class Vocabulary:
+    # Maps tokens to dense integer ids shared by every text in a batch
+    def __init__(self):
+        self.ids = defaultdict()
+        # Unseen tokens get the next id without leaving C code
+        self.ids.default_factory = self.ids.__len__
+
+    def encode(self, text):
+        tokens = tokenize(text)
+        return np.fromiter(map(self.ids.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+
+    @property
+    def base(self):
+        return max(len(self.ids), 1)
+
+
+def ngram_ids(tokens, n, base):
+    count = len(tokens) - n + 1
+    if count <= 0:
+        return np.empty(0, dtype=np.int64)
+    ids = tokens[:count].copy()
+    for offset in range(1, n):
+        ids = ids * base + tokens[offset:offset + count]
+    return ids
+
+
+def batch_ngram_keys(token_arrays, n, base):
+    # Offsets every document's n-gram ids into its own key range so one np.unique covers the batch
+    span = base ** n
+    grams = [ngram_ids(tokens, n, base) for tokens in token_arrays]
+    lengths = np.array([len(g) for g in grams], dtype=np.int64)
+    doc_index = np.repeat(np.arange(len(grams), dtype=np.int64), lengths)
+    keys = np.concatenate(grams) + doc_index * span if len(grams) else np.empty(0, dtype=np.int64)
+    return keys, doc_index, lengths
+
+
+def sorted_counts(keys):
+    keys = np.sort(keys)
+    if len(keys) == 0:
+        return keys, np.empty(0, dtype=np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[starts], np.diff(np.append(starts, len(keys)))
+
+
+def lookup(sorted_keys, keys):
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+    index = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return index, sorted_keys[index] == keys
+
+
+def batch_overlap(candidates, references, n, base):
+    candidate_keys, candidate_docs, candidate_lengths = batch_ngram_keys(candidates, n, base)
+    reference_keys, _, reference_lengths = batch_ngram_keys(references, n, base)
+
+    unique_candidate, candidate_counts = sorted_counts(candidate_keys)
+    unique_reference, reference_counts = sorted_counts(reference_keys)
+
+    reference_index, found = lookup(unique_reference, unique_candidate)
+    clipped = np.minimum(candidate_counts[found], reference_counts[reference_index[found]])
+    overlap = np.bincount(unique_candidate[found] // base ** n, weights=clipped, minlength=len(candidates))
+
+    _, candidate_found = lookup(unique_reference, candidate_keys)
+    novel_counts = np.bincount(candidate_docs, weights=~candidate_found, minlength=len(candidates))
+
+    return overlap, candidate_lengths, reference_lengths, novel_counts
+
+
+def ratio(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.zeros(len(numerator)), where=denominator > 0)
+
+
+def f1(overlap, candidate_total, reference_total):
+    precision = ratio(overlap, candidate_total)
+    recall = ratio(overlap, reference_total)
+    return ratio(2 * precision * recall, precision + recall)
+
+
+def lcs_length(candidate, reference):
+    # Bit-parallel LCS (Allison-Dix): one big-integer step per candidate token
+    if len(candidate) == 0 or len(reference) == 0:
+        return 0
+    tokens = np.unique(candidate)
+    equal = tokens[:, None] == reference[None, :]
+    present = equal.any(axis=1)
+    tokens, equal = tokens[present], equal[present]
+    if len(tokens) == 0:
+        return 0
+    bits = np.packbits(equal, axis=1, bitorder='little')
+    width = bits.shape[1]
+    packed = bits.tobytes()
+    masks = {
+        token: int.from_bytes(packed[i * width:(i + 1) * width], 'little')
+        for i, token in enumerate(tokens.tolist())
+    }
+    row = 0
+    for token in candidate.tolist():
+        mask = masks.get(token)
+        # Tokens absent from the reference leave the LCS row unchanged
+        if mask is not None:
+            matches = mask | row
+            row = matches & ((matches - ((row << 1) | 1)) ^ matches)
+    return row.bit_count()
+
+
+def batch_rouge_l(candidates, references):
+    lcs = np.array([lcs_length(c, r) for c, r in zip(candidates, references)], dtype=np.float64)
+    candidate_lengths = np.array([len(c) for c in candidates], dtype=np.float64)
+    reference_lengths = np.array([len(r) for r in references], dtype=np.float64)
+    return f1(lcs, candidate_lengths, reference_lengths)
+
+
+def compare(candidates, references, base):
+    unigram_overlap, unigram_totals, unigram_reference_totals, novel_unigrams = batch_overlap(candidates, references, 1, base)
+    bigram_overlap, bigram_totals, bigram_reference_totals, novel_bigrams = batch_overlap(candidates, references, 2, base)
+    return {
+        'Rouge1': f1(unigram_overlap, unigram_totals, unigram_reference_totals),
+        'Rouge2': f1(bigram_overlap, bigram_totals, bigram_reference_totals),
+        'RougeL': batch_rouge_l(candidates, references),
+        'NovelUnigrams': ratio(novel_unigrams, unigram_totals),
+        'NovelBigrams': ratio(novel_bigrams, bigram_totals),
+    }
+
+
+def score_summaries(summaries, sources, references=None):
+    vocabulary = Vocabulary()
+    summary_tokens = [vocabulary.encode(text) for text in summaries]
+    source_tokens = [vocabulary.encode(text) for text in sources]
+    reference_tokens = [vocabulary.encode(text) for text in references] if references else None
+    base = vocabulary.base
+
+    summary_lengths = np.array([len(t) for t in summary_tokens], dtype=np.float64)
+    source_lengths = np.array([len(t) for t in source_tokens], dtype=np.float64)
+
+    columns = compare(summary_tokens, source_tokens, base)
+    columns['SummaryLength'] = summary_lengths
+    columns['SourceLength'] = source_lengths
+    columns['CompressionRatio'] = ratio(summary_lengths, source_lengths)
+
+    if reference_tokens is not None:
+        has_reference = np.array([len(t) > 0 for t in reference_tokens])
+        reference_columns = compare(summary_tokens, reference_tokens, base)
+        for name in ('Rouge1', 'Rouge2', 'RougeL'):
+            columns[f'Reference{name}'] = np.where(has_reference, reference_columns[name], np.nan)
+
+    return [
+        {name: round(float(values[i]), 4) for name, values in columns.items() if not np.isnan(values[i])}
+        for i in range(len(summaries))
+    ]
+
+
+def score_summary(summary, source, reference=None):
+    return score_summaries([summary], [source], [reference] if reference else None)[0]
+
+
+def mean_scores(scores):
+    totals = {}
+    counts = {}
+    for score in scores:
+        for name, value in score.items():
+            totals[name] = totals.get(name, 0.0) + value
+            counts[name] = counts.get(name, 0) + 1
+    return {name: round(totals[name] / counts[name], 4) for name in totals}
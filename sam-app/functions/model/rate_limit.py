@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+import time
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+# Default on-demand quotas (requests, tokens per minute); accounts with raised quotas override them through RATE_LIMITS
+MODEL_QUOTAS = [
+    ("anthropic.claude-3-haiku", 1000, 2000000),
+    ("anthropic.claude-3-sonnet", 500, 1000000),
+    ("anthropic.claude-3-opus", 50, 400000),
+    ("anthropic.claude", 500, 500000),
+    ("amazon.titan-text", 400, 300000),
+    ("meta.llama3", 800, 300000),
+    ("mistral", 800, 300000),
+    ("cohere.command", 400, 300000),
+]
+DEFAULT_QUOTA = (100, 100000)
+REGION_PREFIXES = ('us', 'eu', 'apac')
+# Buckets refill at a share of the quota and hold only a few seconds of it, so no 60 second window
+# (one burst plus a minute of refill) can go past the quota: 0.9 * (60 + 6) / 60 = 0.99
+HEADROOM = float(os.environ.get('RATE_LIMIT_HEADROOM', '0.9'))
+BURST_SECONDS = 6
+MAX_WRITE_ATTEMPTS = 10
+# Keeps rounding in the refill maths from turning into a busy loop of vanishing sleeps
+MIN_WAIT_SECONDS = 0.01
+
+
+def load_quotas():
+    overrides = json.loads(os.environ.get('RATE_LIMITS', '{}'))
+    # Longer prefixes first, so a specific override wins over a family default
+    return sorted(
+        [(prefix, rpm, tpm) for prefix, (rpm, tpm) in overrides.items()] + MODEL_QUOTAS,
+        key=lambda quota: -len(quota[0])
+    )
+
+
+def get_quota(model_id, quotas):
+    # Cross-region inference profiles (us.anthropic...) get their own buckets sized like the model they route to
+    region, _, base_model_id = model_id.partition('.')
+    if region in REGION_PREFIXES and base_model_id:
+        model_id = base_model_id
+    for prefix, rpm, tpm in quotas:
+        if model_id.startswith(prefix):
+            return rpm, tpm
+    return DEFAULT_QUOTA
+
+
+class LocalBucketStore:
+    # Buckets that only live as long as the container; the backend for tests and local runs
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def read(self, key):
+        with self.lock:
+            return self.buckets.get(key, (None, 0))
+
+    def write(self, key, state, version):
+        with self.lock:
+            if self.buckets.get(key, (None, 0))[1] != version:
+                return False
+            self.buckets[key] = (dict(state), version + 1)
+            return True
+
+
+class DynamoDBBucketStore:
+    # One item per model holds both buckets; writes are conditional on the version that was read
+    def __init__(self, table):
+        self.table = table
+
+    def read(self, key):
+        try:
+            item = self.table.get_item(Key={'LimitKey': key}, ConsistentRead=True).get('Item')
+        except ClientError as e:
+            print(f"Error reading rate limit bucket: {e.response['Error']['Message']}")
+            raise
+        if item is None:
+            return None, 0
+        state = {field: float(item[field]) for field in ('Requests', 'Tokens', 'RefilledAt')}
+        return state, int(item['Version'])
+
+    def write(self, key, state, version):
+        condition = {'ConditionExpression': 'attribute_not_exists(Version)'}
+        if version:
+            condition = {'ConditionExpression': 'Version = :version', 'ExpressionAttributeValues': {':version': version}}
+        try:
+            self.table.put_item(
+                Item={
+                    'LimitKey': key,
+                    **{field: Decimal(str(round(value, 6))) for field, value in state.items()},
+                    'Version': version + 1
+                },
+                **condition
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            print(f"Error writing rate limit bucket: {e.response['Error']['Message']}")
+            raise
+
+
+class RateLimiter:
+    # A requests bucket and a tokens bucket per model id
+    def __init__(self, store, quotas=None, headroom=HEADROOM, burst_seconds=BURST_SECONDS, clock=time.time, sleep=time.sleep):
+        self.store = store
+        self.quotas = quotas if quotas is not None else load_quotas()
+        self.headroom = headroom
+        self.burst_seconds = burst_seconds
+        self.clock = clock
+        self.sleep = sleep
+        self.counters = {'acquired': 0, 'waits': 0, 'waited_seconds': 0.0, 'throttles': 0}
+        # Shared by every generation thread in the container
+        self.counters_lock = threading.Lock()
+
+    def rates(self, model_id):
+        # Requests and tokens added back per second
+        rpm, tpm = get_quota(model_id, self.quotas)
+        return rpm * self.headroom / 60, tpm * self.headroom / 60
+
+    def capacity(self, model_id):
+        requests_rate, tokens_rate = self.rates(model_id)
+        return max(requests_rate * self.burst_seconds, 1), tokens_rate * self.burst_seconds
+
+    def refill(self, model_id, state, now):
+        requests_rate, tokens_rate = self.rates(model_id)
+        requests_capacity, tokens_capacity = self.capacity(model_id)
+        if state is None:
+            return {'Requests': requests_capacity, 'Tokens': tokens_capacity, 'RefilledAt': now}
+        elapsed = max(now - state['RefilledAt'], 0)
+        return {
+            'Requests': min(requests_capacity, state['Requests'] + elapsed * requests_rate),
+            'Tokens': min(tokens_capacity, state['Tokens'] + elapsed * tokens_rate),
+            'RefilledAt': now
+        }
+
+    def update(self, model_id, change):
+        # change maps the refilled state to the new state, or returns seconds to wait before retrying
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            state, version = self.store.read(model_id)
+            refilled = self.refill(model_id, state, self.clock())
+            result = change(refilled)
+            if not isinstance(result, dict):
+                return result
+            if self.store.write(model_id, result, version):
+                return 0
+        raise Exception(f"Rate limit bucket for {model_id} is too contended to update")
+
+    def acquire(self, model_id, tokens):
+        requests_rate, tokens_rate = self.rates(model_id)
+        # A single request larger than the whole bucket would otherwise wait forever
+        tokens = min(tokens, self.capacity(model_id)[1])
+
+        def take(state):
+            if state['Requests'] >= 1 and state['Tokens'] >= tokens:
+                return {**state, 'Requests': state['Requests'] - 1, 'Tokens': state['Tokens'] - tokens}
+            return max(
+                (1 - state['Requests']) / requests_rate,
+                (tokens - state['Tokens']) / tokens_rate,
+                MIN_WAIT_SECONDS
+            )
+
+        while True:
+            wait = self.update(model_id, take)
+            if not wait:
+                self.count(acquired=1)
+                return tokens
+            self.count(waits=1, waited_seconds=wait)
+            self.sleep(wait)
+
+    def settle(self, model_id, reserved, used):
+        # Reservations assume the full output budget; hand back what the call did not use
+        if used is None or used == reserved:
+            return
+        tokens_capacity = self.capacity(model_id)[1]
+        self.update(model_id, lambda state: {**state, 'Tokens': min(tokens_capacity, state['Tokens'] + reserved - used)})
+
+    def drain(self, model_id):
+        # Bedrock throttled despite the buckets, so every caller for this model backs off together
+        self.count(throttles=1)
+        self.update(model_id, lambda state: {**state, 'Requests': 0.0, 'Tokens': 0.0})
+
+    def count(self, **increments):
+        with self.counters_lock:
+            for name, value in increments.items():
+                self.counters[name] += value
+
+    def stats(self):
+        with self.counters_lock:
+            return dict(self.counters)
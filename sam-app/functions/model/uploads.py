@@ -0,0 +1,46 @@
+# S3 rejects any part but the last below 5 MiB; bigger parts mean fewer requests
+PART_SIZE = 8 * 1024 * 1024
+
+
+class MultipartUpload:
+    # Streams one object to S3 a part at a time, so only a part's worth of bytes is held in memory
+    def __init__(self, s3_client, bucket, key, part_size=PART_SIZE):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.parts = []
+        self.upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+
+    def write(self, data):
+        self.buffer.extend(data)
+        if len(self.buffer) >= self.part_size:
+            self._flush()
+
+    def _flush(self):
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=bytes(self.buffer)
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        self.buffer = bytearray()
+
+    def close(self):
+        # An empty object still needs one part to complete
+        if self.buffer or not self.parts:
+            self._flush()
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={'Parts': self.parts}
+        )
+
+    def abort(self):
+        # Uploaded parts are billed until the upload is aborted
+        self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
@@ -0,0 +1,43 @@
+import threading
+
+# Summed, never averaged: a run's cost is the total over its calls
+COUNT_FIELDS = ('Calls', 'CachedCalls', 'InputTokens', 'OutputTokens', 'InvocationLatencyMs')
+
+
+def empty():
+    return {**{field: 0 for field in COUNT_FIELDS}, 'StopReasons': {}}
+
+
+def merge(summaries):
+    total = empty()
+    for summary in summaries:
+        for field in COUNT_FIELDS:
+            total[field] += summary.get(field, 0)
+        for reason, count in summary.get('StopReasons', {}).items():
+            total['StopReasons'][reason] = total['StopReasons'].get(reason, 0) + count
+    total['InvocationLatencyMs'] = round(total['InvocationLatencyMs'], 1)
+    return total
+
+
+class UsageMeter:
+    # Chunked documents call the model from several threads, so one meter is shared under a lock
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = empty()
+
+    def record(self, input_tokens, output_tokens, latency_ms, stop_reason=None):
+        with self.lock:
+            self.totals['Calls'] += 1
+            self.totals['InputTokens'] += input_tokens or 0
+            self.totals['OutputTokens'] += output_tokens or 0
+            self.totals['InvocationLatencyMs'] += latency_ms
+            reason = stop_reason or 'unknown'
+            self.totals['StopReasons'][reason] = self.totals['StopReasons'].get(reason, 0) + 1
+
+    def record_cached(self):
+        with self.lock:
+            self.totals['CachedCalls'] += 1
+
+    def summary(self):
+        with self.lock:
+            return merge([self.totals])
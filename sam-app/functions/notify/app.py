@@ -0,0 +1,164 @@
+import json
+import boto3
+import os
+import time
+from decimal import Decimal
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+import run_table
+
+dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+management_api = boto3.client(
+    'apigatewaymanagementapi',
+    region_name='us-east-1',
+    endpoint_url=os.environ.get('WEBSOCKET_ENDPOINT')
+)
+
+CONNECTION_TABLE = os.environ['CONNECTION_TABLE']
+CONNECTION_TTL_SECONDS = 2 * 60 * 60
+# Subscribers to this RunID receive every run's updates
+ALL_RUNS = '*'
+deserializer = TypeDeserializer()
+
+def lambda_handler(event, context):
+    if 'Records' in event:
+        return handle_stream(event['Records'])
+    return handle_connection(event)
+
+
+def handle_connection(event):
+    request_context = event['requestContext']
+    route = request_context['routeKey']
+    connection_id = request_context['connectionId']
+    
+    if route == '$connect':
+        run_id = (event.get('queryStringParameters') or {}).get('runid', ALL_RUNS)
+        save_subscription(connection_id, run_id)
+    elif route == '$disconnect':
+        delete_connection(connection_id)
+    elif route == 'subscribe':
+        body = json.loads(event.get('body') or '{}')
+        save_subscription(connection_id, body.get('RunID') or ALL_RUNS)
+    
+    return {'statusCode': 200}
+
+
+def save_subscription(connection_id, run_id):
+    try:
+        dynamodb.put_item(
+            TableName=CONNECTION_TABLE,
+            Item={
+                'ConnectionId': {'S': connection_id},
+                'RunID': {'S': run_id},
+                'ExpiresAt': {'N': str(int(time.time()) + CONNECTION_TTL_SECONDS)}
+            }
+        )
+    except ClientError as e:
+        print(f"Error saving WebSocket subscription: {e.response['Error']['Message']}")
+        raise
+
+def delete_connection(connection_id):
+    try:
+        dynamodb.delete_item(
+            TableName=CONNECTION_TABLE,
+            Key={'ConnectionId': {'S': connection_id}}
+        )
+    except ClientError as e:
+        print(f"Error deleting WebSocket connection: {e.response['Error']['Message']}")
+        raise
+
+
+def handle_stream(records):
+    sent = 0
+    for record in records:
+        if record.get('eventName') == 'REMOVE':
+            continue
+        images = record['dynamodb']
+        new_image = deserialize(images.get('NewImage', {}))
+        old_image = deserialize(images.get('OldImage', {}))
+        sort_key = new_image.get('SK', '')
+        
+        if sort_key == run_table.META:
+            messages = status_messages(new_image, old_image)
+        elif sort_key.startswith(run_table.MODEL_PREFIX):
+            messages = model_messages(new_image, old_image)
+        else:
+            messages = []
+        
+        for message in messages:
+            sent += broadcast(message['RunID'], message)
+    
+    return {'statusCode': 200, 'body': json.dumps({'sent': sent})}
+
+
+def deserialize(image):
+    return {name: deserializer.deserialize(value) for name, value in image.items()}
+
+def status_messages(new_image, old_image):
+    # Completion counts live on the META item too, so progress rides along with status changes
+    if all(new_image.get(field) == old_image.get(field) for field in ('Status', 'CompletedCount')):
+        return []
+    return [{
+        'type': 'status',
+        'RunID': new_image['RunID'],
+        'Status': new_image.get('Status'),
+        'UpdatedAt': new_image.get('UpdatedAt'),
+        'CompletedCount': new_image.get('CompletedCount'),
+        'ModelCount': new_image.get('ModelCount')
+    }]
+
+def model_messages(new_image, old_image):
+    messages = []
+    model_key = run_table.model_key_from_sk(new_image['SK'])
+    
+    # Local metrics land first, Bedrock scores later when check_status marks the model Completed
+    if new_image.get('LocalMetrics') and new_image.get('LocalMetrics') != old_image.get('LocalMetrics'):
+        messages.append({
+            'type': 'partial_scores',
+            'RunID': new_image['RunID'],
+            'Model': model_key,
+            'ModelName': new_image.get('ModelName'),
+            'LocalMetrics': new_image['LocalMetrics']
+        })
+    if new_image.get('Completed') and not old_image.get('Completed'):
+        messages.append({
+            'type': 'model_completed',
+            'RunID': new_image['RunID'],
+            'Model': model_key,
+            'ModelName': new_image.get('ModelName'),
+            'Scores': {field: new_image.get(field) for field in run_table.SCORE_FIELDS}
+        })
+    return messages
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def get_subscribers(run_id):
+    connection_ids = []
+    for subscribed_run in (run_id, ALL_RUNS):
+        paginator = dynamodb.get_paginator('query')
+        for page in paginator.paginate(
+            TableName=CONNECTION_TABLE,
+            IndexName='RunIndex',
+            KeyConditionExpression='RunID = :run_id',
+            ExpressionAttributeValues={':run_id': {'S': subscribed_run}},
+            ProjectionExpression='ConnectionId'
+        ):
+            connection_ids.extend(item['ConnectionId']['S'] for item in page.get('Items', []))
+    return connection_ids
+
+def broadcast(run_id, message):
+    data = json.dumps(message, default=json_default).encode('utf-8')
+    sent = 0
+    for connection_id in get_subscribers(run_id):
+        try:
+            management_api.post_to_connection(ConnectionId=connection_id, Data=data)
+            sent += 1
+        except management_api.exceptions.GoneException:
+            # The tab closed without a clean $disconnect
+            delete_connection(connection_id)
+    return sent
@@ -2,11 +2,18 @@ import json
 import boto3
 import os
 
+import context_store
+import paging
+import run_table
+
+LIST_INDEX = 'ListIndex'
+
 def lambda_handler(event, context):
     dynamodb = boto3.client('dynamodb')
     table_name = os.environ['MODEL_RESULT_TABLE']
     
-    run_id = event.get('pathParameters', {}).get('runid', None)
+    run_id = (event.get('pathParameters') or {}).get('runid')
+    params = event.get('queryStringParameters') or {}
     
     if run_id:
         response = dynamodb.get_item(
@@ -14,24 +21,54 @@ def lambda_handler(event, context):
             Key={
                 'RunID': {
                     'S': run_id
+                },
+                'SK': {
+                    'S': run_table.META
                 }
             }
         )
         item = response.get('Item', {})
         run_id = item.get('RunID', {}).get('S', '')
-        context_field = item.get('Context', {}).get('S', '')
+        context_ref = item.get('ContextRef', {}).get('M')
+        context_field = context_store.resolve(
+            item.get('Context', {}).get('S', ''),
+            {'Bucket': context_ref['Bucket']['S'], 'Key': context_ref['Key']['S']} if context_ref else None
+        )
         result = {
             'RunID': run_id,
             'Context': context_field
         }
     else:
-        response = dynamodb.scan(
-            TableName=table_name,
-            ProjectionExpression='RunID, Context'
-        )
+        try:
+            limit = paging.parse_limit(params.get('limit'))
+            start_key = paging.decode_cursor(params.get('cursor'))
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'Invalid limit or cursor'}),
+                'headers': {
+                    'Content-Type': 'application/json'
+                }
+            }
+        
+        # Newest first from the ListIndex, one page per call instead of a full-table scan
+        query = {
+            'TableName': table_name,
+            'IndexName': LIST_INDEX,
+            'KeyConditionExpression': 'ListPartition = :partition',
+            'ExpressionAttributeValues': {':partition': {'S': run_table.LIST_PARTITION}},
+            'ScanIndexForward': False,
+            'Limit': limit
+        }
+        if start_key:
+            query['ExclusiveStartKey'] = start_key
+        response = dynamodb.query(**query)
         
         items = response.get('Items', [])
-        result = [{'RunID': item['RunID']['S'], 'Context': item['Context']['S']} for item in items]
+        result = {
+            'Items': [{'RunID': item['RunID']['S'], 'Context': item.get('Context', {}).get('S', '')} for item in items],
+            'NextCursor': paging.encode_cursor(response.get('LastEvaluatedKey'))
+        }
     
     return {
         'statusCode': 200,
@@ -39,4 +76,4 @@ def lambda_handler(event, context):
         'headers': {
             'Content-Type': 'application/json'
         }
-    }
\ No newline at end of file
+    }
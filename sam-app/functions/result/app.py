@@ -1,32 +1,87 @@
 import boto3
 import os
+import re
 from boto3.dynamodb.conditions import Key
 
+import context_store
+import run_table
+
+MODEL_KEY_PATTERN = re.compile(r'model(\d+)')
+USAGE_COUNTS = ('Calls', 'CachedCalls', 'InputTokens', 'OutputTokens')
+
+def to_score(value):
+    # Scores are numbers or explicit nulls; items not yet migrated may still hold the old strings
+    if value is None or value == '':
+        return None
+    return float(value)
+
+def to_usage(value):
+    # Runs saved before usage was recorded come back as zeros rather than a missing field
+    value = value or {}
+    return {
+        **{field: int(value.get(field, 0)) for field in USAGE_COUNTS},
+        'InvocationLatencyMs': float(value.get('InvocationLatencyMs', 0)),
+        'StopReasons': {reason: int(count) for reason, count in value.get('StopReasons', {}).items()}
+    }
+
+def sum_usage(usages):
+    total = to_usage({})
+    for usage in usages:
+        for field in USAGE_COUNTS:
+            total[field] += usage[field]
+        total['InvocationLatencyMs'] = round(total['InvocationLatencyMs'] + usage['InvocationLatencyMs'], 1)
+        for reason, count in usage['StopReasons'].items():
+            total['StopReasons'][reason] = total['StopReasons'].get(reason, 0) + count
+    return total
+
 def lambda_handler(event, context):
     dynamodb = boto3.resource('dynamodb')
     table = dynamodb.Table(os.environ['MODEL_RESULT_TABLE'])
     run_id = event['RunID']
     
-    response = table.get_item(Key={'RunID': run_id})
-    if 'Item' not in response:
+    # META and every MODEL# item share the run's partition and sort before RECORD#, so one Query returns the run
+    items = []
+    query = {'KeyConditionExpression': Key('RunID').eq(run_id) & Key('SK').lt(run_table.RECORD_PREFIX)}
+    while True:
+        response = table.query(**query)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            break
+        query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    meta = next((item for item in items if item['SK'] == run_table.META), None)
+    if meta is None:
         return {'error': 'RunID not found'}
     
-    item = response['Item']
     result = {
         'RunID': run_id,
-        'Content': item.get('Context', '')
+        # The table only holds a preview of offloaded contexts; a single-run read pays for the full text
+        'Content': context_store.resolve(meta.get('Context', ''), meta.get('ContextRef'))
+    }
+    
+    model_items = {
+        run_table.model_key_from_sk(item['SK']): item
+        for item in items if item['SK'].startswith(run_table.MODEL_PREFIX)
     }
+    model_keys = sorted(
+        (key for key in model_items if MODEL_KEY_PATTERN.fullmatch(key)),
+        key=lambda key: int(MODEL_KEY_PATTERN.fullmatch(key).group(1))
+    )
     
-    for model_key in ['model1', 'model2', 'model3']:
-        if model_key in item:
-            model_data = item[model_key]
-            
-            result[model_key] = {
-                'Model_id': model_data.get('ModelName', ''),
-                'summary': model_data.get('Summary', ''),
-                'robustness': model_data.get('Robustness', ''),
-                'accuracy': model_data.get('Accuracy', ''),
-                'toxicity': model_data.get('Toxicity', '')
-            }
+    for model_key in model_keys:
+        model_data = model_items[model_key]
+        
+        result[model_key] = {
+            'Model_id': model_data.get('ModelName', ''),
+            'summary': model_data.get('Summary', ''),
+            'robustness': to_score(model_data.get('Robustness')),
+            'accuracy': to_score(model_data.get('Accuracy')),
+            'toxicity': to_score(model_data.get('Toxicity')),
+            'local_metrics': {name: float(value) for name, value in model_data.get('LocalMetrics', {}).items()},
+            'latency': {name: float(value) for name, value in model_data.get('Latency', {}).items()},
+            'usage': to_usage(model_data.get('Usage'))
+        }
     
-    return result
\ No newline at end of file
+    # Summed when read rather than kept on META, so a retried branch overwrites its own share instead of adding to it
+    result['usage'] = sum_usage(result[model_key]['usage'] for model_key in model_keys)
+    return result
@@ -1,70 +1,212 @@
+import base64
 import json
 import boto3
 import os
+from datetime import datetime, timedelta, timezone
 from botocore.exceptions import ClientError
 
+import admission
+import paging
+import run_table
+
 dynamodb = boto3.client('dynamodb')
-RUN_STATUS_TABLE = os.environ['RUN_STATUS_TABLE']
+MODEL_RESULT_TABLE = os.environ['MODEL_RESULT_TABLE']
+LIST_INDEX = 'ListIndex'
+UPDATED_INDEX = 'UpdatedIndex'
+TOXICITY_INDEX = 'ToxicityIndex'
+# Writers stamp UpdatedAt before their write lands, so a caught-up token re-reads a short window
+SYNC_OVERLAP = timedelta(seconds=5)
 
 def lambda_handler(event, context):
-    table_name = RUN_STATUS_TABLE
-    
-    run_id = event.get('pathParameters', {}).get('runid', None)
+    run_id = (event.get('pathParameters') or {}).get('runid')
+    params = event.get('queryStringParameters') or {}
     
-    if run_id:
-        response = dynamodb.get_item(
-            TableName=table_name,
-            Key={
-                'RunID': {
-                    'S': run_id
-                }
+    try:
+        if run_id:
+            status, created_at = query_run_status(run_id)
+            result = {
+                'RunID': run_id,
+                'Status': status,
+                'CreatedAt': created_at
             }
-        )
-        item = response.get('Item', {})
-        run_id = item.get('RunID', {}).get('S', '')
-        context_field = item.get('Context', {}).get('S', '')
-        result = {
-            'RunID': run_id,
-            'Context': context_field
-        }
-    else:
-        response = dynamodb.scan(
-            TableName=table_name,
-            ProjectionExpression='RunID, Context'
-        )
-        
-        items = response.get('Items', [])
-        result = [{'RunID': item['RunID']['S'], 'Context': item['Context']['S']} for item in items]
+        elif 'admission' in params:
+            result = admission.stats()
+        elif 'min_toxicity' in params:
+            result = list_runs_by_toxicity(
+                parse_score(params['min_toxicity']), paging.parse_limit(params.get('limit')), paging.decode_cursor(params.get('cursor'))
+            )
+        elif 'since' in params:
+            since, start_key = decode_sync_token(params['since'])
+            result = list_changed_run_statuses(since, paging.parse_limit(params.get('limit')), start_key)
+        else:
+            result = list_run_statuses(paging.parse_limit(params.get('limit')), paging.decode_cursor(params.get('cursor')))
+            if not params.get('cursor'):
+                result['Since'] = encode_since(utc_now() - SYNC_OVERLAP)
+    except ValueError as e:
+        return response(400, {'error': str(e)})
     
+    return response(200, result)
+
+def response(status_code, body):
     return {
-        'statusCode': 200,
-        'body': json.dumps(result),
+        'statusCode': status_code,
+        'body': json.dumps(body),
         'headers': {
             'Content-Type': 'application/json'
         }
     }
 
+def parse_score(value):
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Invalid score: {value}")
+
+def utc_now():
+    return datetime.now(timezone.utc)
+
+def format_timestamp(moment):
+    return moment.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+def parse_timestamp(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def encode_since(moment, start_key=None):
+    # A token handed out mid-page keeps the query's own position, so runs sharing the page's last
+    # UpdatedAt are still returned on the next call
+    payload = format_timestamp(moment)
+    if start_key:
+        payload = json.dumps({'Since': payload, 'StartKey': start_key})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_sync_token(token):
+    if not token:
+        # An empty token replays every change, which is how a client bootstraps
+        return datetime.min.replace(tzinfo=timezone.utc), None
+    try:
+        payload = base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8')
+        if payload.startswith('{'):
+            position = json.loads(payload)
+            return parse_timestamp(position['Since']), position['StartKey']
+        return parse_timestamp(payload), None
+    except (ValueError, UnicodeError, KeyError):
+        raise ValueError("Invalid since token")
+
 def query_run_status(run_id):
     try:
         response = dynamodb.get_item(
-            TableName=RUN_STATUS_TABLE,
-            Key={'RunID': {'S': run_id}}
+            TableName=MODEL_RESULT_TABLE,
+            Key={'RunID': {'S': run_id}, 'SK': {'S': run_table.META}}
         )
         item = response.get('Item', {})
-        return item.get('Status', {}).get('S', 'Unknown')
+        return item.get('Status', {}).get('S', 'Unknown'), item.get('CreatedAt', {}).get('S')
     except ClientError as e:
-        print(f"Error querying Run-Status table: {e.response['Error']['Message']}")
+        print(f"Error querying run status: {e.response['Error']['Message']}")
         raise
 
-def list_all_run_statuses():
+def list_run_statuses(limit, start_key=None):
+    # Newest first from the ListIndex, one page per call instead of a full-table scan
+    query = {
+        'TableName': MODEL_RESULT_TABLE,
+        'IndexName': LIST_INDEX,
+        'KeyConditionExpression': 'ListPartition = :partition',
+        'ExpressionAttributeValues': {':partition': {'S': run_table.LIST_PARTITION}},
+        'ScanIndexForward': False,
+        'Limit': limit
+    }
+    if start_key:
+        query['ExclusiveStartKey'] = start_key
     try:
-        response = dynamodb.scan(
-            TableName=RUN_STATUS_TABLE,
-            ProjectionExpression='RunID, #S',
-            ExpressionAttributeNames={'#S': 'Status'}
-        )
-        items = response.get('Items', [])
-        return [{'RunID': item['RunID']['S'], 'Status': item['Status']['S']} for item in items]
+        response = dynamodb.query(**query)
     except ClientError as e:
-        print(f"Error scanning Run-Status table: {e.response['Error']['Message']}")
-        raise
\ No newline at end of file
+        print(f"Error querying run status: {e.response['Error']['Message']}")
+        raise
+    
+    return {
+        'Items': [
+            {
+                'RunID': item['RunID']['S'],
+                'Status': item.get('Status', {}).get('S', 'Unknown'),
+                'CreatedAt': item['CreatedAt']['S']
+            }
+            for item in response.get('Items', [])
+        ],
+        'NextCursor': paging.encode_cursor(response.get('LastEvaluatedKey'))
+    }
+
+def list_changed_run_statuses(since, limit, start_key=None):
+    # Oldest change first so the returned token always moves forward
+    query = {
+        'TableName': MODEL_RESULT_TABLE,
+        'IndexName': UPDATED_INDEX,
+        'KeyConditionExpression': 'ListPartition = :partition AND UpdatedAt > :since',
+        'ExpressionAttributeValues': {
+            ':partition': {'S': run_table.LIST_PARTITION},
+            ':since': {'S': format_timestamp(since)}
+        },
+        'ScanIndexForward': True,
+        'Limit': limit
+    }
+    if start_key:
+        query['ExclusiveStartKey'] = start_key
+    try:
+        response = dynamodb.query(**query)
+    except ClientError as e:
+        print(f"Error querying run status: {e.response['Error']['Message']}")
+        raise
+    
+    items = response.get('Items', [])
+    has_more = 'LastEvaluatedKey' in response
+    if has_more:
+        # Resume the same query where this page stopped rather than restarting after a timestamp
+        next_token = encode_since(since, response['LastEvaluatedKey'])
+    else:
+        next_token = encode_since(utc_now() - SYNC_OVERLAP)
+    
+    return {
+        'Items': [
+            {
+                'RunID': item['RunID']['S'],
+                'Status': item.get('Status', {}).get('S', 'Unknown'),
+                'CreatedAt': item.get('CreatedAt', {}).get('S'),
+                'UpdatedAt': item['UpdatedAt']['S']
+            }
+            for item in items
+        ],
+        'Since': next_token,
+        'HasMore': has_more
+    }
+
+def list_runs_by_toxicity(min_toxicity, limit, start_key=None):
+    # Most toxic first; models without a toxicity score never enter the index
+    query = {
+        'TableName': MODEL_RESULT_TABLE,
+        'IndexName': TOXICITY_INDEX,
+        'KeyConditionExpression': 'ScorePartition = :partition AND ToxicityScore > :min_toxicity',
+        'ExpressionAttributeValues': {
+            ':partition': {'S': run_table.SCORE_PARTITION},
+            ':min_toxicity': {'N': str(min_toxicity)}
+        },
+        'ScanIndexForward': False,
+        'Limit': limit
+    }
+    if start_key:
+        query['ExclusiveStartKey'] = start_key
+    try:
+        response = dynamodb.query(**query)
+    except ClientError as e:
+        print(f"Error querying toxicity index: {e.response['Error']['Message']}")
+        raise
+    
+    return {
+        'Items': [
+            {
+                'RunID': item['RunID']['S'],
+                'Model': run_table.model_key_from_sk(item['SK']['S']),
+                'ModelName': item.get('ModelName', {}).get('S'),
+                'Toxicity': float(item['ToxicityScore']['N'])
+            }
+            for item in response.get('Items', [])
+        ],
+        'NextCursor': paging.encode_cursor(response.get('LastEvaluatedKey'))
+    }
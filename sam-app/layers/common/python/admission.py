@@ -0,0 +1,242 @@
+import json
+import os
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+import throttling
+
+dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+
+ADMISSION_TABLE = os.environ.get('ADMISSION_TABLE')
+# Bedrock's concurrent evaluation job quota for the account and region
+SLOT_LIMIT = int(os.environ.get('EVALUATION_JOB_SLOTS', '10'))
+# Lower number admits first; interactive runs never wait behind a bulk backlog
+PRIORITIES = {'interactive': 0, 'bulk': 1}
+# A drain that dies mid-submission leaves its claim behind; after this long another drain may retry the entry
+LEASE_SECONDS = 300
+
+# The ledger and every priority class share one table, each under its own partition
+LEDGER = 'LEDGER'
+SLOTS = 'SLOTS'
+JOB_PREFIX = 'JOB#'
+QUEUE_PREFIX = 'PRIORITY#'
+
+
+def enabled():
+    return bool(ADMISSION_TABLE)
+
+
+def queue_partition(priority):
+    return f"{QUEUE_PREFIX}{PRIORITIES[priority]}"
+
+
+def is_quota_error(error):
+    # Bedrock answers a throttle when a job would go past the quota; the submission waits instead of failing
+    return throttling.is_throttle(error)
+
+
+def acquire():
+    if not enabled():
+        return True
+    try:
+        dynamodb.update_item(
+            TableName=ADMISSION_TABLE,
+            Key={'QueueKey': {'S': LEDGER}, 'EntryKey': {'S': SLOTS}},
+            UpdateExpression="ADD InFlight :one",
+            ConditionExpression="attribute_not_exists(InFlight) OR InFlight < :limit",
+            ExpressionAttributeValues={':one': {'N': '1'}, ':limit': {'N': str(SLOT_LIMIT)}}
+        )
+        return True
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        return False
+    except ClientError as e:
+        print(f"Error acquiring evaluation slot: {e.response['Error']['Message']}")
+        raise
+
+
+def hold(job_arn):
+    # One holder item per running job makes releasing the slot idempotent
+    if not enabled():
+        return
+    try:
+        dynamodb.put_item(
+            TableName=ADMISSION_TABLE,
+            Item={
+                'QueueKey': {'S': LEDGER},
+                'EntryKey': {'S': f"{JOB_PREFIX}{job_arn}"},
+                'JobArn': {'S': job_arn},
+                'AcquiredAt': {'N': str(int(time.time()))}
+            }
+        )
+    except ClientError as e:
+        print(f"Error recording evaluation slot holder: {e.response['Error']['Message']}")
+        raise
+
+
+def release(job_arn=None):
+    if not enabled():
+        return False
+    try:
+        if job_arn:
+            response = dynamodb.delete_item(
+                TableName=ADMISSION_TABLE,
+                Key={'QueueKey': {'S': LEDGER}, 'EntryKey': {'S': f"{JOB_PREFIX}{job_arn}"}},
+                ReturnValues='ALL_OLD'
+            )
+            # Already released by an earlier event or poll, or the job never held a slot
+            if 'Attributes' not in response:
+                return False
+        dynamodb.update_item(
+            TableName=ADMISSION_TABLE,
+            Key={'QueueKey': {'S': LEDGER}, 'EntryKey': {'S': SLOTS}},
+            UpdateExpression="ADD InFlight :minus_one",
+            ConditionExpression="InFlight > :zero",
+            ExpressionAttributeValues={':minus_one': {'N': '-1'}, ':zero': {'N': '0'}}
+        )
+        return True
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        return False
+    except ClientError as e:
+        print(f"Error releasing evaluation slot: {e.response['Error']['Message']}")
+        raise
+
+
+def holders():
+    return [item['JobArn']['S'] for item in query_partition(LEDGER) if item['EntryKey']['S'].startswith(JOB_PREFIX)]
+
+
+def enqueue(priority, name, submission):
+    now = time.time()
+    try:
+        dynamodb.put_item(
+            TableName=ADMISSION_TABLE,
+            Item={
+                'QueueKey': {'S': queue_partition(priority)},
+                # Millisecond prefix keeps each class first-in, first-out
+                'EntryKey': {'S': f"{int(now * 1000):013d}#{name}"},
+                'Priority': {'S': priority},
+                'Submission': {'S': json.dumps(submission)},
+                'QueuedAt': {'N': str(now)}
+            }
+        )
+    except ClientError as e:
+        print(f"Error queueing evaluation job submission: {e.response['Error']['Message']}")
+        raise
+
+
+def pending(priority, limit=None):
+    return [
+        {
+            'QueueKey': item['QueueKey']['S'],
+            'EntryKey': item['EntryKey']['S'],
+            'Priority': item['Priority']['S'],
+            'Submission': json.loads(item['Submission']['S']),
+            'QueuedAt': float(item['QueuedAt']['N'])
+        }
+        for item in query_partition(queue_partition(priority), limit or SLOT_LIMIT)
+    ]
+
+
+def waiting(priority):
+    # New work is only admitted directly when nothing of the same or a higher priority is queued ahead of it
+    if not enabled():
+        return False
+    return any(
+        query_partition(queue_partition(other), 1)
+        for other, rank in PRIORITIES.items() if rank <= PRIORITIES[priority]
+    )
+
+
+def claim(entry, lease_seconds=LEASE_SECONDS):
+    # Overlapping scheduled drains would otherwise both submit the same entry
+    now = time.time()
+    try:
+        dynamodb.update_item(
+            TableName=ADMISSION_TABLE,
+            Key={'QueueKey': {'S': entry['QueueKey']}, 'EntryKey': {'S': entry['EntryKey']}},
+            UpdateExpression="SET LeasedUntil = :until",
+            ConditionExpression="attribute_exists(EntryKey) AND (attribute_not_exists(LeasedUntil) OR LeasedUntil < :now)",
+            ExpressionAttributeValues={':until': {'N': str(now + lease_seconds)}, ':now': {'N': str(now)}}
+        )
+        return True
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        return False
+    except ClientError as e:
+        print(f"Error claiming queued evaluation job submission: {e.response['Error']['Message']}")
+        raise
+
+
+def unclaim(entry):
+    try:
+        dynamodb.update_item(
+            TableName=ADMISSION_TABLE,
+            Key={'QueueKey': {'S': entry['QueueKey']}, 'EntryKey': {'S': entry['EntryKey']}},
+            UpdateExpression="REMOVE LeasedUntil",
+            ConditionExpression="attribute_exists(EntryKey)"
+        )
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        pass
+    except ClientError as e:
+        print(f"Error releasing claim on queued evaluation job submission: {e.response['Error']['Message']}")
+        raise
+
+
+def remove(entry):
+    try:
+        dynamodb.delete_item(
+            TableName=ADMISSION_TABLE,
+            Key={'QueueKey': {'S': entry['QueueKey']}, 'EntryKey': {'S': entry['EntryKey']}}
+        )
+    except ClientError as e:
+        print(f"Error removing queued evaluation job submission: {e.response['Error']['Message']}")
+        raise
+
+
+def query_partition(partition, limit=None):
+    items = []
+    query = {
+        'TableName': ADMISSION_TABLE,
+        'KeyConditionExpression': 'QueueKey = :queue',
+        'ExpressionAttributeValues': {':queue': {'S': partition}}
+    }
+    try:
+        while True:
+            if limit:
+                query['Limit'] = limit - len(items)
+            response = dynamodb.query(**query)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response or (limit and len(items) >= limit):
+                return items[:limit] if limit else items
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    except ClientError as e:
+        print(f"Error reading admission table: {e.response['Error']['Message']}")
+        raise
+
+
+def stats():
+    if not enabled():
+        return {}
+    now = time.time()
+    try:
+        ledger = dynamodb.get_item(
+            TableName=ADMISSION_TABLE,
+            Key={'QueueKey': {'S': LEDGER}, 'EntryKey': {'S': SLOTS}}
+        ).get('Item', {})
+    except ClientError as e:
+        print(f"Error reading evaluation slot ledger: {e.response['Error']['Message']}")
+        raise
+
+    queues = {}
+    for priority in PRIORITIES:
+        waiting = query_partition(queue_partition(priority))
+        queues[priority] = {
+            'Depth': len(waiting),
+            'OldestWaitSeconds': round(now - float(waiting[0]['QueuedAt']['N']), 3) if waiting else 0
+        }
+    return {
+        'InFlight': int(ledger.get('InFlight', {}).get('N', '0')),
+        'Slots': SLOT_LIMIT,
+        'Queues': queues
+    }
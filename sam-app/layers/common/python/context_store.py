@@ -0,0 +1,48 @@
+import gzip
+import hashlib
+import os
+from functools import lru_cache
+
+import boto3
+
+s3_client = boto3.client('s3')
+
+CONTEXT_BUCKET = os.environ.get('CONTEXT_BUCKET', 'input-datas-directory')
+CONTEXT_PREFIX = 'contexts/'
+# Contexts above this many UTF-8 bytes travel as a pointer instead of inline text
+OFFLOAD_THRESHOLD = int(os.environ.get('CONTEXT_OFFLOAD_THRESHOLD', '16384'))
+PREVIEW_CHARS = 280
+
+
+def preview(text):
+    return text if len(text) <= PREVIEW_CHARS else text[:PREVIEW_CHARS].rstrip() + "..."
+
+
+def offload(text, threshold=OFFLOAD_THRESHOLD):
+    data = text.encode('utf-8')
+    if len(data) <= threshold:
+        return text, None
+
+    # Content-addressed, so resubmitting the same document reuses the same object
+    digest = hashlib.sha256(data).hexdigest()
+    key = f"{CONTEXT_PREFIX}{digest}.txt.gz"
+    s3_client.put_object(
+        Bucket=CONTEXT_BUCKET,
+        Key=key,
+        Body=gzip.compress(data),
+        ContentType='text/plain; charset=utf-8',
+        ContentEncoding='gzip'
+    )
+    return preview(text), {'Bucket': CONTEXT_BUCKET, 'Key': key, 'Sha256': digest, 'Length': len(text)}
+
+
+@lru_cache(maxsize=32)
+def load(bucket, key):
+    body = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+    return gzip.decompress(body).decode('utf-8')
+
+
+def resolve(context, context_ref=None):
+    if not context_ref:
+        return context
+    return load(context_ref['Bucket'], context_ref['Key'])
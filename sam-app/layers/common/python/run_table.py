@@ -0,0 +1,57 @@
+import hashlib
+import json
+import math
+from datetime import datetime, timezone
+
+# Item layout of the run table: one META item per run, then one item per model branch and per dataset record
+META = 'META'
+MODEL_PREFIX = 'MODEL#'
+RECORD_PREFIX = 'RECORD#'
+# Every META item shares one ListIndex partition so listings are a single time-ordered Query
+LIST_PARTITION = 'RUN'
+# Bumped whenever item attributes change shape; the migrate function rewrites anything older
+SCHEMA_VERSION = 2
+SCORE_FIELDS = ('Accuracy', 'Robustness', 'Toxicity')
+SCORE_PARTITION = 'MODEL'
+
+
+def model_sk(model_key):
+    return f"{MODEL_PREFIX}{model_key}"
+
+
+def model_key_from_sk(sort_key):
+    return sort_key[len(MODEL_PREFIX):]
+
+
+def record_sk(model_key, shard_index, line_number, part=None):
+    # Zero-padded so a model's records sort in output order; a split bulk dataset adds its part first
+    if part is not None:
+        return f"{RECORD_PREFIX}{model_key}#{int(part):04d}#{shard_index:04d}#{line_number:08d}"
+    return f"{RECORD_PREFIX}{model_key}#{shard_index:04d}#{line_number:08d}"
+
+
+def record_key(record):
+    # Identifies a dataset record by content, so coalesced evaluation output can be routed back to its runs
+    return hashlib.sha256(json.dumps(record, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def to_score_attribute(value):
+    # Numbers for real scores, an explicit NULL when the job did not compute the metric
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return {'NULL': True}
+    if not math.isfinite(number):
+        return {'NULL': True}
+    return {'N': str(number)}
+
+
+def score_index_attributes(toxicity):
+    # Index keys cannot be NULL, so only a numeric toxicity joins the sparse ToxicityIndex
+    if 'N' not in toxicity:
+        return {}
+    return {'ScorePartition': {'S': SCORE_PARTITION}, 'ToxicityScore': toxicity}
+
+
+def utc_now():
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
@@ -0,0 +1,12 @@
+# Error codes Bedrock answers with when a call is over a rate or quota, or the service is shedding load.
+# Every caller that backs off, defers or counts throttles checks this one list.
+THROTTLE_CODES = (
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceQuotaExceededException',
+    'ServiceUnavailableException'
+)
+
+
+def is_throttle(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code') in THROTTLE_CODES
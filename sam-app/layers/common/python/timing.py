@@ -0,0 +1,65 @@
+import json
+import os
+import time
+from contextlib import nullcontext
+
+import throttling
+
+# Off unless TIMING_METRICS is set; disabled spans are one shared no-op context with nothing timed or printed
+ENABLED = os.environ.get('TIMING_METRICS', 'false').lower() == 'true'
+NAMESPACE = os.environ.get('TIMING_NAMESPACE', 'LLMEval')
+FUNCTION_NAME = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+
+DISABLED = nullcontext()
+
+
+def outcome(error):
+    if error is None:
+        return 'Success'
+    return 'Throttled' if throttling.is_throttle(error) else 'Error'
+
+
+def put_metrics(values, dimensions, unit='None'):
+    # CloudWatch turns Embedded Metric Format lines in the function's log into metrics, no API call needed
+    dimensions = {'Function': FUNCTION_NAME, **{name: value for name, value in dimensions.items() if value}}
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': unit} for name in values]
+            }]
+        },
+        **dimensions,
+        **values
+    }))
+
+
+def emit(stage, model_id, result, duration_ms):
+    put_metrics({'Duration': round(duration_ms, 2)}, {'Stage': stage, 'Outcome': result, 'ModelId': model_id}, 'Milliseconds')
+
+
+def gauge(values, dimensions):
+    if ENABLED:
+        put_metrics(values, dimensions, 'Count')
+
+
+class Span:
+    def __init__(self, stage, model_id=None):
+        self.stage = stage
+        self.model_id = model_id
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, error, traceback):
+        emit(self.stage, self.model_id, outcome(error), (time.perf_counter() - self.started) * 1000)
+        return False
+
+
+def span(stage, model_id=None):
+    if not ENABLED:
+        return DISABLED
+    return Span(stage, model_id)
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Lambda layers are unpacked onto /opt/python; tests put the layer source on the path instead
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'layers', 'common', 'python'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('MODEL_RESULT_TABLE', 'ModelResultTable')
+os.environ.setdefault('JOB_CALLBACK_TABLE', 'JobCallbackTable')
+os.environ.setdefault('CONNECTION_TABLE', 'ConnectionTable')
+os.environ.setdefault('LEADERBOARD_TABLE', 'LeaderboardTable')
+os.environ.setdefault('ROLE_ARN', 'arn:aws:iam::123456789012:role/BedrockRole')
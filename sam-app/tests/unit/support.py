@@ -0,0 +1,423 @@
+import contextlib
+import copy
+import importlib.util
+import io
+import json
+import os
+import re
+import sys
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+APP_DIR = os.path.join(os.path.dirname(__file__), '..', '..')
+FUNCTIONS_DIR = os.path.join(APP_DIR, 'functions')
+EVENTS_DIR = os.path.join(APP_DIR, 'events')
+
+
+def load_module(function_name, module_name='app'):
+    function_dir = os.path.join(FUNCTIONS_DIR, function_name)
+    # Lambda puts the function directory on sys.path, so sibling modules import by bare name
+    if function_dir not in sys.path:
+        sys.path.insert(0, function_dir)
+    spec = importlib.util.spec_from_file_location(
+        f"{function_name}_{module_name}", os.path.join(function_dir, f"{module_name}.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_function(name):
+    return load_module(name)
+
+
+def load_event(name):
+    with open(os.path.join(EVENTS_DIR, name)) as f:
+        return json.load(f)
+
+
+class FakeDynamoDBClient:
+    """In-memory stand-in for the low-level DynamoDB client, keyed by table name."""
+
+    def __init__(self, key_names):
+        self.key_names = key_names
+        self.tables = {name: {} for name in key_names}
+        self.exceptions = SimpleNamespace(
+            ConditionalCheckFailedException=type('ConditionalCheckFailedException', (Exception,), {}),
+            TransactionCanceledException=type('TransactionCanceledException', (ClientError,), {}),
+        )
+
+    def _key(self, table_name, key):
+        return tuple(key[name]['S'] for name in self.key_names[table_name])
+
+    def seed(self, table_name, item):
+        self.tables[table_name][self._key(table_name, item)] = item
+
+    def get_item(self, TableName, Key, **kwargs):
+        item = self.tables[TableName].get(self._key(TableName, Key))
+        return {'Item': item} if item is not None else {}
+
+    def put_item(self, TableName, Item, ConditionExpression=None, ExpressionAttributeValues=None, **kwargs):
+        current = self.tables[TableName].get(self._key(TableName, Item), {})
+        self._check(current, ConditionExpression, {}, ExpressionAttributeValues or {})
+        self.seed(TableName, Item)
+        return {}
+
+    def batch_write_item(self, RequestItems):
+        for table_name, requests in RequestItems.items():
+            for request in requests:
+                self.seed(table_name, request['PutRequest']['Item'])
+        return {'UnprocessedItems': {}}
+
+    def transact_write_items(self, TransactItems):
+        """All or nothing over Put and Update, cancelling with one reason per item as DynamoDB does."""
+        snapshot = copy.deepcopy(self.tables)
+        reasons = []
+        for entry in TransactItems:
+            try:
+                if 'Put' in entry:
+                    self.put_item(**entry['Put'])
+                else:
+                    self.update_item(**entry['Update'])
+                reasons.append({'Code': 'None'})
+            except self.exceptions.ConditionalCheckFailedException:
+                reasons.append({'Code': 'ConditionalCheckFailed'})
+        if any(reason['Code'] != 'None' for reason in reasons):
+            self.tables = snapshot
+            raise self.exceptions.TransactionCanceledException(
+                {'Error': {'Code': 'TransactionCanceledException', 'Message': 'Transaction cancelled'}, 'CancellationReasons': reasons},
+                'TransactWriteItems'
+            )
+        return {}
+
+    def scan(self, TableName, **kwargs):
+        return {'Items': list(self.tables[TableName].values())}
+
+    def _check(self, item, condition, names, values):
+        """Evaluates AND-ed attribute_exists / attribute_not_exists / equality clauses against an item."""
+        for clause in (condition or '').split(' AND '):
+            clause = clause.strip()
+            exists = re.fullmatch(r'attribute_(not_)?exists\((.+)\)', clause)
+            equals = re.fullmatch(r'(\S+)\s*=\s*(:\w+)', clause)
+            if exists:
+                present = item.get(names.get(exists.group(2), exists.group(2))) is not None
+                failed = present == bool(exists.group(1))
+            elif equals:
+                failed = item.get(names.get(equals.group(1), equals.group(1))) != values[equals.group(2)]
+            else:
+                continue
+            if failed:
+                raise self.exceptions.ConditionalCheckFailedException(condition)
+
+    def delete_item(self, TableName, Key, ReturnValues='NONE', **kwargs):
+        item = self.tables[TableName].pop(self._key(TableName, Key), None)
+        return {'Attributes': item} if ReturnValues == 'ALL_OLD' and item is not None else {}
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues, **kwargs):
+        # Equality on a single key attribute is enough for the index lookups the functions make
+        name, placeholder = [part.strip() for part in KeyConditionExpression.split('=')]
+        wanted = ExpressionAttributeValues[placeholder]
+        return {'Items': [item for item in self.tables[TableName].values() if item.get(name) == wanted]}
+
+    def get_paginator(self, operation_name):
+        return SimpleNamespace(paginate=lambda **kwargs: [getattr(self, operation_name)(**kwargs)])
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ConditionExpression=None, ReturnValues='NONE', **kwargs):
+        """Understands the subset of update expressions the functions use: SET (with if_not_exists), ADD and REMOVE."""
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        key = self._key(TableName, Key)
+        # Conditions see the stored item, so attribute_exists on a key attribute fails for a missing one
+        item = copy.deepcopy(self.tables[TableName].get(key, {}))
+
+        def path(expression):
+            return [names.get(part, part) for part in expression.strip().split('.')]
+
+        def lookup(parts):
+            value = {'M': item}
+            for part in parts:
+                value = value.get('M', {}).get(part)
+                if value is None:
+                    return None
+            return value
+
+        def assign(parts, value):
+            target = item
+            for part in parts[:-1]:
+                target = target[part]['M']
+            target[parts[-1]] = value
+
+        def holds(clause):
+            exists = re.fullmatch(r'attribute_(not_)?exists\((.+)\)', clause)
+            contains = re.fullmatch(r'(NOT\s+)?contains\((.+),\s*(:\w+)\)', clause)
+            if contains:
+                present = values[contains.group(3)]['S'] in (lookup(path(contains.group(2))) or {}).get('SS', [])
+                return present != bool(contains.group(1))
+            member = re.fullmatch(r'(NOT\s+)?(\S+)\s+IN\s+\(([^)]*)\)?', clause)
+            if member:
+                current = lookup(path(member.group(2)))
+                inside = current is not None and current in [values[name.strip()] for name in member.group(3).split(',')]
+                return inside != bool(member.group(1))
+            compare = re.fullmatch(r'(\S+)\s*(<|>|=|<>)\s*(:\w+)', clause)
+            if exists:
+                return (lookup(path(exists.group(2))) is not None) != bool(exists.group(1))
+            if compare:
+                current = lookup(path(compare.group(1)))
+                if current is None:
+                    return False
+                wanted = values[compare.group(3)]
+                if 'S' in current:
+                    left, right = current['S'], wanted['S']
+                else:
+                    left, right = float(current['N']), float(wanted['N'])
+                return {'<': left < right, '>': left > right, '=': left == right, '<>': left != right}[compare.group(2)]
+            return True
+
+        for clause in (ConditionExpression or '').split(' AND '):
+            clause = clause.strip()
+            if clause.startswith('(') and clause.endswith(')'):
+                clause = clause[1:-1]
+            if not any(holds(alternative.strip()) for alternative in clause.split(' OR ')):
+                raise self.exceptions.ConditionalCheckFailedException(ConditionExpression)
+
+        item = {**dict(Key), **item}
+        touched = []
+        for action, body in re.findall(r'(SET|ADD|REMOVE)\s+(.*?)(?=\s+(?:SET|ADD|REMOVE)\s|$)', UpdateExpression):
+            for assignment in re.split(r',\s*(?![^()]*\))', body):
+                if action == 'REMOVE':
+                    item.pop(path(assignment)[0], None)
+                    continue
+                if action == 'SET':
+                    target, source = assignment.split('=', 1)
+                    default = re.fullmatch(r'\s*if_not_exists\((.+),\s*(:\w+)\)\s*', source)
+                    if default:
+                        value = lookup(path(default.group(1))) or values[default.group(2)]
+                    else:
+                        value = values[source.strip()]
+                    parts = path(target)
+                else:
+                    target, source = assignment.split()
+                    parts = path(target)
+                    current = lookup(parts)
+                    if 'SS' in values[source]:
+                        value = {'SS': sorted(set((current or {}).get('SS', [])) | set(values[source]['SS']))}
+                    else:
+                        value = {'N': str(int(current['N'] if current else 0) + int(values[source]['N']))}
+                assign(parts, value)
+                touched.append(parts[0])
+
+        self.tables[TableName][key] = item
+        if ReturnValues == 'UPDATED_NEW':
+            return {'Attributes': {name: item[name] for name in touched}}
+        if ReturnValues == 'ALL_NEW':
+            return {'Attributes': copy.deepcopy(item)}
+        return {}
+
+
+class FakeStepFunctionsClient:
+    def __init__(self, fail_with=None):
+        self.exceptions = SimpleNamespace(
+            TaskTimedOut=type('TaskTimedOut', (Exception,), {}),
+            InvalidToken=type('InvalidToken', (Exception,), {}),
+        )
+        self.fail_with = fail_with
+        self.successes = []
+        self.failures = []
+
+    def send_task_success(self, taskToken, output):
+        if self.fail_with:
+            raise getattr(self.exceptions, self.fail_with)(taskToken)
+        self.successes.append({'taskToken': taskToken, 'output': output})
+
+    def send_task_failure(self, taskToken, error, cause):
+        self.failures.append({'taskToken': taskToken, 'error': error, 'cause': cause})
+
+
+class FakeBedrockClient:
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    def get_evaluation_job(self, jobIdentifier):
+        return self.jobs[jobIdentifier]
+
+
+class FakeS3Client:
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})
+        self.uploads = {}
+
+    def list_objects_v2(self, Bucket, Prefix, **kwargs):
+        keys = sorted(k for (b, k) in self.objects if b == Bucket and k.startswith(Prefix))
+        return {'Contents': [{'Key': k} for k in keys]}
+
+    def get_object(self, Bucket, Key):
+        body = self.objects[(Bucket, Key)]
+        return {'Body': StreamingBody(io.BytesIO(body), len(body))}
+
+    def get_paginator(self, operation_name):
+        return SimpleNamespace(paginate=lambda **kwargs: [getattr(self, operation_name)(**kwargs)])
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = Body.encode('utf-8') if isinstance(Body, str) else Body
+        return {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = f"upload-{len(self.uploads) + 1}"
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': f'"{UploadId}-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        parts = self.uploads.pop(UploadId)
+        self.objects[(Bucket, Key)] = b"".join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self.uploads.pop(UploadId, None)
+        return {}
+
+
+class FakeTable:
+    """Records calls made against a boto3 resource-style DynamoDB table."""
+
+    def __init__(self, name, key_names=('RunID',)):
+        self.name = name
+        self.key_names = (key_names,) if isinstance(key_names, str) else tuple(key_names)
+        self.items = {}
+        self.calls = []
+
+    def _key(self, item):
+        # Single-key tables are indexed by the bare value, composite ones by a tuple
+        key = tuple(item[name] for name in self.key_names)
+        return key[0] if len(key) == 1 else key
+
+    def put_item(self, Item, **kwargs):
+        self.calls.append(('put_item', Item))
+        self.items[self._key(Item)] = Item
+        return {}
+
+    def batch_writer(self):
+        return contextlib.nullcontext(self)
+
+    def update_item(self, Key, **kwargs):
+        self.calls.append(('update_item', {'Key': Key, **kwargs}))
+        self._update(Key, kwargs)
+        return {}
+
+    def _update(self, Key, kwargs):
+        """Applies plain SET / REMOVE to a stored item, checking simple existence and < conditions first."""
+        item = self.items.get(self._key(Key), {})
+        values = kwargs.get('ExpressionAttributeValues', {})
+        names = kwargs.get('ExpressionAttributeNames', {})
+
+        def holds(clause):
+            exists = re.fullmatch(r'attribute_(not_)?exists\((\w+)\)', clause)
+            compare = re.fullmatch(r'(\w+)\s*<\s*(:\w+)', clause)
+            if exists:
+                return (exists.group(2) in item) != bool(exists.group(1))
+            if compare:
+                return compare.group(1) in item and item[compare.group(1)] < values[compare.group(2)]
+            return True
+
+        for clause in kwargs.get('ConditionExpression', '').split(' AND '):
+            alternatives = clause.strip().strip('()').split(' OR ')
+            if clause and not any(holds(alternative.strip()) for alternative in alternatives):
+                raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'condition failed'}}, 'UpdateItem')
+
+        item = {**Key, **item}
+        action, body = kwargs['UpdateExpression'].split(' ', 1)
+        if action not in ('SET', 'REMOVE'):
+            return
+        # Commas inside if_not_exists(...) do not separate assignments
+        for assignment in re.split(r',(?![^()]*\))', body):
+            if action == 'REMOVE':
+                item.pop(names.get(assignment.strip(), assignment.strip()), None)
+                continue
+            target, source = (part.strip() for part in assignment.split('=', 1))
+            *parents, leaf = [names.get(name, name) for name in target.split('.')]
+            default = re.fullmatch(r'if_not_exists\((\S+),\s*(:\w+)\)', source)
+            container = item
+            for parent in parents:
+                container = container.setdefault(parent, {})
+            if default:
+                container.setdefault(leaf, values[default.group(2)])
+            else:
+                container[leaf] = values[source]
+        self.items[self._key(Key)] = item
+
+    def get_item(self, Key, **kwargs):
+        item = self.items.get(self._key(Key))
+        return {'Item': item} if item is not None else {}
+
+    def delete_item(self, Key, **kwargs):
+        self.calls.append(('delete_item', Key))
+        self.items.pop(self._key(Key), None)
+        return {}
+
+    def scan(self, **kwargs):
+        return {'Items': list(self.items.values())}
+
+
+class FakeDynamoDBResource:
+    def __init__(self, key_names=None):
+        self.key_names = key_names or {}
+        self.tables = {}
+
+    def Table(self, name):
+        if name not in self.tables:
+            self.tables[name] = FakeTable(name, self.key_names.get(name, ('RunID', 'SK')))
+        return self.tables[name]
+
+
+class FakeBedrockRuntimeClient:
+    def __init__(self, responses, headers=None):
+        self.responses = responses
+        self.headers = headers or {}
+        self.invocations = []
+
+    def invoke_model(self, body, modelId, **kwargs):
+        self.invocations.append({'body': json.loads(body), 'modelId': modelId})
+        return {
+            'body': io.BytesIO(json.dumps(self.responses[modelId]).encode('utf-8')),
+            'ResponseMetadata': {'HTTPHeaders': self.headers.get(modelId, {})},
+        }
+
+    def invoke_model_with_response_stream(self, body, modelId, **kwargs):
+        self.invocations.append({'body': json.loads(body), 'modelId': modelId, 'stream': True})
+        return {'body': [{'chunk': {'bytes': json.dumps(chunk).encode('utf-8')}} for chunk in self.responses[modelId]]}
+
+
+class FakeBedrockJobClient:
+    def __init__(self, status='InProgress', quota=None):
+        self.status = status
+        self.quota = quota
+        self.created = []
+
+    def create_evaluation_job(self, **kwargs):
+        if self.quota is not None and len(self.created) >= self.quota:
+            raise ClientError({'Error': {'Code': 'ServiceQuotaExceededException', 'Message': 'quota reached'}}, 'CreateEvaluationJob')
+        self.created.append(kwargs)
+        return {'jobArn': f"arn:aws:bedrock:us-east-1:123456789012:evaluation-job/job{len(self.created)}"}
+
+    def get_evaluation_job(self, jobIdentifier):
+        return {'jobArn': jobIdentifier, 'status': self.status}
+
+
+class FakeConnectionBroker:
+    """Local stand-in for the API Gateway management API: collects pushed messages per connection."""
+
+    def __init__(self, gone=()):
+        self.exceptions = SimpleNamespace(GoneException=type('GoneException', (Exception,), {}))
+        self.gone = set(gone)
+        self.messages = {}
+
+    def post_to_connection(self, ConnectionId, Data):
+        if ConnectionId in self.gone:
+            raise self.exceptions.GoneException(ConnectionId)
+        self.messages.setdefault(ConnectionId, []).append(json.loads(Data))
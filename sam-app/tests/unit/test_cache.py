@@ -0,0 +1,49 @@
+import pytest
+
+from .support import FakeTable, load_module
+
+
+@pytest.fixture()
+def cache():
+    return load_module('model', 'cache')
+
+
+def test_lru_evicts_least_recently_used(cache):
+    store = cache.GenerationCache(max_entries=2)
+    store.put('a', 'A')
+    store.put('b', 'B')
+    store.get('a')
+    store.put('c', 'C')
+
+    assert store.get('b') is None
+    assert store.get('a') == 'A'
+    assert store.get('c') == 'C'
+
+
+def test_expired_entries_are_misses(cache, monkeypatch):
+    table = FakeTable('GenerationCacheTable', 'CacheKey')
+    store = cache.GenerationCache(table, ttl_seconds=60)
+    store.put('a', 'A')
+
+    now = cache.time.time()
+    monkeypatch.setattr(cache.time, 'time', lambda: now + 120)
+
+    assert store.get('a') is None
+    assert store.stats()['misses'] == 1
+
+
+def test_persistent_tier_serves_cold_container(cache):
+    table = FakeTable('GenerationCacheTable', 'CacheKey')
+    cache.GenerationCache(table).put('a', {'text': 'A'})
+
+    cold = cache.GenerationCache(table)
+
+    assert cold.get('a') == {'text': 'A'}
+    assert cold.get('a') == {'text': 'A'}
+    assert cold.stats() == {'memory_hits': 1, 'persistent_hits': 1, 'misses': 0, 'entries': 1}
+
+
+def test_key_depends_on_every_part(cache):
+    assert cache.make_key('m', 'body') == cache.make_key('m', 'body')
+    assert cache.make_key('m', 'body') != cache.make_key('m', 'body2')
+    assert cache.make_key('m', 'body') != cache.make_key('n', 'body')
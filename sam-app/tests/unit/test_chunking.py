@@ -0,0 +1,40 @@
+import pytest
+
+from .support import load_module
+
+
+@pytest.fixture()
+def chunking():
+    return load_module('model', 'chunking')
+
+
+def test_short_text_is_a_single_chunk(chunking):
+    assert chunking.split_text("one. two.", 100) == ["one. two."]
+
+
+def test_chunks_respect_budget_and_paragraph_boundaries(chunking):
+    paragraphs = [f"Paragraph {i} says something. It has two sentences." for i in range(20)]
+    text = "\n\n".join(paragraphs)
+
+    chunks = chunking.split_text(text, 200)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert "\n\n".join(chunks) == text
+
+
+def test_oversized_sentences_fall_back_to_words(chunking):
+    text = " ".join(["word"] * 100)
+
+    chunks = chunking.split_text(text, 50)
+
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_budget_follows_model_family_window(chunking):
+    titan = chunking.get_chunk_budget('amazon.titan-text-express-v1', 512)
+    claude = chunking.get_chunk_budget('anthropic.claude-3-haiku-20240307-v1:0', 512)
+
+    assert titan < claude
+    assert chunking.get_chunk_budget('anthropic.claude-3-haiku-20240307-v1:0', 512, chunk_tokens=500) == 500 * chunking.CHARS_PER_TOKEN
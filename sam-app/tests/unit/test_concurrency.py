@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+from .support import load_module
+
+
+@pytest.fixture()
+def concurrency():
+    return load_module('model', 'concurrency')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def call(limiter, clock, key='model', latency=1.0, error=None):
+    with limiter.slot(key):
+        clock.now += latency
+        if error:
+            raise ClientError({'Error': {'Code': error, 'Message': error}}, 'InvokeModel')
+
+
+def test_limit_grows_additively_while_latency_holds(concurrency):
+    clock = FakeClock()
+    limiter = concurrency.AdaptiveLimiter(initial=4, clock=clock)
+
+    for _ in range(4):
+        call(limiter, clock)
+
+    assert limiter.stats()['limits']['model'] == pytest.approx(5, abs=0.1)
+
+
+def test_throttle_halves_the_limit_once_per_round(concurrency):
+    clock = FakeClock()
+    limiter = concurrency.AdaptiveLimiter(initial=8, clock=clock)
+    started = clock.now
+    clock.now += 1
+
+    # Two calls that were already in flight when the first throttle landed
+    limiter.complete('model', started, 1.0, True)
+    limiter.complete('model', started, 1.0, True)
+
+    stats = limiter.stats()
+    assert stats['limits']['model'] == 4
+    assert (stats['throttles'], stats['decreases']) == (2, 1)
+
+
+def test_latency_inflation_backs_off_without_throttles(concurrency):
+    clock = FakeClock()
+    limiter = concurrency.AdaptiveLimiter(initial=8, tolerance=2.0, clock=clock)
+    for _ in range(5):
+        call(limiter, clock, latency=1.0)
+    before = limiter.stats()['limits']['model']
+
+    for _ in range(5):
+        call(limiter, clock, latency=5.0)
+
+    assert limiter.stats()['limits']['model'] < before / 2 + 1
+
+
+def test_throttle_error_is_recorded_and_reraised(concurrency):
+    clock = FakeClock()
+    limiter = concurrency.AdaptiveLimiter(initial=2, clock=clock)
+
+    with pytest.raises(ClientError):
+        call(limiter, clock, error='ThrottlingException')
+
+    assert limiter.stats()['limits']['model'] == 1
+    assert limiter.keys['model']['InFlight'] == 0
+
+
+def test_in_flight_calls_never_exceed_the_limit(concurrency):
+    limiter = concurrency.AdaptiveLimiter(initial=2, maximum=2)
+    lock = threading.Lock()
+    active = []
+    peak = []
+
+    def work():
+        with limiter.slot('model'):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            threading.Event().wait(0.01)
+            with lock:
+                active.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2
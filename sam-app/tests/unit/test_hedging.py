@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from .support import load_module
+
+CLAUDE = 'anthropic.claude-3-haiku-20240307-v1:0'
+
+
+@pytest.fixture()
+def hedging():
+    return load_module('model', 'hedging')
+
+
+def warmed(hedging, budget=1.0, seconds=0.01):
+    tracker = hedging.LatencyTracker()
+    for _ in range(hedging.MIN_SAMPLES):
+        tracker.record(CLAUDE, seconds)
+    return hedging.Hedger(max_workers=4, tracker=tracker, budget=hedging.HedgeBudget(ratio=budget))
+
+
+def slow_primary(release):
+    calls = []
+
+    def invoke(target):
+        calls.append(target)
+        if target == CLAUDE:
+            release.wait(5)
+            return 'primary', 5
+        return 'hedge', 0.01
+    return invoke, calls
+
+
+def test_slow_call_is_hedged_through_cross_region_profile(hedging):
+    release = threading.Event()
+    hedger = warmed(hedging)
+    invoke, calls = slow_primary(release)
+
+    started = time.monotonic()
+    result = hedger.call(CLAUDE, invoke)
+    release.set()
+
+    assert result == 'hedge'
+    assert time.monotonic() - started < 1
+    assert calls == [CLAUDE, f"us.{CLAUDE}"]
+    assert hedger.stats()['hedge_wins'] == 1
+
+
+def test_exhausted_budget_waits_for_the_primary(hedging):
+    release = threading.Event()
+    hedger = warmed(hedging, budget=0.0)
+    invoke, calls = slow_primary(release)
+    threading.Timer(0.1, release.set).start()
+
+    assert hedger.call(CLAUDE, invoke) == 'primary'
+    assert calls == [CLAUDE]
+    assert hedger.stats()['denied'] == 1
+
+
+def test_no_hedging_until_latency_is_known(hedging):
+    hedger = hedging.Hedger(max_workers=2)
+
+    assert hedger.call(CLAUDE, lambda target: (target, 0.2)) == CLAUDE
+    assert hedger.stats()['hedges'] == 0
+    assert len(hedger.tracker.samples[CLAUDE]) == 1
+
+
+def test_failed_primary_falls_back_to_hedge(hedging):
+    hedger = warmed(hedging)
+    release = threading.Event()
+
+    def invoke(target):
+        if target == CLAUDE:
+            release.wait(0.2)
+            raise Exception('primary failed')
+        release.wait(0.5)
+        return 'hedge', 0.5
+
+    assert hedger.call(CLAUDE, invoke) == 'hedge'
+
+
+def test_tracker_records_round_trip_reported_by_the_call(hedging):
+    hedger = hedging.Hedger(max_workers=2)
+
+    # However long the call queued locally, only the Bedrock round trip it reports is tracked
+    hedger.call(CLAUDE, lambda target: (target, 0.25))
+
+    assert list(hedger.tracker.samples[CLAUDE]) == [0.25]
@@ -0,0 +1,319 @@
+import json
+
+import pytest
+
+from .support import (
+    FakeBedrockClient,
+    FakeDynamoDBClient,
+    FakeS3Client,
+    FakeStepFunctionsClient,
+    load_event,
+    load_function,
+)
+
+JOB_ARN = 'arn:aws:bedrock:us-east-1:123456789012:evaluation-job/abcd1234efgh'
+MODEL_ID = 'anthropic.claude-3-haiku-20240307-v1:0'
+RESULT_PREFIX = f"r1_model1/summ-eval-abcd1234/abcd1234efgh/models/{MODEL_ID}/taskTypes/Summarization/datasets/CustomDataset/"
+
+
+@pytest.fixture()
+def check_status():
+    app = load_function('check_status')
+    app.dynamodb = FakeDynamoDBClient({
+        'ModelResultTable': ['RunID', 'SK'],
+        'JobCallbackTable': ['JobArn'],
+    })
+    app.dynamodb.seed('ModelResultTable', {'RunID': {'S': 'r1'}, 'SK': {'S': 'META'}, 'ModelCount': {'N': '2'}})
+    app.dynamodb.seed('ModelResultTable', {
+        'RunID': {'S': 'r1'},
+        'SK': {'S': 'MODEL#model1'},
+        'ModelName': {'S': MODEL_ID},
+        'ARN': {'S': JOB_ARN},
+    })
+    app.dynamodb.seed('JobCallbackTable', {
+        'JobArn': {'S': JOB_ARN},
+        'RunID': {'S': 'r1'},
+        'Model': {'S': 'model1'},
+        'TaskToken': {'S': 'token-1'},
+    })
+    app.bedrock_client = FakeBedrockClient({
+        JOB_ARN: {
+            'status': 'Completed',
+            'jobName': 'summ-eval-abcd1234',
+            'outputDataConfig': {'s3Uri': 's3://outputs-data-directory/r1_model1/'},
+            'inferenceConfig': {'models': [{'bedrockModel': {'modelIdentifier': MODEL_ID}}]},
+        }
+    })
+    record = {
+        'inputRecord': {'prompt': 'ctx', 'referenceResponse': 'a summary'},
+        'automatedEvaluationResult': {'scores': [
+            {'metricName': 'Accuracy', 'result': 0.5},
+            {'metricName': 'Robustness', 'result': 0.1},
+        ]},
+    }
+    app.s3_client = FakeS3Client({
+        ('outputs-data-directory', RESULT_PREFIX + 'output.jsonl'): (json.dumps(record) + '\n').encode('utf-8'),
+    })
+    app.stepfunctions = FakeStepFunctionsClient()
+    return app
+
+
+def run_item(check_status, sort_key):
+    return check_status.dynamodb.get_item(TableName='ModelResultTable', Key={'RunID': {'S': 'r1'}, 'SK': {'S': sort_key}})['Item']
+
+
+def test_completed_event_resumes_waiting_branch(check_status):
+    ret = check_status.lambda_handler(load_event('evaluation-job-state-change.json'), None)
+
+    assert json.loads(ret['body'])['status'] == 'Completed'
+    [success] = check_status.stepfunctions.successes
+    assert success['taskToken'] == 'token-1'
+    output = json.loads(success['output'])
+    assert json.loads(output['body'])['results']['Accuracy'] == {'N': '0.5'}
+    assert check_status.dynamodb.get_item(TableName='JobCallbackTable', Key={'JobArn': {'S': JOB_ARN}}) == {}
+    item = run_item(check_status, 'MODEL#model1')
+    assert item['Summary'] == {'S': 'a summary'}
+    assert item['Toxicity'] == {'NULL': True}
+    assert item['SchemaVersion'] == {'N': '2'}
+    assert 'ToxicityScore' not in item
+
+
+def test_event_for_unknown_job_is_ignored(check_status):
+    event = load_event('evaluation-job-state-change.json')
+    event['detail']['jobArn'] = 'arn:aws:bedrock:us-east-1:123456789012:evaluation-job/unknown'
+
+    ret = check_status.lambda_handler(event, None)
+
+    assert json.loads(ret['body'])['status'] == 'Ignored'
+    assert check_status.stepfunctions.successes == []
+
+
+def test_in_progress_event_keeps_branch_parked(check_status):
+    check_status.bedrock_client.jobs[JOB_ARN]['status'] = 'InProgress'
+
+    ret = check_status.lambda_handler(load_event('evaluation-job-state-change.json'), None)
+
+    assert json.loads(ret['body'])['status'] == 'In Progress'
+    assert check_status.stepfunctions.successes == []
+    assert 'Item' in check_status.dynamodb.get_item(TableName='JobCallbackTable', Key={'JobArn': {'S': JOB_ARN}})
+
+
+def test_expired_token_still_clears_callback(check_status):
+    check_status.stepfunctions = FakeStepFunctionsClient(fail_with='TaskTimedOut')
+
+    check_status.lambda_handler(load_event('evaluation-job-state-change.json'), None)
+
+    assert check_status.dynamodb.get_item(TableName='JobCallbackTable', Key={'JobArn': {'S': JOB_ARN}}) == {}
+
+
+def test_run_completes_once_every_model_is_scored(check_status):
+    check_status.lambda_handler(load_event('evaluation-job-state-change.json'), None)
+    assert run_item(check_status, 'META')['Status'] == {'S': 'Running'}
+
+    results = {'Accuracy': {'N': '0.9'}, 'Summary': {'S': 'another summary'}}
+    assert check_status.update_dynamodb_with_results('r1', 'model2', MODEL_ID, results) is True
+
+    assert run_item(check_status, 'META')['CompletedCount'] == {'N': '2'}
+    assert run_item(check_status, 'META')['Status'] == {'S': 'Completed'}
+    assert run_item(check_status, 'MODEL#model1')['Accuracy'] == {'N': '0.5'}
+    assert run_item(check_status, 'MODEL#model2')['Accuracy'] == {'N': '0.9'}
+
+
+def test_last_completion_flips_status_in_the_same_transaction(check_status, monkeypatch):
+    transactions = []
+    transact = check_status.dynamodb.transact_write_items
+    monkeypatch.setattr(check_status.dynamodb, 'transact_write_items', lambda **kwargs: transactions.append(kwargs) or transact(**kwargs))
+    monkeypatch.setattr(check_status, 'update_run_status', lambda *args: pytest.fail('status needs no follow-up write'))
+    check_status.dynamodb.seed('ModelResultTable', {'RunID': {'S': 'r1'}, 'SK': {'S': 'META'}, 'ModelCount': {'N': '1'}})
+
+    check_status.lambda_handler(load_event('evaluation-job-state-change.json'), None)
+
+    [transaction] = transactions
+    assert [entry['Update']['Key']['SK'] for entry in transaction['TransactItems']] == [{'S': 'MODEL#model1'}, {'S': 'META'}]
+    assert run_item(check_status, 'META')['Status'] == {'S': 'Completed'}
+
+
+def test_late_completion_keeps_run_failed(check_status):
+    run_item(check_status, 'META')['Status'] = {'S': 'Failed'}
+
+    ret = check_status.lambda_handler(load_event('evaluation-job-state-change.json'), None)
+
+    assert json.loads(ret['body'])['status'] == 'Completed'
+    meta = run_item(check_status, 'META')
+    assert meta['Status'] == {'S': 'Failed'}
+    assert meta['CompletedCount'] == {'N': '1'}
+
+
+def test_duplicate_completion_is_counted_once(check_status):
+    check_status.lambda_handler(load_event('evaluation-job-state-change.json'), None)
+
+    ret = check_status.lambda_handler({'RunID': 'r1', 'Model': 'model1'}, None)
+
+    assert json.loads(ret['body'])['status'] == 'Completed'
+    assert run_item(check_status, 'META')['CompletedCount'] == {'N': '1'}
+
+
+def test_precomputed_scores_map_back_to_generated_summary(check_status):
+    record = {
+        'inputRecord': {
+            'prompt': 'ctx',
+            'referenceResponse': 'gold summary',
+            'modelResponses': [{'response': 'our summary', 'modelIdentifier': 'claude'}],
+        },
+        'automatedEvaluationResult': {'scores': [{'metricName': 'Toxicity', 'result': 0.01}]},
+    }
+
+    results = check_status.process_jsonl_content(json.dumps(record))
+
+    assert results['Summary'] == {'S': 'our summary'}
+    assert results['Toxicity'] == {'N': '0.01'}
+    assert results['Accuracy'] == {'NULL': True}
+
+
+def test_every_output_record_is_scored_across_shards(check_status):
+    lines = [
+        json.dumps({
+            'inputRecord': {'prompt': f'doc {i}', 'referenceResponse': f'summary {i}'},
+            'automatedEvaluationResult': {'scores': [{'metricName': 'Accuracy', 'result': i / 10}]},
+        })
+        for i in range(60)
+    ]
+    check_status.s3_client.objects = {
+        ('outputs-data-directory', RESULT_PREFIX + 'part-0.jsonl'): ('\n'.join(lines[:40]) + '\n').encode('utf-8'),
+        ('outputs-data-directory', RESULT_PREFIX + 'part-1.jsonl'): ('\n'.join(lines[40:]) + '\n').encode('utf-8'),
+    }
+
+    results = check_status.process_evaluation_results('r1', 'model1', JOB_ARN, 's3://outputs-data-directory/r1_model1/')
+
+    assert results['Records'] == {'N': '60'}
+    assert float(results['Accuracy']['N']) == pytest.approx(sum(i / 10 for i in range(60)) / 60)
+    assert results['ScoreStats']['M']['Accuracy']['M']['Max'] == {'N': '5.9'}
+    assert results['Summary'] == {'S': 'summary 0'}
+    records = [key for key in check_status.dynamodb.tables['ModelResultTable'] if key[1].startswith('RECORD#model1#')]
+    assert len(records) == 60
+    last = check_status.dynamodb.tables['ModelResultTable'][('r1', 'RECORD#model1#0001#00000020')]
+    assert last['Accuracy'] == {'N': '5.9'}
+
+
+def test_coalesced_job_splits_results_between_runs(check_status):
+    shared = {'prompt': 'shared doc', 'referenceResponse': 'shared summary'}
+    own = {'prompt': 'r2 doc', 'referenceResponse': 'r2 summary'}
+    check_status.s3_client.objects = {
+        ('outputs-data-directory', RESULT_PREFIX + 'output.jsonl'): '\n'.join(
+            json.dumps({'inputRecord': record, 'automatedEvaluationResult': {'scores': [{'metricName': 'Accuracy', 'result': score}]}})
+            for record, score in [(shared, 0.4), (own, 0.8)]
+        ).encode('utf-8'),
+        ('input-datas-directory', 'coalesced/b1.manifest.json'): json.dumps({
+            'Records': {
+                check_status.run_table.record_key(shared): [{'RunID': 'r1', 'Model': 'model1'}, {'RunID': 'r2', 'Model': 'model1'}],
+                check_status.run_table.record_key(own): [{'RunID': 'r2', 'Model': 'model1'}],
+            },
+            'Members': [
+                {'RunID': 'r1', 'Model': 'model1', 'TaskToken': 'token-1'},
+                {'RunID': 'r2', 'Model': 'model1', 'TaskToken': 'token-2'},
+            ],
+        }).encode('utf-8'),
+    }
+    check_status.dynamodb.seed('ModelResultTable', {'RunID': {'S': 'r2'}, 'SK': {'S': 'META'}, 'ModelCount': {'N': '1'}})
+    check_status.dynamodb.seed('ModelResultTable', {'RunID': {'S': 'r2'}, 'SK': {'S': 'MODEL#model1'}, 'ModelName': {'S': MODEL_ID}})
+    check_status.dynamodb.seed('JobCallbackTable', {
+        'JobArn': {'S': JOB_ARN},
+        'Manifest': {'M': {'Bucket': {'S': 'input-datas-directory'}, 'Key': {'S': 'coalesced/b1.manifest.json'}}},
+    })
+
+    ret = check_status.lambda_handler(load_event('evaluation-job-state-change.json'), None)
+
+    assert json.loads(ret['body'])['members'] == {'r1/model1': 'Completed', 'r2/model1': 'Completed'}
+    assert [s['taskToken'] for s in check_status.stepfunctions.successes] == ['token-1', 'token-2']
+    r1 = run_item(check_status, 'MODEL#model1')
+    r2 = check_status.dynamodb.get_item(TableName='ModelResultTable', Key={'RunID': {'S': 'r2'}, 'SK': {'S': 'MODEL#model1'}})['Item']
+    assert (r1['Records'], r1['Accuracy']) == ({'N': '1'}, {'N': '0.4'})
+    assert r2['Records'] == {'N': '2'}
+    assert float(r2['Accuracy']['N']) == pytest.approx(0.6)
+    assert check_status.dynamodb.get_item(TableName='JobCallbackTable', Key={'JobArn': {'S': JOB_ARN}}) == {}
+
+
+def test_polling_a_coalesced_job_only_counts_own_records(check_status):
+    mine = {'prompt': 'ctx', 'referenceResponse': 'a summary'}
+    other = {'prompt': 'other', 'referenceResponse': 'other summary'}
+    check_status.s3_client.objects = {
+        ('outputs-data-directory', RESULT_PREFIX + 'output.jsonl'): '\n'.join(
+            json.dumps({'inputRecord': record, 'automatedEvaluationResult': {'scores': [{'metricName': 'Accuracy', 'result': score}]}})
+            for record, score in [(other, 0.9), (mine, 0.3)]
+        ).encode('utf-8'),
+    }
+    item = run_item(check_status, 'MODEL#model1')
+    item['RecordKeys'] = {'L': [{'S': check_status.run_table.record_key(mine)}]}
+
+    ret = check_status.lambda_handler({'RunID': 'r1', 'Model': 'model1'}, None)
+
+    results = json.loads(ret['body'])['results']
+    assert results['Records'] == {'N': '1'}
+    assert results['Accuracy'] == {'N': '0.3'}
+
+
+
+def test_split_bulk_run_resumes_once_every_part_is_scored(check_status):
+    second_arn = JOB_ARN.replace('abcd1234efgh', 'ijkl5678mnop')
+    check_status.bedrock_client.jobs[second_arn] = {
+        **check_status.bedrock_client.jobs[JOB_ARN],
+        'jobName': 'summ-eval-ijkl5678',
+    }
+    for job_name, job_id, score in [('summ-eval-abcd1234', 'abcd1234efgh', 0.2), ('summ-eval-ijkl5678', 'ijkl5678mnop', 0.6)]:
+        prefix = f"r1_model1/{job_name}/{job_id}/models/{MODEL_ID}/taskTypes/Summarization/datasets/CustomDataset/"
+        check_status.s3_client.objects[('outputs-data-directory', prefix + 'output.jsonl')] = json.dumps({
+            'inputRecord': {'prompt': job_id, 'referenceResponse': f'summary {job_id}'},
+            'automatedEvaluationResult': {'scores': [{'metricName': 'Accuracy', 'result': score}]},
+        }).encode('utf-8')
+    item = run_item(check_status, 'MODEL#model1')
+    del item['ARN']
+    item.update(Parts={'N': '2'}, PartJobs={'M': {'0': {'S': JOB_ARN}, '1': {'S': second_arn}}}, PartResults={'M': {}})
+    check_status.dynamodb.get_item(TableName='JobCallbackTable', Key={'JobArn': {'S': JOB_ARN}})['Item']['Part'] = {'N': '0'}
+    check_status.dynamodb.seed('JobCallbackTable', {
+        'JobArn': {'S': second_arn}, 'RunID': {'S': 'r1'}, 'Model': {'S': 'model1'}, 'TaskToken': {'S': 'token-1'}, 'Part': {'N': '1'},
+    })
+    event = load_event('evaluation-job-state-change.json')
+
+    first = check_status.lambda_handler(event, None)
+    check_status.lambda_handler(event, None)
+
+    assert json.loads(first['body'])['status'] == 'In Progress'
+    assert check_status.stepfunctions.successes == []
+
+    event['detail']['jobArn'] = second_arn
+    ret = check_status.lambda_handler(event, None)
+
+    results = json.loads(ret['body'])['results']
+    assert results['Records'] == {'N': '2'}
+    assert float(results['Accuracy']['N']) == pytest.approx(0.4)
+    [success] = check_status.stepfunctions.successes
+    assert success['taskToken'] == 'token-1'
+    records = sorted(key[1] for key in check_status.dynamodb.tables['ModelResultTable'] if key[1].startswith('RECORD#'))
+    assert records == ['RECORD#model1#0000#0000#00000001', 'RECORD#model1#0001#0000#00000001']
+
+
+
+def test_poll_reports_parts_waiting_for_admission_as_in_progress(check_status):
+    item = run_item(check_status, 'MODEL#model1')
+    del item['ARN']
+    item.update(Parts={'N': '3'}, PartJobs={'M': {'0': {'S': JOB_ARN}}}, PartResults={'M': {'0': {'S': '{}'}}})
+
+    ret = check_status.lambda_handler({'RunID': 'r1', 'Model': 'model1'}, None)
+
+    body = json.loads(ret['body'])
+    assert ret['statusCode'] == 200
+    assert (body['status'], body['pendingParts']) == ('In Progress', 2)
+
+
+def test_finished_job_frees_its_admission_slot_once(check_status, monkeypatch):
+    admission = check_status.admission
+    monkeypatch.setattr(admission, 'dynamodb', FakeDynamoDBClient({'AdmissionTable': ['QueueKey', 'EntryKey']}))
+    monkeypatch.setattr(admission, 'ADMISSION_TABLE', 'AdmissionTable')
+    admission.acquire()
+    admission.hold(JOB_ARN)
+
+    check_status.lambda_handler(load_event('evaluation-job-state-change.json'), None)
+    check_status.lambda_handler({'RunID': 'r1', 'Model': 'model1'}, None)
+
+    assert admission.stats()['InFlight'] == 0
+    assert admission.holders() == []
@@ -0,0 +1,143 @@
+import json
+import statistics
+
+import pytest
+
+from .support import FakeDynamoDBClient, load_function, load_module
+
+STREAM_ARN = 'arn:aws:dynamodb:us-east-1:123456789012:table/ModelResultTable/stream/2024-05-01T00:00:00.000'
+
+
+@pytest.fixture()
+def leaderboard():
+    app = load_function('leaderboard')
+    app.dynamodb = FakeDynamoDBClient({'LeaderboardTable': ['ModelId', 'Category'], 'ModelResultTable': ['RunID', 'SK']})
+    app.cached_rows.update(ExpiresAt=0, Rows=[])
+    return app
+
+
+def completed(run_id, model_name, accuracy, category='news'):
+    before = {
+        'RunID': {'S': run_id},
+        'SK': {'S': 'MODEL#model1'},
+        'ModelName': {'S': model_name},
+        'Category': {'S': category},
+        'LocalMetrics': {'M': {'Rouge1': {'N': '0.3'}}},
+    }
+    after = {**before, 'Completed': {'BOOL': True}, 'Accuracy': {'N': str(accuracy)}, 'Toxicity': {'NULL': True}}
+    return {
+        'eventName': 'MODIFY',
+        'eventSourceARN': STREAM_ARN,
+        'dynamodb': {'NewImage': after, 'OldImage': before, 'SequenceNumber': f"{run_id}-{model_name}"}
+    }
+
+
+def deliver(leaderboard, records):
+    # The source items exist in the run table by the time their stream records arrive
+    for record in records:
+        leaderboard.dynamodb.seed('ModelResultTable', dict(record['dynamodb']['NewImage']))
+    return leaderboard.lambda_handler({'Records': records}, None)
+
+
+def row(leaderboard, model_id, category):
+    key = {'ModelId': {'S': model_id}, 'Category': {'S': category}}
+    return leaderboard.dynamodb.get_item(TableName='LeaderboardTable', Key=key)['Item']
+
+
+def test_merged_accumulators_match_direct_statistics():
+    accumulator = load_module('leaderboard', 'accumulator')
+    values = [0.2, 0.9, 0.4, 0.7, 0.1, 0.65]
+
+    left = right = accumulator.EMPTY
+    for value in values[:2]:
+        left = accumulator.add(left, value)
+    for value in values[2:]:
+        right = accumulator.add(right, value)
+    summary = accumulator.summarize(accumulator.merge(left, right))
+
+    assert summary['Count'] == 6
+    assert summary['Mean'] == pytest.approx(statistics.mean(values))
+    assert summary['Variance'] == pytest.approx(statistics.variance(values))
+    assert (summary['Min'], summary['Max']) == (0.1, 0.9)
+
+
+def test_stream_batch_updates_category_and_overall_rows(leaderboard):
+    records = [completed('r1', 'claude', 0.5), completed('r2', 'claude', 0.7, category='legal')]
+
+    deliver(leaderboard, records)
+
+    overall = leaderboard.decode_metrics(row(leaderboard, 'claude', '*'))
+    assert overall['Accuracy']['Count'] == 2
+    assert overall['Accuracy']['Mean'] == pytest.approx(0.6)
+    assert overall['Rouge1']['Count'] == 2
+    assert 'Toxicity' not in overall
+    assert leaderboard.decode_metrics(row(leaderboard, 'claude', 'news'))['Accuracy']['Count'] == 1
+
+
+def test_unfinished_results_are_not_counted(leaderboard):
+    record = completed('r1', 'claude', 0.5)
+    record['dynamodb']['OldImage'] = record['dynamodb']['NewImage']
+
+    ret = deliver(leaderboard, [record])
+
+    assert ret == {'batchItemFailures': []}
+    assert leaderboard.dynamodb.tables['LeaderboardTable'] == {}
+
+
+def test_redelivered_batch_is_counted_once(leaderboard):
+    records = [completed('r1', 'claude', 0.5), completed('r2', 'claude', 0.7)]
+    deliver(leaderboard, records)
+
+    # A retried batch replays records whose rows and markers already landed
+    ret = leaderboard.lambda_handler({'Records': records}, None)
+
+    assert ret == {'batchItemFailures': []}
+    assert leaderboard.decode_metrics(row(leaderboard, 'claude', '*'))['Accuracy']['Count'] == 2
+    assert leaderboard.dynamodb.tables['ModelResultTable'][('r1', 'MODEL#model1')]['LeaderboardApplied'] == {'SS': ['Completed']}
+
+
+def test_failed_batch_reports_its_records_for_retry(leaderboard, monkeypatch):
+    monkeypatch.setattr(leaderboard, 'MAX_TRANSACTION_ITEMS', 3)
+    records = [completed('r1', 'claude', 0.5), completed('r2', 'titan', 0.7)]
+
+    def transact_write_items(**kwargs):
+        raise leaderboard.ClientError({'Error': {'Code': 'InternalServerError', 'Message': 'boom'}}, 'TransactWriteItems')
+
+    monkeypatch.setattr(leaderboard.dynamodb, 'transact_write_items', transact_write_items)
+    ret = deliver(leaderboard, records)
+
+    assert ret == {'batchItemFailures': [{'itemIdentifier': 'r1-claude'}, {'itemIdentifier': 'r2-titan'}]}
+
+
+def test_concurrent_writer_is_merged_not_overwritten(leaderboard, monkeypatch):
+    deliver(leaderboard, [completed('r1', 'claude', 0.5)])
+    original_get_item = leaderboard.dynamodb.get_item
+    raced = []
+
+    def get_item(**kwargs):
+        response = original_get_item(**kwargs)
+        if not raced:
+            # Another container lands its batch between our read and our write
+            raced.append(True)
+            deliver(leaderboard, [completed('r2', 'claude', 0.9)])
+        return response
+
+    monkeypatch.setattr(leaderboard.dynamodb, 'get_item', get_item)
+    deliver(leaderboard, [completed('r3', 'claude', 0.1)])
+
+    item = row(leaderboard, 'claude', 'news')
+    assert leaderboard.decode_metrics(item)['Accuracy']['Count'] == 3
+    assert item['Version'] == {'N': '3'}
+
+
+def test_get_ranks_by_metric_and_serves_from_cache(leaderboard):
+    deliver(leaderboard, [completed('r1', 'claude', 0.5), completed('r2', 'titan', 0.8)])
+
+    ret = leaderboard.lambda_handler({'queryStringParameters': {'category': '*'}}, None)
+    body = json.loads(ret['body'])
+    assert [item['ModelId'] for item in body['Items']] == ['titan', 'claude']
+    assert ret['headers']['Cache-Control'].startswith('max-age=')
+
+    deliver(leaderboard, [completed('r3', 'claude', 1.0)])
+    cached = json.loads(leaderboard.lambda_handler({'queryStringParameters': {'category': '*'}}, None)['body'])
+    assert cached == body
@@ -0,0 +1,58 @@
+import random
+
+import numpy as np
+import pytest
+
+from .support import load_module
+
+metrics = load_module('model', 'metrics')
+
+
+def lcs_reference(a, b):
+    table = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i, x in enumerate(a):
+        for j, y in enumerate(b):
+            table[i + 1][j + 1] = table[i][j] + 1 if x == y else max(table[i][j + 1], table[i + 1][j])
+    return table[-1][-1]
+
+
+def test_bit_parallel_lcs_matches_dynamic_programming():
+    rng = random.Random(7)
+    for _ in range(200):
+        a = np.array([rng.randint(0, 6) for _ in range(rng.randint(0, 40))], dtype=np.int64)
+        b = np.array([rng.randint(0, 6) for _ in range(rng.randint(0, 40))], dtype=np.int64)
+        assert metrics.lcs_length(a, b) == lcs_reference(a.tolist(), b.tolist())
+
+
+def test_scores_against_source_and_reference():
+    scores = metrics.score_summary(
+        'The cat sat on the mat.',
+        'The cat sat on the mat today, and the dog ran!',
+        'A cat sat on a mat',
+    )
+
+    # 6 summary tokens, 11 source tokens, all 6 clipped unigram matches
+    assert scores['Rouge1'] == pytest.approx(2 * 1.0 * (6 / 11) / (1.0 + 6 / 11), abs=1e-4)
+    assert scores['RougeL'] == scores['Rouge1']
+    assert scores['NovelUnigrams'] == 0.0
+    assert scores['CompressionRatio'] == pytest.approx(6 / 11, abs=1e-4)
+    assert scores['SummaryLength'] == 6
+    assert scores['ReferenceRouge2'] == pytest.approx(0.4)
+
+
+def test_batch_scores_match_individual_scores():
+    summaries = ['alpha beta gamma', 'novel words only here', '']
+    sources = ['alpha beta gamma delta', 'the source text', 'anything']
+
+    batch = metrics.score_summaries(summaries, sources)
+
+    assert batch == [metrics.score_summary(s, src) for s, src in zip(summaries, sources)]
+    assert batch[1]['NovelUnigrams'] == 1.0
+    assert batch[2]['Rouge1'] == 0.0
+
+
+def test_mean_scores_skips_missing_metrics():
+    assert metrics.mean_scores([{'Rouge1': 0.2, 'ReferenceRouge1': 0.5}, {'Rouge1': 0.4}]) == {
+        'Rouge1': 0.3,
+        'ReferenceRouge1': 0.5,
+    }
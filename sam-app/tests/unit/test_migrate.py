@@ -0,0 +1,169 @@
+import json
+
+import pytest
+
+from .support import FakeDynamoDBClient, load_function
+
+
+class FakeScanClient(FakeDynamoDBClient):
+    """Adds parallel-segment scans, applying the schema-version filter in Python when one is given."""
+
+    def scan(self, TableName, Segment, TotalSegments, Limit, ExclusiveStartKey=None, FilterExpression=None, **kwargs):
+        keys = sorted(self.tables[TableName])
+        segment_keys = [key for index, key in enumerate(keys) if index % TotalSegments == Segment]
+        start = segment_keys.index(self._key(TableName, ExclusiveStartKey)) + 1 if ExclusiveStartKey else 0
+        page = segment_keys[start:start + Limit]
+        items = [
+            self.tables[TableName][key] for key in page
+            if not FilterExpression or (
+                self.tables[TableName][key]['SK']['S'].startswith('MODEL#')
+                and int(self.tables[TableName][key].get('SchemaVersion', {'N': '0'})['N']) < 2
+            )
+        ]
+        response = {'Items': items, 'ScannedCount': len(page)}
+        if start + Limit < len(segment_keys):
+            response['LastEvaluatedKey'] = {name: self.tables[TableName][page[-1]][name] for name in self.key_names[TableName]}
+        return response
+
+
+@pytest.fixture()
+def migrate():
+    app = load_function('migrate')
+    app.dynamodb = FakeScanClient({'ModelResultTable': ['RunID', 'SK']})
+    app.LEGACY_MODEL_RESULT_TABLE = None
+    app.LEGACY_RUN_STATUS_TABLE = None
+    for i in range(6):
+        app.dynamodb.seed('ModelResultTable', {
+            'RunID': {'S': f'r{i}'},
+            'SK': {'S': 'MODEL#model1'},
+            'Accuracy': {'S': '0.5'},
+            'Robustness': {'S': ''},
+            'Toxicity': {'S': f'0.{i}'},
+        })
+        app.dynamodb.seed('ModelResultTable', {'RunID': {'S': f'r{i}'}, 'SK': {'S': 'META'}})
+    return app
+
+
+def item(migrate, run_id):
+    return migrate.dynamodb.tables['ModelResultTable'][(run_id, 'MODEL#model1')]
+
+
+def test_string_scores_become_numbers_and_nulls(migrate):
+    ret = migrate.lambda_handler({'TotalSegments': 3}, None)
+
+    assert ret['Migrated'] == 6
+    assert ret['Done'] is True
+    migrated = item(migrate, 'r3')
+    assert migrated['Accuracy'] == {'N': '0.5'}
+    assert migrated['Robustness'] == {'NULL': True}
+    assert migrated['ToxicityScore'] == {'N': '0.3'}
+    assert migrated['SchemaVersion'] == {'N': '2'}
+    assert migrate.dynamodb.tables['ModelResultTable'][('r3', 'META')] == {'RunID': {'S': 'r3'}, 'SK': {'S': 'META'}}
+
+
+def test_migration_resumes_from_reported_start_keys(migrate, monkeypatch):
+    monkeypatch.setattr(migrate, 'PAGE_SIZE', 1)
+    first = migrate.lambda_handler({'TotalSegments': 2}, type('Context', (), {'get_remaining_time_in_millis': lambda self: 0})())
+
+    assert first['Done'] is False
+    second = migrate.lambda_handler(first, None)
+
+    assert second['Done'] is True
+    assert first['Migrated'] + second['Migrated'] == 6
+    assert migrate.lambda_handler({'TotalSegments': 2}, None)['Migrated'] == 0
+
+
+@pytest.fixture()
+def legacy(migrate):
+    migrate.dynamodb = FakeScanClient({
+        'ModelResultTable': ['RunID', 'SK'],
+        'LegacyModelResultTable': ['RunID'],
+        'LegacyRunStatusTable': ['RunID'],
+    })
+    migrate.LEGACY_MODEL_RESULT_TABLE = 'LegacyModelResultTable'
+    migrate.LEGACY_RUN_STATUS_TABLE = 'LegacyRunStatusTable'
+    # A run as the pre-split tables stored it: one row per run, a map per model plus a copy under the full name
+    scored = {
+        'ModelName': {'S': 'anthropic.claude-v2'},
+        'Summary': {'S': 'A short summary.'},
+        'Accuracy': {'S': '0.5'},
+        'Robustness': {'S': ''},
+        'Toxicity': {'S': '0.1'},
+        'Completed': {'BOOL': True},
+    }
+    migrate.dynamodb.seed('LegacyModelResultTable', {
+        'RunID': {'S': 'old'},
+        'Context': {'S': 'Some document'},
+        'ModelCount': {'N': '2'},
+        'CompletedCount': {'N': '1'},
+        'model1': {'M': scored},
+        'anthropic.claude-v2': {'M': scored},
+        'model2': {'M': {'ModelName': {'S': 'amazon.titan-text-express-v1'}, 'Summary': {'S': 'Pending.'}}},
+    })
+    migrate.dynamodb.seed('LegacyRunStatusTable', {'RunID': {'S': 'old'}, 'Status': {'S': 'Running'}})
+    return migrate
+
+
+def test_legacy_rows_are_copied_into_the_run_table(legacy):
+    ret = legacy.lambda_handler({'TotalSegments': 2}, None)
+
+    assert ret['Done'] is True
+    table = legacy.dynamodb.tables['ModelResultTable']
+    assert sorted(table) == [('old', 'META'), ('old', 'MODEL#model1'), ('old', 'MODEL#model2')]
+    meta = table[('old', 'META')]
+    assert meta['Status'] == {'S': 'Running'}
+    assert meta['Context'] == {'S': 'Some document'}
+    assert (meta['ModelCount'], meta['CompletedCount']) == ({'N': '2'}, {'N': '1'})
+    # Pre-ListIndex runs get a partition and the oldest possible creation time so listings still reach them
+    assert meta['ListPartition'] == {'S': 'RUN'}
+    assert meta['CreatedAt'] == {'S': legacy.LEGACY_CREATED_AT}
+    scored = table[('old', 'MODEL#model1')]
+    assert scored['Accuracy'] == {'N': '0.5'}
+    assert scored['Robustness'] == {'NULL': True}
+    assert scored['ToxicityScore'] == {'N': '0.1'}
+    assert scored['SchemaVersion'] == {'N': '2'}
+    assert table[('old', 'MODEL#model2')]['Summary'] == {'S': 'Pending.'}
+
+
+def test_backfill_never_overwrites_newer_run_table_items(legacy):
+    legacy.dynamodb.seed('ModelResultTable', {
+        'RunID': {'S': 'old'}, 'SK': {'S': 'MODEL#model2'}, 'Summary': {'S': 'Finished since.'},
+        'Completed': {'BOOL': True}, 'SchemaVersion': {'N': '2'},
+    })
+
+    legacy.lambda_handler({'TotalSegments': 1}, None)
+
+    assert legacy.dynamodb.tables['ModelResultTable'][('old', 'MODEL#model2')]['Summary'] == {'S': 'Finished since.'}
+    assert legacy.lambda_handler({'TotalSegments': 1}, None)['Migrated'] == 0
+
+
+def test_custom_resource_hands_unfinished_backfill_to_a_fresh_invocation(legacy, monkeypatch):
+    monkeypatch.setattr(legacy, 'PAGE_SIZE', 1)
+    invocations = []
+    responses = []
+    legacy.lambda_client = type('Lambda', (), {'invoke': lambda self, **kwargs: invocations.append(kwargs)})()
+    monkeypatch.setattr(legacy, 'respond', lambda event, status, reason='': responses.append(status))
+    event = {'RequestType': 'Create', 'ResponseURL': 'https://example.com', 'StackId': 's', 'RequestId': 'q', 'LogicalResourceId': 'RunTableBackfill'}
+    context = type('Context', (), {'get_remaining_time_in_millis': lambda self: 0, 'invoked_function_arn': 'arn:migrate'})()
+    legacy.dynamodb.seed('LegacyModelResultTable', {'RunID': {'S': 'older'}, 'Context': {'S': 'Another'}})
+
+    legacy.lambda_handler(event, context)
+
+    assert responses == [] and len(invocations) == 1
+    resumed = json.loads(invocations[0]['Payload'])
+    legacy.lambda_handler(resumed, None)
+
+    assert responses == ['SUCCESS']
+    assert ('older', 'META') in legacy.dynamodb.tables['ModelResultTable']
+
+
+def test_runs_from_before_list_index_join_the_listing(legacy):
+    # Pre-ListIndex status rows carried nothing but the run and its status
+    legacy.dynamodb.seed('LegacyRunStatusTable', {'RunID': {'S': 'ancient'}, 'Status': {'S': 'Completed'}})
+
+    legacy.lambda_handler({'TotalSegments': 1}, None)
+
+    meta = legacy.dynamodb.tables['ModelResultTable'][('ancient', 'META')]
+    assert meta['ListPartition'] == {'S': 'RUN'}
+    assert meta['CreatedAt'] == meta['UpdatedAt'] == {'S': legacy.LEGACY_CREATED_AT}
+    assert meta['Status'] == {'S': 'Completed'}
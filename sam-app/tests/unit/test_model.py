@@ -0,0 +1,650 @@
+import json
+
+import pytest
+
+from .support import (
+    FakeBedrockJobClient,
+    FakeBedrockRuntimeClient,
+    FakeDynamoDBClient,
+    FakeDynamoDBResource,
+    FakeS3Client,
+    FakeStepFunctionsClient,
+    load_function,
+)
+
+CLAUDE = 'anthropic.claude-3-haiku-20240307-v1:0'
+
+
+@pytest.fixture()
+def model():
+    app = load_function('model')
+    resource = FakeDynamoDBResource({'JobCallbackTable': 'JobArn', 'GenerationCacheTable': 'CacheKey'})
+    app.dynamodb = resource
+    app.generation_cache = app.cache.GenerationCache(resource.Table('GenerationCacheTable'))
+    app.model_result_table = resource.Table('ModelResultTable')
+    app.s3_client = FakeS3Client()
+    app.context_store.s3_client = app.s3_client
+    app.context_store.load.cache_clear()
+    app.bedrock_runtime = FakeBedrockRuntimeClient({
+        CLAUDE: {'content': [{'text': 'a short summary'}]},
+    })
+    app.bedrock_client = FakeBedrockJobClient()
+    app.stepfunctions = FakeStepFunctionsClient()
+    return app
+
+
+def map_item_event(**overrides):
+    event = {
+        'RunID': 'r1',
+        'Context': 'a long document',
+        'Category': 'news',
+        'ModelParams': {},
+        'ModelId': CLAUDE,
+        'ModelKey': 'model2',
+        'ModelCount': 4,
+        'TaskToken': 'token-2',
+    }
+    event.update(overrides)
+    return event
+
+
+def model_item(model, model_key='model2', run_id='r1'):
+    return model.model_result_table.items[(run_id, f"MODEL#{model_key}")]
+
+
+def run_writes(model):
+    # Status updates hit the META item too; the run write is the one carrying the context
+    return [c[1] for c in model.model_result_table.calls if c[0] == 'update_item' and ':context' in c[1]['ExpressionAttributeValues']]
+
+
+def test_map_item_creates_job_and_parks_token(model):
+    ret = model.lambda_handler(map_item_event(), None)
+
+    body = json.loads(ret['body'])
+    assert ret['statusCode'] == 200
+    assert body['Model'] == 'model2'
+    assert model.s3_client.objects[('input-datas-directory', 'r1_model2.jsonl')]
+    [update] = run_writes(model)
+    assert update['Key'] == {'RunID': 'r1', 'SK': 'META'}
+    assert update['ExpressionAttributeValues'][':count'] == 4
+    assert model_item(model)['ARN'] == body['jobArn']
+    callback = model.dynamodb.Table('JobCallbackTable').items[body['jobArn']]
+    assert callback['TaskToken'] == 'token-2'
+    assert callback['Model'] == 'model2'
+
+
+def test_model_params_do_not_leak_between_invocations(model):
+    model.lambda_handler(map_item_event(ModelParams={'max_tokens': 64}), None)
+    model.lambda_handler(map_item_event(), None)
+
+    first, second = model.bedrock_runtime.invocations
+    assert first['body']['max_tokens'] == 64
+    assert second['body']['max_tokens'] == model.MODEL_PARAMS['max_tokens']
+
+
+def test_failure_releases_waiting_branch(model):
+    ret = model.lambda_handler(map_item_event(ModelId='unknown.model-v1'), None)
+
+    assert ret['statusCode'] == 500
+    [failure] = model.stepfunctions.failures
+    assert failure['taskToken'] == 'token-2'
+
+
+def test_shard_writes_one_part_per_model(model):
+    model.bedrock_runtime.responses['amazon.titan-text-express-v1'] = {'results': [{'outputText': 'titan summary'}]}
+    event = {
+        'Items': [{'Context': 'doc one'}, {'Context': 'doc two', 'category': 'legal'}],
+        'BatchInput': {'RunID': 'bulk1', 'Models': [CLAUDE, 'amazon.titan-text-express-v1'], 'Category': 'news'},
+    }
+
+    ret = model.lambda_handler(event, None)
+
+    assert ret['Documents'] == 2
+    parts = {key: body for (_, key), body in model.s3_client.objects.items()}
+    model1_part = parts[f"bulk1/model1/shards/{ret['ShardID']}.jsonl"].decode('utf-8').splitlines()
+    model2_part = parts[f"bulk1/model2/shards/{ret['ShardID']}.jsonl"].decode('utf-8').splitlines()
+    assert [json.loads(line)['prompt'] for line in model1_part] == ['doc one', 'doc two']
+    assert [json.loads(line)['category'] for line in model1_part] == ['news', 'legal']
+    assert {json.loads(line)['referenceResponse'] for line in model2_part} == {'titan summary'}
+    metrics_part = parts[f"bulk1/model2/metrics/{ret['ShardID']}.jsonl"].decode('utf-8').splitlines()
+    assert len(metrics_part) == 2
+
+
+def test_bulk_branch_evaluates_assembled_dataset(model):
+    for shard in ('a', 'b'):
+        model.s3_client.put_object(
+            Bucket='input-datas-directory',
+            Key=f"bulk1/model1/shards/{shard}.jsonl",
+            Body='{"prompt": "x"}\n{"prompt": "y"}\n',
+        )
+        model.s3_client.put_object(
+            Bucket='input-datas-directory',
+            Key=f"bulk1/model1/metrics/{shard}.jsonl",
+            Body='{"Rouge1": 0.2}\n{"Rouge1": 0.4}\n',
+        )
+
+    ret = model.lambda_handler(map_item_event(
+        RunID='bulk1', ModelKey='model1', Bulk=True,
+        Dataset={'Bucket': 'corpus', 'Key': 'docs.jsonl'},
+    ), None)
+
+    assert ret['statusCode'] == 200
+    assembled = model.s3_client.objects[('input-datas-directory', 'bulk1_model1.jsonl')]
+    assert assembled.count(b'\n') == 4
+    [job] = model.bedrock_client.created
+    dataset = job['evaluationConfig']['automated']['datasetMetricConfigs'][0]['dataset']
+    assert dataset['datasetLocation']['s3Uri'] == 's3://input-datas-directory/bulk1_model1.jsonl'
+    assert model.bedrock_runtime.invocations == []
+    item = model_item(model, 'model1', 'bulk1')
+    assert item['Documents'] == 4
+    assert float(item['LocalMetrics']['Rouge1']) == pytest.approx(0.3)
+
+
+def test_bulk_branch_sums_usage_across_documents(model):
+    model.s3_client.put_object(Bucket='input-datas-directory', Key='bulk1/model1/shards/a.jsonl', Body='{"prompt": "x"}\n')
+    model.s3_client.put_object(
+        Bucket='input-datas-directory',
+        Key='bulk1/model1/metrics/a.jsonl',
+        Body=(
+            '{"Rouge1": 0.2, "Usage": {"Calls": 1, "InputTokens": 40, "OutputTokens": 8, "StopReasons": {"end_turn": 1}}}\n'
+            '{"Rouge1": 0.4, "Usage": {"Calls": 2, "InputTokens": 60, "OutputTokens": 12, "StopReasons": {"max_tokens": 2}}}\n'
+        ),
+    )
+
+    model.lambda_handler(map_item_event(RunID='bulk1', ModelKey='model1', Bulk=True, Dataset={'Bucket': 'corpus', 'Key': 'docs.jsonl'}), None)
+
+    item = model_item(model, 'model1', 'bulk1')
+    assert float(item['LocalMetrics']['Rouge1']) == pytest.approx(0.3)
+    assert item['Usage']['Calls'] == 3
+    assert item['Usage']['InputTokens'] == 100
+    assert item['Usage']['StopReasons'] == {'end_turn': 1, 'max_tokens': 2}
+
+
+def test_precomputed_mode_submits_generated_summary_for_scoring_only(model):
+    model.lambda_handler(map_item_event(EvaluationMode='precomputed'), None)
+
+    [job] = model.bedrock_client.created
+    [model_config] = job['inferenceConfig']['models']
+    source_id = model_config['precomputedInferenceSource']['inferenceSourceIdentifier']
+    assert 'bedrockModel' not in model_config
+    assert 'Builtin.Accuracy' not in job['evaluationConfig']['automated']['datasetMetricConfigs'][0]['metricNames']
+    record = json.loads(model.s3_client.objects[('input-datas-directory', 'r1_model2.jsonl')])
+    assert record['modelResponses'] == [{'response': 'a short summary', 'modelIdentifier': source_id}]
+    assert 'referenceResponse' not in record
+
+
+def test_precomputed_mode_keeps_accuracy_when_reference_given(model):
+    model.lambda_handler(map_item_event(EvaluationMode='precomputed', Reference='gold summary'), None)
+
+    [job] = model.bedrock_client.created
+    assert 'Builtin.Accuracy' in job['evaluationConfig']['automated']['datasetMetricConfigs'][0]['metricNames']
+    record = json.loads(model.s3_client.objects[('input-datas-directory', 'r1_model2.jsonl')])
+    assert record['referenceResponse'] == 'gold summary'
+
+
+def test_local_mode_scores_in_process_and_skips_bedrock_job(model):
+    ret = model.lambda_handler(map_item_event(EvaluationMode='local'), None)
+
+    assert model.bedrock_client.created == []
+    [success] = model.stepfunctions.successes
+    assert json.loads(json.loads(success['output'])['body'])['status'] == 'Completed'
+    model_data = model_item(model)
+    assert model_data['Summary'] == 'a short summary'
+    assert set(model_data['LocalMetrics']) >= {'Rouge1', 'Rouge2', 'RougeL', 'CompressionRatio', 'NovelBigrams'}
+    assert json.loads(ret['body'])['results'] == {k: float(v) for k, v in model_data['LocalMetrics'].items()}
+
+
+def test_repeated_context_is_served_from_generation_cache(model):
+    model.lambda_handler(map_item_event(), None)
+    ret = model.lambda_handler(map_item_event(RunID='r2'), None)
+
+    assert len(model.bedrock_runtime.invocations) == 1
+    assert json.loads(ret['body'])['cache']['memory_hits'] >= 1
+    assert model_item(model, run_id='r2')['Summary'] == 'a short summary'
+
+
+def test_use_cache_false_always_invokes_model(model):
+    model.lambda_handler(map_item_event(), None)
+    model.lambda_handler(map_item_event(RunID='r2', UseCache=False), None)
+
+    assert len(model.bedrock_runtime.invocations) == 2
+
+
+def test_completed_evaluation_job_is_reused_for_identical_dataset(model):
+    model.bedrock_client.status = 'Completed'
+    first = json.loads(model.lambda_handler(map_item_event(), None)['body'])
+    model.stepfunctions.successes.clear()
+
+    ret = model.lambda_handler(map_item_event(TaskToken='token-3'), None)
+
+    assert len(model.bedrock_client.created) == 1
+    [success] = model.stepfunctions.successes
+    body = json.loads(json.loads(success['output'])['body'])
+    assert body == {'status': 'Cached', 'RunID': 'r1', 'Model': 'model2', 'jobArn': first['jobArn']}
+    assert json.loads(ret['body'])['status'] == 'Cached'
+
+
+def test_running_evaluation_job_is_not_reused(model):
+    model.lambda_handler(map_item_event(), None)
+    model.lambda_handler(map_item_event(), None)
+
+    assert len(model.bedrock_client.created) == 2
+
+
+def test_long_document_is_chunked_and_reduced(model):
+    model.bedrock_runtime.responses['amazon.titan-text-express-v1'] = {'results': [{'outputText': 'titan summary'}]}
+    document = "\n\n".join(f"Section {i} explains one idea in detail." for i in range(40))
+    chunking = {'Enabled': True, 'ChunkTokens': 250}
+
+    model.lambda_handler(map_item_event(Context=document, Chunking=chunking), None)
+    chunk_calls = len(model.bedrock_runtime.invocations) - 1
+    assert chunk_calls > 1
+
+    model.lambda_handler(map_item_event(
+        Context=document, Chunking={**chunking, 'ReduceModel': 'amazon.titan-text-express-v1'}
+    ), None)
+
+    # The map step is served from cache; only the new reduce model is invoked
+    new_calls = model.bedrock_runtime.invocations[chunk_calls + 1:]
+    assert {call['modelId'] for call in new_calls} == {'amazon.titan-text-express-v1'}
+    assert model_item(model)['Summary'] == 'titan summary'
+
+
+def test_streaming_records_latency_on_model_record(model):
+    model.bedrock_runtime.responses[CLAUDE] = [
+        {'type': 'message_start'},
+        {'type': 'content_block_delta', 'delta': {'text': 'a short '}},
+        {'type': 'content_block_delta', 'delta': {'text': 'summary'}},
+        {'type': 'message_stop', 'amazon-bedrock-invocationMetrics': {'outputTokenCount': 3}},
+    ]
+
+    ret = model.lambda_handler(map_item_event(Streaming=True), None)
+
+    assert ret['statusCode'] == 200
+    [call] = model.bedrock_runtime.invocations
+    assert call['stream']
+    model_data = model_item(model)
+    assert model_data['Summary'] == 'a short summary'
+    assert model_data['Latency']['OutputTokens'] == 3
+    assert {'TimeToFirstTokenMs', 'InterTokenLatencyMs', 'OutputTokensPerSecond', 'TotalLatencyMs'} <= set(model_data['Latency'])
+
+
+def test_branch_records_token_usage_and_stop_reason(model):
+    model.bedrock_runtime.responses[CLAUDE]['stop_reason'] = 'end_turn'
+    model.bedrock_runtime.headers[CLAUDE] = {
+        'x-amzn-bedrock-input-token-count': '42',
+        'x-amzn-bedrock-output-token-count': '7',
+        'x-amzn-bedrock-invocation-latency': '350',
+    }
+
+    model.lambda_handler(map_item_event(), None)
+    model.lambda_handler(map_item_event(RunID='r2'), None)
+
+    usage = model_item(model)['Usage']
+    assert (usage['Calls'], usage['InputTokens'], usage['OutputTokens']) == (1, 42, 7)
+    assert usage['InvocationLatencyMs'] == 350
+    assert usage['StopReasons'] == {'end_turn': 1}
+    # The second run is served from the generation cache and costs no tokens
+    cached = model_item(model, run_id='r2')['Usage']
+    assert (cached['Calls'], cached['CachedCalls'], cached['InputTokens']) == (0, 1, 0)
+
+
+def test_stream_usage_comes_from_invocation_metrics(model):
+    model.bedrock_runtime.responses[CLAUDE] = [
+        {'type': 'content_block_delta', 'delta': {'text': 'summary'}},
+        {'type': 'message_delta', 'delta': {'stop_reason': 'max_tokens'}},
+        {'type': 'message_stop', 'amazon-bedrock-invocationMetrics': {'inputTokenCount': 30, 'outputTokenCount': 5, 'invocationLatency': 120}},
+    ]
+
+    model.lambda_handler(map_item_event(Streaming=True), None)
+
+    usage = model_item(model)['Usage']
+    assert (usage['InputTokens'], usage['OutputTokens'], usage['InvocationLatencyMs']) == (30, 5, 120)
+    assert usage['StopReasons'] == {'max_tokens': 1}
+
+
+def test_stream_deltas_decode_per_family(model):
+    assert model.extract_stream_delta('amazon.titan-text-express-v1', {'outputText': 'x'}) == 'x'
+    assert model.extract_stream_delta('meta.llama3-8b-instruct-v1:0', {'generation': 'y'}) == 'y'
+    assert model.extract_stream_delta('mistral.mistral-7b-instruct-v0:2', {'outputs': [{'text': 'z'}]}) == 'z'
+    assert model.extract_stream_delta(CLAUDE, {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn'}}) == ''
+
+
+def test_fan_out_writes_one_item_per_model(model):
+    model.bedrock_runtime.responses['amazon.titan-text-express-v1'] = {'results': [{'outputText': 'titan summary'}]}
+
+    ret = model.lambda_handler({
+        'FanOut': True, 'RunID': 'r1', 'Context': 'a long document',
+        'Models': [CLAUDE, 'amazon.titan-text-express-v1'], 'Category': 'finance',
+    }, None)
+
+    assert ret['Failed'] == {}
+    assert ret['Generated'] == ['model1', 'model2']
+    assert model_item(model, 'model1')['ModelName'] == CLAUDE
+    assert model_item(model, 'model1')['Category'] == 'finance'
+    assert model_item(model, 'model2')['Summary'] == 'titan summary'
+    [update] = run_writes(model)
+    assert update['ExpressionAttributeValues'][':count'] == 2
+
+
+def test_fan_out_leaves_slow_models_to_their_branch(model, monkeypatch):
+    original = model.summarize_document
+
+    def slow_titan(model_id, *args):
+        if model_id.startswith('amazon.titan'):
+            model.time.sleep(0.5)
+        return original(model_id, *args)
+
+    model.bedrock_runtime.responses['amazon.titan-text-express-v1'] = {'results': [{'outputText': 'titan summary'}]}
+    monkeypatch.setattr(model, 'summarize_document', slow_titan)
+
+    ret = model.lambda_handler({
+        'FanOut': True, 'RunID': 'r1', 'Context': 'a long document',
+        'Models': [CLAUDE, 'amazon.titan-text-express-v1'],
+        'ModelTimeouts': {'amazon.titan-text-express-v1': 0.05},
+    }, None)
+
+    assert ret['Generated'] == ['model1']
+    assert 'Timed out' in ret['Failed']['model2']
+
+
+def test_branch_reuses_pregenerated_summary(model):
+    # GenerateAll left the summary on the branch's own item; only a count travels through the Map
+    model.model_result_table.items[('r1', 'MODEL#model2')] = {
+        'RunID': 'r1', 'SK': 'MODEL#model2', 'ModelName': CLAUDE, 'Summary': 'fanned out',
+        'Usage': {'InputTokens': model.Decimal('12')}, 'Latency': {'TotalLatencyMs': model.Decimal('80.5')},
+    }
+
+    model.lambda_handler(map_item_event(Pregenerated=2), None)
+
+    assert model.bedrock_runtime.invocations == []
+    assert model_item(model)['Summary'] == 'fanned out'
+
+
+def test_branch_rewrite_keeps_stream_markers(model):
+    model.model_result_table.items[('r1', 'MODEL#model2')] = {
+        'RunID': 'r1', 'SK': 'MODEL#model2', 'ModelName': CLAUDE, 'Summary': 'fanned out',
+        'EvaluationMode': 'local', 'LeaderboardApplied': {'Local'},
+    }
+
+    model.lambda_handler(map_item_event(Pregenerated=2, EvaluationMode='local'), None)
+
+    item = model_item(model)
+    assert item['LeaderboardApplied'] == {'Local'}
+    assert item['Category'] == 'news'
+
+
+def test_fan_out_with_no_models_generates_nothing(model):
+    ret = model.lambda_handler({'FanOut': True, 'RunID': 'r1', 'Context': 'a long document', 'Models': []}, None)
+
+    assert ret == {'RunID': 'r1', 'Generated': [], 'Failed': {}}
+
+
+def test_large_context_is_offloaded_to_a_pointer(model):
+    document = "A long paragraph about the quarterly results. " * 1000
+
+    offloaded = model.lambda_handler({'Offload': True, 'Context': document, 'ContextRef': {}}, None)
+    assert len(offloaded['Context']) < 300
+    assert offloaded['ContextRef']['Length'] == len(document)
+
+    model.lambda_handler(map_item_event(**offloaded), None)
+
+    [call] = model.bedrock_runtime.invocations
+    assert document in call['body']['messages'][0]['content']
+    [update] = run_writes(model)
+    assert update['ExpressionAttributeValues'][':context'] == offloaded['Context']
+    assert update['ExpressionAttributeValues'][':context_ref'] == offloaded['ContextRef']
+    record = json.loads(model.s3_client.objects[('input-datas-directory', 'r1_model2.jsonl')])
+    assert record['prompt'] == document
+
+
+def test_small_context_stays_inline(model):
+    offloaded = model.lambda_handler({'Offload': True, 'Context': 'short text', 'ContextRef': {}}, None)
+
+    assert offloaded == {'Context': 'short text', 'ContextRef': {}}
+
+
+def coalescing(model, window_seconds=0):
+    model.PENDING_EVALUATION_TABLE = 'PendingEvaluationTable'
+    model.COALESCE_WINDOW_SECONDS = window_seconds
+    model.dynamodb.key_names['PendingEvaluationTable'] = ('GroupKey', 'Member')
+    return model.dynamodb.Table('PendingEvaluationTable')
+
+
+def test_coalesce_queues_record_instead_of_starting_a_job(model):
+    pending = coalescing(model)
+
+    ret = model.lambda_handler(map_item_event(Coalesce=True), None)
+
+    assert json.loads(ret['body'])['status'] == 'Queued'
+    assert model.bedrock_client.created == []
+    assert 'ARN' not in model_item(model)
+    [queued] = pending.items.values()
+    assert queued['Member'] == 'r1#model2'
+    assert queued['TaskToken'] == 'token-2'
+
+
+def test_scheduled_coalescer_starts_one_job_for_queued_runs(model):
+    pending = coalescing(model)
+    model.lambda_handler(map_item_event(Coalesce=True), None)
+    model.lambda_handler(map_item_event(Coalesce=True, RunID='r2', TaskToken='token-3'), None)
+    model.lambda_handler(map_item_event(Coalesce=True, RunID='r3', Context='another document', TaskToken='token-4'), None)
+
+    ret = model.lambda_handler({'source': 'aws.events', 'detail-type': 'Scheduled Event'}, None)
+
+    [job] = ret['Jobs']
+    assert job['Members'] == 3
+    # r1 and r2 submitted the same record, so it is scored once
+    assert job['Records'] == 2
+    [created] = model.bedrock_client.created
+    dataset_uri = created['evaluationConfig']['automated']['datasetMetricConfigs'][0]['dataset']['datasetLocation']['s3Uri']
+    dataset_key = dataset_uri.split('input-datas-directory/')[1]
+    assert len(model.s3_client.objects[('input-datas-directory', dataset_key)].splitlines()) == 2
+    callback = model.dynamodb.Table('JobCallbackTable').items[job['JobArn']]
+    manifest = json.loads(model.s3_client.objects[('input-datas-directory', callback['Manifest']['Key'])])
+    assert [m['TaskToken'] for m in manifest['Members']] == ['token-2', 'token-3', 'token-4']
+    assert sorted(len(routes) for routes in manifest['Records'].values()) == [1, 2]
+    assert pending.items == {}
+
+
+def test_coalescer_waits_out_the_window(model):
+    coalescing(model, window_seconds=3600)
+    model.lambda_handler(map_item_event(Coalesce=True), None)
+
+    ret = model.lambda_handler({'source': 'aws.events'}, None)
+
+    assert ret['Jobs'] == []
+    assert model.bedrock_client.created == []
+
+
+def admitting(model, monkeypatch, slots):
+    client = FakeDynamoDBClient({'AdmissionTable': ['QueueKey', 'EntryKey']})
+    monkeypatch.setattr(model.admission, 'dynamodb', client)
+    monkeypatch.setattr(model.admission, 'ADMISSION_TABLE', 'AdmissionTable')
+    monkeypatch.setattr(model.admission, 'SLOT_LIMIT', slots)
+    return model.admission
+
+
+def test_branch_waits_for_a_free_evaluation_slot(model, monkeypatch):
+    admission = admitting(model, monkeypatch, slots=1)
+
+    first = model.lambda_handler(map_item_event(RunID='r1'), None)
+    second = model.lambda_handler(map_item_event(RunID='r2', TaskToken='token-3'), None)
+
+    assert 'jobArn' in json.loads(first['body'])
+    assert json.loads(second['body'])['status'] == 'Queued'
+    assert len(model.bedrock_client.created) == 1
+    assert model.stepfunctions.failures == []
+    stats = admission.stats()
+    assert stats['InFlight'] == 1
+    assert stats['Queues']['interactive']['Depth'] == 1
+
+
+def test_drain_admits_interactive_before_bulk_as_slots_free(model, monkeypatch):
+    admission = admitting(model, monkeypatch, slots=1)
+    running = model.lambda_handler(map_item_event(RunID='r1'), None)
+    admission.enqueue('bulk', 'r2#model2', {
+        'RunID': 'r2', 'Model': 'model2', 'ModelId': CLAUDE, 'ModelParams': {}, 'Precomputed': False,
+        'HasReference': False, 'S3Uri': 's3://input-datas-directory/r2_model2.jsonl', 'TaskToken': 'token-bulk',
+    })
+    model.lambda_handler(map_item_event(RunID='r3', TaskToken='token-3'), None)
+
+    assert model.lambda_handler({'source': 'aws.events'}, None)['Admitted'] == []
+
+    admission.release(json.loads(running['body'])['jobArn'])
+    ret = model.lambda_handler({'source': 'aws.events'}, None)
+
+    [admitted] = ret['Admitted']
+    assert admitted['RunID'] == 'r3'
+    assert model.dynamodb.Table('JobCallbackTable').items[admitted['JobArn']]['TaskToken'] == 'token-3'
+    queues = ret['Queue']['Queues']
+    assert (queues['interactive']['Depth'], queues['bulk']['Depth']) == (0, 1)
+    assert model.model_result_table.calls[-1][1]['ExpressionAttributeValues'][':arn'] == admitted['JobArn']
+
+
+def test_quota_push_back_queues_instead_of_failing_the_run(model, monkeypatch):
+    admission = admitting(model, monkeypatch, slots=5)
+    model.bedrock_client = FakeBedrockJobClient(quota=0)
+
+    ret = model.lambda_handler(map_item_event(), None)
+
+    assert json.loads(ret['body'])['status'] == 'Queued'
+    assert model.stepfunctions.failures == []
+    assert admission.stats()['InFlight'] == 0
+    assert [entry['Submission']['TaskToken'] for entry in admission.pending('interactive')] == ['token-2']
+
+
+def test_drain_reclaims_slots_of_jobs_that_already_finished(model, monkeypatch):
+    admission = admitting(model, monkeypatch, slots=1)
+    model.lambda_handler(map_item_event(RunID='r1'), None)
+    model.lambda_handler(map_item_event(RunID='r2', TaskToken='token-3'), None)
+    model.bedrock_client.status = 'Completed'
+
+    ret = model.lambda_handler({'source': 'aws.events'}, None)
+
+    assert [job['RunID'] for job in ret['Admitted']] == ['r2']
+    assert admission.stats()['InFlight'] == 1
+
+
+def test_fresh_submission_queues_behind_waiting_work_even_with_a_free_slot(model, monkeypatch):
+    admission = admitting(model, monkeypatch, slots=5)
+    admission.enqueue('interactive', 'r1#model2', {'RunID': 'r1'})
+
+    ret = model.lambda_handler(map_item_event(RunID='r2', TaskToken='token-3'), None)
+
+    assert json.loads(ret['body'])['status'] == 'Queued'
+    assert model.bedrock_client.created == []
+    assert [entry['Submission']['RunID'] for entry in admission.pending('interactive')] == ['r1', 'r2']
+
+
+def test_drain_skips_entries_another_drain_has_claimed(model, monkeypatch):
+    admission = admitting(model, monkeypatch, slots=5)
+    model.lambda_handler(map_item_event(RunID='r1', TaskToken='token-1'), None)
+    admission.enqueue('interactive', 'r2#model2', {
+        'RunID': 'r2', 'Model': 'model2', 'ModelId': CLAUDE, 'ModelParams': {}, 'Precomputed': False,
+        'HasReference': False, 'S3Uri': 's3://input-datas-directory/r2_model2.jsonl', 'TaskToken': 'token-2',
+    })
+    [entry] = admission.pending('interactive')
+    assert admission.claim(entry)
+
+    ret = model.lambda_handler({'source': 'aws.events'}, None)
+
+    assert ret['Admitted'] == []
+    assert len(model.bedrock_client.created) == 1
+
+
+def test_coalescer_failure_before_submission_strands_no_slot(model, monkeypatch):
+    admission = admitting(model, monkeypatch, slots=1)
+    pending = coalescing(model)
+    model.lambda_handler(map_item_event(Coalesce=True), None)
+
+    def unreadable(**kwargs):
+        raise model.ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'denied'}}, 'GetObject')
+    monkeypatch.setattr(model.s3_client, 'get_object', unreadable)
+
+    with pytest.raises(model.ClientError):
+        model.lambda_handler({'source': 'aws.events'}, None)
+
+    assert admission.stats()['InFlight'] == 0
+    [queued] = pending.items.values()
+    # The claim is handed back, so the next scheduled run can take the record again
+    assert 'LeasedUntil' not in queued
+
+
+def test_throttled_invocation_backs_off_instead_of_failing(model, monkeypatch):
+    responses = model.bedrock_runtime
+    throttled = []
+
+    def invoke_model(**kwargs):
+        if not throttled:
+            throttled.append(kwargs['modelId'])
+            raise model.ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'InvokeModel')
+        return responses.invoke_model(**kwargs)
+
+    monkeypatch.setattr(model, 'bedrock_runtime', type('Runtime', (), {'invoke_model': staticmethod(invoke_model)})())
+    monkeypatch.setattr(model.rate_limiter, 'sleep', lambda seconds: None)
+    backoffs = []
+    monkeypatch.setattr(model.random, 'uniform', lambda low, high: backoffs.append(high) or 0)
+
+    ret = model.lambda_handler(map_item_event(UseCache=False), None)
+
+    assert ret['statusCode'] == 200
+    assert throttled == [CLAUDE]
+    assert backoffs == [model.THROTTLE_BACKOFF_SECONDS]
+    assert model.rate_limiter.stats()['throttles'] == 1
+    assert model_item(model)['Summary'] == 'a short summary'
+
+
+def test_oversized_reservation_settles_against_what_was_taken(model, monkeypatch):
+    model.bedrock_runtime.headers[CLAUDE] = {'x-amzn-bedrock-input-token-count': '2', 'x-amzn-bedrock-output-token-count': '1'}
+    monkeypatch.setattr(model.rate_limiter, 'quotas', [(CLAUDE, 60, 60)])
+    settled = []
+    monkeypatch.setattr(model.rate_limiter, 'settle', lambda model_id, reserved, used: settled.append((reserved, used)))
+
+    model.lambda_handler(map_item_event(UseCache=False), None)
+
+    # The reservation was capped at the bucket's capacity, so only that much can be handed back
+    [(reserved, used)] = settled
+    assert reserved == model.rate_limiter.capacity(CLAUDE)[1]
+    assert used == 3
+
+
+def test_failed_invocation_hands_its_reservation_back(model, monkeypatch):
+    def invoke_model(**kwargs):
+        raise model.ClientError({'Error': {'Code': 'ValidationException', 'Message': 'bad request'}}, 'InvokeModel')
+
+    settled = []
+    monkeypatch.setattr(model.rate_limiter, 'settle', lambda model_id, reserved, used: settled.append((reserved, used)))
+
+    with pytest.raises(model.ClientError):
+        model.invoke_limited(invoke_model, CLAUDE, '{}', 50, lambda response, started: response)
+
+    assert settled == [(50, 0)]
+
+
+def test_bulk_dataset_over_job_limit_is_split_into_parts(model, monkeypatch):
+    monkeypatch.setattr(model, 'COALESCE_MAX_RECORDS', 3)
+    for shard in ('a', 'b'):
+        model.s3_client.put_object(
+            Bucket='input-datas-directory',
+            Key=f"bulk1/model1/shards/{shard}.jsonl",
+            Body='{"prompt": "x"}\n{"prompt": "y"}\n',
+        )
+
+    ret = model.lambda_handler(map_item_event(RunID='bulk1', ModelKey='model1', Bulk=True, Dataset={'Bucket': 'corpus', 'Key': 'docs.jsonl'}), None)
+
+    body = json.loads(ret['body'])
+    assert model.s3_client.objects[('input-datas-directory', 'bulk1_model1.jsonl')].count(b'\n') == 3
+    assert model.s3_client.objects[('input-datas-directory', 'bulk1_model1.part0001.jsonl')].count(b'\n') == 1
+    assert model.s3_client.uploads == {}
+    locations = [
+        job['evaluationConfig']['automated']['datasetMetricConfigs'][0]['dataset']['datasetLocation']['s3Uri']
+        for job in model.bedrock_client.created
+    ]
+    assert locations == ['s3://input-datas-directory/bulk1_model1.jsonl', 's3://input-datas-directory/bulk1_model1.part0001.jsonl']
+    item = model_item(model, 'model1', 'bulk1')
+    assert item['Parts'] == 2
+    assert item['PartJobs'] == body['partJobs']
+    assert 'ARN' not in item
+    callbacks = model.dynamodb.Table('JobCallbackTable').items
+    assert [callbacks[arn]['Part'] for arn in (body['partJobs']['0'], body['partJobs']['1'])] == [0, 1]
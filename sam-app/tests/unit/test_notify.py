@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from .support import FakeConnectionBroker, FakeDynamoDBClient, load_function
+
+MODEL_RESULT_ARN = 'arn:aws:dynamodb:us-east-1:123456789012:table/ModelResultTable/stream/2024-05-01T00:00:00.000'
+
+
+@pytest.fixture()
+def notify():
+    app = load_function('notify')
+    app.dynamodb = FakeDynamoDBClient({'ConnectionTable': ['ConnectionId']})
+    app.management_api = FakeConnectionBroker(gone={'closed-tab'})
+    return app
+
+
+def connect(notify, connection_id, run_id=None):
+    notify.lambda_handler({
+        'requestContext': {'routeKey': '$connect', 'connectionId': connection_id},
+        'queryStringParameters': {'runid': run_id} if run_id else None,
+    }, None)
+
+
+def stream_record(new_image, old_image=None):
+    return {
+        'eventName': 'MODIFY',
+        'eventSourceARN': MODEL_RESULT_ARN,
+        'dynamodb': {'NewImage': new_image, 'OldImage': old_image or {}},
+    }
+
+
+def test_model_completion_reaches_run_and_global_subscribers(notify):
+    connect(notify, 'run-tab', 'r1')
+    connect(notify, 'dashboard')
+    connect(notify, 'other-run', 'r2')
+    before = {'RunID': {'S': 'r1'}, 'SK': {'S': 'MODEL#model1'}, 'ModelName': {'S': 'claude'}}
+    after = {**before, 'Completed': {'BOOL': True}, 'Accuracy': {'S': '0.5'}}
+
+    notify.lambda_handler({'Records': [stream_record(after, before)]}, None)
+
+    [message] = notify.management_api.messages['run-tab']
+    assert message['type'] == 'model_completed'
+    assert message['Model'] == 'model1'
+    assert message['Scores']['Accuracy'] == '0.5'
+    assert notify.management_api.messages['dashboard'] == [message]
+    assert 'other-run' not in notify.management_api.messages
+
+
+def test_partial_scores_are_pushed_when_local_metrics_land(notify):
+    connect(notify, 'run-tab', 'r1')
+    after = {
+        'RunID': {'S': 'r1'},
+        'SK': {'S': 'MODEL#model2'},
+        'ModelName': {'S': 'titan'},
+        'LocalMetrics': {'M': {'Rouge1': {'N': '0.25'}}},
+    }
+
+    notify.lambda_handler({'Records': [stream_record(after)]}, None)
+
+    [message] = notify.management_api.messages['run-tab']
+    assert message == {'type': 'partial_scores', 'RunID': 'r1', 'Model': 'model2', 'ModelName': 'titan', 'LocalMetrics': {'Rouge1': 0.25}}
+
+
+def test_status_change_prunes_gone_connections(notify):
+    connect(notify, 'closed-tab', 'r1')
+    meta = {'RunID': {'S': 'r1'}, 'SK': {'S': 'META'}}
+    record = stream_record({**meta, 'Status': {'S': 'Completed'}}, {**meta, 'Status': {'S': 'Running'}})
+
+    ret = notify.lambda_handler({'Records': [record]}, None)
+
+    assert json.loads(ret['body'])['sent'] == 0
+    assert notify.dynamodb.tables['ConnectionTable'] == {}
+
+
+def test_completion_count_rides_on_status_messages(notify):
+    connect(notify, 'dashboard')
+    meta = {'RunID': {'S': 'r1'}, 'SK': {'S': 'META'}, 'Status': {'S': 'Running'}, 'ModelCount': {'N': '2'}}
+
+    notify.lambda_handler({'Records': [stream_record({**meta, 'CompletedCount': {'N': '1'}}, meta)]}, None)
+
+    [message] = notify.management_api.messages['dashboard']
+    assert message['type'] == 'status'
+    assert (message['CompletedCount'], message['ModelCount']) == (1, 2)
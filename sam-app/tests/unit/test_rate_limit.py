@@ -0,0 +1,110 @@
+import pytest
+
+from .support import FakeTable, load_module
+
+
+@pytest.fixture()
+def rate_limit():
+    return load_module('model', 'rate_limit')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def limiter(rate_limit, store=None, clock=None, rpm=60, tpm=6000):
+    clock = clock or FakeClock()
+    return rate_limit.RateLimiter(
+        store or rate_limit.LocalBucketStore(), quotas=[('model', rpm, tpm)], headroom=1.0, burst_seconds=60,
+        clock=clock, sleep=clock.sleep
+    )
+
+
+def test_burst_up_to_the_quota_then_waits_for_refill(rate_limit):
+    clock = FakeClock()
+    limits = limiter(rate_limit, clock=clock)
+
+    for _ in range(60):
+        limits.acquire('model', 10)
+    assert clock.slept == []
+
+    limits.acquire('model', 10)
+    assert clock.slept == [pytest.approx(1.0)]
+
+
+def test_sustained_rate_stays_under_quota(rate_limit):
+    clock = FakeClock()
+    limits = rate_limit.RateLimiter(
+        rate_limit.LocalBucketStore(), quotas=[('model', 6000, 60000)], clock=clock, sleep=clock.sleep
+    )
+    grants = []
+
+    for _ in range(3000):
+        limits.acquire('model', 50)
+        grants.append(clock.now)
+
+    # Tokens bind at 1200 calls a minute; no 60 second window, the opening burst included, reaches that
+    windows = [sum(1 for t in grants[i:] if t < grants[i] + 60) for i in range(0, len(grants), 50)]
+    assert max(windows) <= 1200
+    assert max(windows) >= 1200 * 0.9
+
+
+def test_settle_returns_unused_reservation(rate_limit):
+    clock = FakeClock()
+    limits = limiter(rate_limit, clock=clock)
+
+    limits.acquire('model', 6000)
+    limits.settle('model', 6000, 1000)
+    limits.acquire('model', 5000)
+
+    assert clock.slept == []
+
+
+def test_drain_makes_every_caller_back_off(rate_limit):
+    clock = FakeClock()
+    limits = limiter(rate_limit, clock=clock)
+
+    limits.drain('model')
+    limits.acquire('model', 1)
+
+    assert clock.slept == [pytest.approx(1.0)]
+    assert limits.stats()['throttles'] == 1
+
+
+def test_containers_share_buckets_through_the_table(rate_limit):
+    table = FakeTable('RateLimitTable', 'LimitKey')
+    clock = FakeClock()
+    first = limiter(rate_limit, rate_limit.DynamoDBBucketStore(table), clock)
+    second = limiter(rate_limit, rate_limit.DynamoDBBucketStore(table), clock)
+
+    for _ in range(60):
+        first.acquire('model', 1)
+    second.acquire('model', 1)
+
+    assert clock.slept == [pytest.approx(1.0)]
+    assert table.items['model']['Version'] == 61
+
+
+def test_unknown_models_fall_back_to_default_quota(rate_limit):
+    assert rate_limit.get_quota('vendor.unknown', rate_limit.load_quotas()) == rate_limit.DEFAULT_QUOTA
+    assert rate_limit.get_quota('anthropic.claude-3-haiku-20240307-v1:0', rate_limit.load_quotas()) == (1000, 2000000)
+
+
+def test_counters_are_exact_under_concurrent_acquires(rate_limit):
+    from concurrent.futures import ThreadPoolExecutor
+
+    limits = limiter(rate_limit, rpm=100000, tpm=1000000)
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(lambda _: limits.acquire('model', 1), range(2000)))
+
+    assert limits.stats()['acquired'] == 2000
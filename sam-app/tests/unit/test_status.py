@@ -0,0 +1,138 @@
+import json
+
+import pytest
+
+from .support import load_function
+
+
+class FakeListIndexClient:
+    """Answers ListIndex queries over a fixed set of runs, newest first."""
+
+    def __init__(self, items):
+        self.items = sorted(items, key=lambda item: item['CreatedAt']['S'], reverse=True)
+        self.queries = []
+
+    def query(self, IndexName, Limit, ExclusiveStartKey=None, **kwargs):
+        self.queries.append({'IndexName': IndexName, 'Limit': Limit, **kwargs})
+        start = 0
+        if ExclusiveStartKey:
+            start = next(i for i, item in enumerate(self.items) if item['RunID'] == ExclusiveStartKey['RunID']) + 1
+        page = self.items[start:start + Limit]
+        response = {'Items': page}
+        if start + Limit < len(self.items):
+            last = page[-1]
+            response['LastEvaluatedKey'] = {name: last[name] for name in ('RunID', 'SK', 'ListPartition', 'CreatedAt')}
+        return response
+
+
+@pytest.fixture()
+def status():
+    app = load_function('status')
+    app.dynamodb = FakeListIndexClient([
+        {
+            'RunID': {'S': f'r{i}'},
+            'SK': {'S': 'META'},
+            'Status': {'S': 'Completed'},
+            'ListPartition': {'S': 'RUN'},
+            'CreatedAt': {'S': f'2024-05-0{i}T00:00:00.000Z'},
+        }
+        for i in range(1, 6)
+    ])
+    return app
+
+
+def test_list_pages_newest_first_with_cursor(status):
+    first = json.loads(status.lambda_handler({'queryStringParameters': {'limit': '2'}}, None)['body'])
+    second = json.loads(status.lambda_handler({'queryStringParameters': {'limit': '2', 'cursor': first['NextCursor']}}, None)['body'])
+    last = json.loads(status.lambda_handler({'queryStringParameters': {'limit': '2', 'cursor': second['NextCursor']}}, None)['body'])
+
+    assert [item['RunID'] for item in first['Items']] == ['r5', 'r4']
+    assert [item['RunID'] for item in second['Items']] == ['r3', 'r2']
+    assert [item['RunID'] for item in last['Items']] == ['r1']
+    assert last['NextCursor'] is None
+    assert {query['IndexName'] for query in status.dynamodb.queries} == {'ListIndex'}
+
+
+def test_limit_is_capped(status):
+    status.lambda_handler({'queryStringParameters': {'limit': '100000'}}, None)
+
+    assert status.dynamodb.queries[0]['Limit'] == status.paging.MAX_LIMIT
+
+
+def test_bad_cursor_is_rejected(status):
+    ret = status.lambda_handler({'queryStringParameters': {'cursor': 'not-a-cursor'}}, None)
+
+    assert ret['statusCode'] == 400
+
+
+def test_since_returns_only_changed_runs_and_a_newer_token(status, monkeypatch):
+    changed = {
+        'RunID': {'S': 'r9'},
+        'Status': {'S': 'Failed'},
+        'ListPartition': {'S': 'RUN'},
+        'UpdatedAt': {'S': '2024-05-10T00:00:00.000Z'},
+    }
+
+    def query(IndexName, KeyConditionExpression, ExpressionAttributeValues, **kwargs):
+        status.dynamodb.queries.append({'IndexName': IndexName, **kwargs})
+        since = ExpressionAttributeValues[':since']['S']
+        return {'Items': [changed] if changed['UpdatedAt']['S'] > since else []}
+
+    listing = json.loads(status.lambda_handler({}, None)['body'])
+    monkeypatch.setattr(status.dynamodb, 'query', query)
+
+    token = status.encode_since(status.parse_timestamp('2024-05-09T00:00:00.000Z'))
+    delta = json.loads(status.lambda_handler({'queryStringParameters': {'since': token}}, None)['body'])
+
+    assert 'Since' in listing
+    assert [item['RunID'] for item in delta['Items']] == ['r9']
+    assert delta['HasMore'] is False
+    assert status.decode_sync_token(delta['Since'])[0] > status.parse_timestamp('2024-05-10T00:00:00.000Z')
+    assert status.dynamodb.queries[-1]['IndexName'] == 'UpdatedIndex'
+    assert status.dynamodb.queries[-1]['ScanIndexForward'] is True
+
+
+def test_since_pages_through_runs_sharing_one_timestamp(status, monkeypatch):
+    # Three runs changed in the same millisecond; a page of two must not lose the third
+    runs = [
+        {'RunID': {'S': f"r{n}"}, 'ListPartition': {'S': 'RUN'}, 'UpdatedAt': {'S': '2024-05-10T00:00:00.000Z'}}
+        for n in range(3)
+    ]
+
+    def query(IndexName, KeyConditionExpression, ExpressionAttributeValues, Limit, ExclusiveStartKey=None, **kwargs):
+        since = ExpressionAttributeValues[':since']['S']
+        matching = [run for run in runs if run['UpdatedAt']['S'] > since]
+        start = next(i + 1 for i, run in enumerate(matching) if run['RunID'] == ExclusiveStartKey['RunID']) if ExclusiveStartKey else 0
+        page = matching[start:start + Limit]
+        more = start + Limit < len(matching)
+        return {'Items': page, **({'LastEvaluatedKey': {'RunID': page[-1]['RunID']}} if more else {})}
+
+    monkeypatch.setattr(status.dynamodb, 'query', query)
+
+    seen = []
+    token = status.encode_since(status.parse_timestamp('2024-05-09T00:00:00.000Z'))
+    while True:
+        delta = json.loads(status.lambda_handler({'queryStringParameters': {'since': token, 'limit': '2'}}, None)['body'])
+        seen.extend(item['RunID'] for item in delta['Items'])
+        token = delta['Since']
+        if not delta['HasMore']:
+            break
+
+    assert seen == ['r0', 'r1', 'r2']
+
+
+def test_min_toxicity_queries_the_sparse_index(status, monkeypatch):
+    flagged = {'RunID': {'S': 'r7'}, 'SK': {'S': 'MODEL#model2'}, 'ModelName': {'S': 'titan'}, 'ToxicityScore': {'N': '0.4'}}
+
+    def query(IndexName, KeyConditionExpression, ExpressionAttributeValues, **kwargs):
+        status.dynamodb.queries.append({'IndexName': IndexName, 'Values': ExpressionAttributeValues, **kwargs})
+        return {'Items': [flagged]}
+
+    monkeypatch.setattr(status.dynamodb, 'query', query)
+    ret = json.loads(status.lambda_handler({'queryStringParameters': {'min_toxicity': '0.2'}}, None)['body'])
+
+    assert ret['Items'] == [{'RunID': 'r7', 'Model': 'model2', 'ModelName': 'titan', 'Toxicity': 0.4}]
+    [query_args] = status.dynamodb.queries
+    assert query_args['IndexName'] == 'ToxicityIndex'
+    assert query_args['Values'][':min_toxicity'] == {'N': '0.2'}
+    assert status.lambda_handler({'queryStringParameters': {'min_toxicity': 'high'}}, None)['statusCode'] == 400
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+import throttling
+import timing
+
+
+def emitted(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_disabled_spans_share_one_no_op(monkeypatch, capsys):
+    monkeypatch.setattr(timing, 'ENABLED', False)
+
+    with timing.span('invoke_model', 'anthropic.claude-3-haiku-20240307-v1:0') as span:
+        pass
+
+    assert span is None
+    assert timing.span('put_dataset') is timing.DISABLED
+    assert capsys.readouterr().out == ''
+
+
+def test_span_emits_embedded_metric_with_stage_model_and_outcome(monkeypatch, capsys):
+    monkeypatch.setattr(timing, 'ENABLED', True)
+
+    with timing.span('invoke_model', 'anthropic.claude-3-haiku-20240307-v1:0'):
+        pass
+
+    [line] = emitted(capsys)
+    [directive] = line['_aws']['CloudWatchMetrics']
+    assert directive['Dimensions'] == [['Function', 'Stage', 'Outcome', 'ModelId']]
+    assert directive['Metrics'] == [{'Name': 'Duration', 'Unit': 'Milliseconds'}]
+    assert (line['Stage'], line['Outcome'], line['ModelId']) == ('invoke_model', 'Success', 'anthropic.claude-3-haiku-20240307-v1:0')
+    assert line['Duration'] >= 0
+
+
+def test_span_records_failures_and_reraises(monkeypatch, capsys):
+    monkeypatch.setattr(timing, 'ENABLED', True)
+    throttled = ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'InvokeModel')
+
+    with pytest.raises(ClientError):
+        with timing.span('invoke_model'):
+            raise throttled
+    with pytest.raises(ValueError):
+        with timing.span('get_model_config'):
+            raise ValueError('unsupported')
+
+    throttle_line, error_line = emitted(capsys)
+    assert throttle_line['Outcome'] == 'Throttled'
+    assert 'ModelId' not in throttle_line
+    assert throttle_line['_aws']['CloudWatchMetrics'][0]['Dimensions'] == [['Function', 'Stage', 'Outcome']]
+    assert error_line['Outcome'] == 'Error'
+
+
+@pytest.mark.parametrize('code', throttling.THROTTLE_CODES)
+def test_every_shared_throttle_code_counts_as_throttled(code):
+    assert timing.outcome(ClientError({'Error': {'Code': code, 'Message': 'busy'}}, 'InvokeModel')) == 'Throttled'
+
+
+def test_gauge_emits_limits_per_model_only_when_enabled(monkeypatch, capsys):
+    monkeypatch.setattr(timing, 'ENABLED', False)
+    timing.gauge({'Limit': 4.0, 'InFlight': 1}, {'Stage': 'adaptive_concurrency', 'ModelId': 'meta.llama3-8b-instruct-v1:0'})
+    assert capsys.readouterr().out == ''
+
+    monkeypatch.setattr(timing, 'ENABLED', True)
+    timing.gauge({'Limit': 4.0, 'InFlight': 1}, {'Stage': 'adaptive_concurrency', 'ModelId': 'meta.llama3-8b-instruct-v1:0'})
+
+    [line] = emitted(capsys)
+    [directive] = line['_aws']['CloudWatchMetrics']
+    assert directive['Dimensions'] == [['Function', 'Stage', 'ModelId']]
+    assert [metric['Name'] for metric in directive['Metrics']] == ['Limit', 'InFlight']
+    assert (line['Limit'], line['InFlight']) == (4.0, 1)
@@ -60,7 +60,7 @@ const Dashboard = ({ modelGroups = {} }) => {
   const handleExecute = async () => {
     if (
       prompt &&
-      selectedModels.filter(Boolean).length === 3 &&
+      selectedModels.filter(Boolean).length >= 2 &&
       evaluationModel
     ) {
       setIsLoading(true);
@@ -69,9 +69,7 @@ const Dashboard = ({ modelGroups = {} }) => {
           `${process.env.REACT_APP_EXECUTEAPI}`,
           {
             Context: prompt,
-            Model1: selectedModels[0],
-            Model2: selectedModels[1],
-            Model3: selectedModels[2],
+            Models: selectedModels.filter(Boolean),
             eval_model: evaluationModel,
             RunID: `summary_${Math.random().toString(36).substr(2, 8)}`,
           },
@@ -92,7 +90,7 @@ const Dashboard = ({ modelGroups = {} }) => {
       }
     } else {
       alert(
-        "Please enter a prompt, select 3 models, and an evaluation model before executing."
+        "Please enter a prompt, select at least 2 models, and an evaluation model before executing."
       );
     }
   };
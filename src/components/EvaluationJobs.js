@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Link } from 'react-router-dom';
 import { CheckCircleIcon, ExclamationCircleIcon, XCircleIcon } from '@heroicons/react/24/solid';
 import axios from 'axios';
@@ -23,15 +23,64 @@ const StatusIcon = ({ status }) => {
 
 const EvaluationJobs = () => {
   const [jobs, setJobs] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const since = useRef(null);
 
   useEffect(() => {
     fetchJobs();
+    // Prefer pushed status changes; fall back to delta polling when no WebSocket endpoint is configured
+    if (process.env.REACT_APP_WEBSOCKET_URL) {
+      const socket = new WebSocket(process.env.REACT_APP_WEBSOCKET_URL);
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === 'status') mergeJobs([message]);
+      };
+      return () => socket.close();
+    }
+    const timer = setInterval(syncJobs, 15000);
+    return () => clearInterval(timer);
   }, []);
 
-  const fetchJobs = async () => {
+  const mergeJobs = (changedJobs) => {
+    setJobs(previous => {
+      const changed = new Map(changedJobs.map(job => [job.RunID, { ...previous.find(p => p.RunID === job.RunID), ...job }]));
+      const updated = previous.map(job => changed.get(job.RunID) || job);
+      const known = new Set(previous.map(job => job.RunID));
+      const added = changedJobs.filter(job => !known.has(job.RunID)).reverse();
+      return [...added, ...updated];
+    });
+  };
+
+  // Only runs whose status changed since the last poll come back; merge them into the list
+  const syncJobs = async () => {
+    if (since.current === null) return;
+    try {
+      let hasMore = true;
+      while (hasMore) {
+        const response = await axios.get(`${process.env.REACT_APP_STATUSAPI}`, {
+          withCredentials: false,
+          params: { since: since.current },
+        });
+        const delta = JSON.parse(response.data.body);
+        since.current = delta.Since;
+        hasMore = delta.HasMore;
+        if (delta.Items.length) mergeJobs(delta.Items);
+      }
+    } catch (error) {
+      console.error('Error syncing jobs:', error);
+    }
+  };
+
+  const fetchJobs = async (cursor = null) => {
     try {
-      const response = await axios.get(`${process.env.REACT_APP_STATUSAPI}`, { withCredentials: false });
-      setJobs(JSON.parse(response.data.body));
+      const response = await axios.get(`${process.env.REACT_APP_STATUSAPI}`, {
+        withCredentials: false,
+        params: { limit: 50, ...(cursor && { cursor }) },
+      });
+      const page = JSON.parse(response.data.body);
+      setJobs(previous => (cursor ? [...previous, ...page.Items] : page.Items));
+      setNextCursor(page.NextCursor);
+      if (!cursor) since.current = page.Since;
     } catch (error) {
       console.error('Error fetching jobs:', error);
     }
@@ -76,6 +125,16 @@ const EvaluationJobs = () => {
           </tbody>
         </table>
       </div>
+      {nextCursor && (
+        <div className="mt-4 text-center">
+          <button
+            onClick={() => fetchJobs(nextCursor)}
+            className="px-4 py-2 bg-blue-600 text-white rounded hover:bg-blue-700"
+          >
+            Load more
+          </button>
+        </div>
+      )}
     </div>
   );
 };
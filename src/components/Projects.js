@@ -45,15 +45,21 @@ const StatusIcon = ({ status }) => {
 
 const Projects = () => {
   const [projects, setProjects] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
 
   useEffect(() => {
     fetchProjects();
   }, []);
 
-  const fetchProjects = async () => {
+  const fetchProjects = async (cursor = null) => {
     try {
-      const response = await axios.get(`${process.env.REACT_APP_STATUSAPI}`, { withCredentials: false });
-      setProjects(JSON.parse(response.data.body));
+      const response = await axios.get(`${process.env.REACT_APP_STATUSAPI}`, {
+        withCredentials: false,
+        params: { limit: 50, ...(cursor && { cursor }) },
+      });
+      const page = JSON.parse(response.data.body);
+      setProjects((previous) => (cursor ? [...previous, ...page.Items] : page.Items));
+      setNextCursor(page.NextCursor);
     } catch (error) {
       console.error('Error fetching projects:', error);
     }
@@ -106,6 +112,16 @@ const Projects = () => {
           </tbody>
         </table>
       </div>
+      {nextCursor && (
+        <div className="mt-4 text-center">
+          <button
+            onClick={() => fetchProjects(nextCursor)}
+            className="px-4 py-2 bg-blue-600 text-white rounded hover:bg-blue-700"
+          >
+            Load more
+          </button>
+        </div>
+      )}
     </div>
   );
 };
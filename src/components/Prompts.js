@@ -11,7 +11,7 @@ const Prompts = () => {
   const fetchPrompts = async () => {
     try {
       const response = await axios.get(`${process.env.REACT_APP_PROMPTAPI}`);
-      setPrompts(JSON.parse(response.data.body));
+      setPrompts(JSON.parse(response.data.body).Items);
     } catch (error) {
       console.error('Error fetching prompts:', error);
     }
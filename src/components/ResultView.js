@@ -10,11 +10,19 @@ const ResultView = () => {
 
   useEffect(() => {
     fetchResult();
+    if (!process.env.REACT_APP_WEBSOCKET_URL) return undefined;
+    // Re-read the run as soon as a model's scores land instead of waiting for a manual refresh
+    const socket = new WebSocket(`${process.env.REACT_APP_WEBSOCKET_URL}?runid=${encodeURIComponent(runId)}`);
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === 'model_completed' || message.type === 'partial_scores') fetchResult(false);
+    };
+    return () => socket.close();
   }, [runId]);
 
-  const fetchResult = async () => {
+  const fetchResult = async (showLoading = true) => {
     try {
-      setLoading(true);
+      if (showLoading) setLoading(true);
       const response = await axios.post(
         `${process.env.REACT_APP_RESULTAPI}`,
         { RunID: runId },
@@ -58,7 +66,7 @@ const ResultView = () => {
         </div>
 
         <div className="grid grid-cols-1 md:grid-cols-3 gap-6">
-          {['model1', 'model2', 'model3'].map((modelKey) => {
+          {Object.keys(result).filter((key) => /^model\d+$/.test(key)).map((modelKey) => {
             const normalizedData = normalizeModelData(result[modelKey]);
             return (
               <div key={modelKey} className="bg-white rounded-lg shadow-md p-6">